@@ -0,0 +1,35 @@
+'''
+azrtools
+
+Helper package shared by the Azure2 processing scripts in this directory.
+The scripts themselves live next to this folder and import what they need from here.
+
+azrtools.api         - the whole toolkit in one namespace, for programs driving AZURE2 from one process
+azrtools.common      - units helper and the levels/segments/config dictionaries
+azrtools.azrfile     - in-memory .azr loader and writer (no temp-in.xml / temp-out.xml round trip)
+azrtools.leveltable  - <levels> block as NumPy columns with (E,J,pi), (E,J,pi,L,S) and (J,pi,L,S) indexes
+azrtools.levelpatch  - template .azr compiled once per scan, grid points are spliced into it
+azrtools.outfiles    - single-pass readers for parameters.out (lists or NumPy arrays), normalizations.out and chiSquared.out
+azrtools.runner      - runs AZURE2 in text mode, feeding the menu over stdin and waiting for it to exit
+azrtools.supervisor  - time limits (given or learned), process-group kill, fresh-output check and retries for AZURE2 runs
+azrtools.scanstate   - chisquared-output.dat written point by point, scan checkpoint for --resume
+azrtools.artifacts   - content-addressed store for the per-point files in chi2search_folder, with a manifest
+azrtools.snapshots   - lzma-compressed delta archive of parameters.out / param.sav against the first point
+azrtools.azureout    - memory-mapped AZUREOut_aa=*_R=*.out reader, binary archive of the curves by point and reaction
+azrtools.resultarray - scan results as a NumPy structured array (.npy + JSON sidecar), memory-mapped loader
+azrtools.resultcache - content-addressed AZURE2 result cache shared by scans and processes
+azrtools.sampling    - point generators: full grid (plain or serpentine), Sobol and Latin hypercube, over any number of parameters
+azrtools.adaptive    - coarse-to-fine refinement around the chi2 minimum and a delta-chi2 contour
+azrtools.minimize    - derivative-free minimizers (Nelder-Mead, golden section) for chi2 from AZURE2 runs
+azrtools.warmstart   - warm-started fits from the previous point's fitted parameters, nearest-neighbour ordering
+azrtools.transfer    - parameters2azr: fitted parameters and normalizations copied back into an .azr, one file or a batch
+azrtools.prettyprint - pretty_printer: tables of levels, normalizations and chi2 of a fit, or of many fits in one table
+azrtools.explore     - chi2explore: parameter catalog, scan definitions and running a whole scan
+azrtools.scanspec    - scans described in JSON/TOML specs (parameters selected by level), run back to back without prompts
+azrtools.workqueue   - a scan cut into point tasks in a shared directory, run by workers on any host and collected back
+azrtools.timing      - time spent per phase of every scan point (mean, p50, p95, max, CSV) and cProfile of a whole run
+azrtools.standin     - stand-in AZURE2 executable: same console menu, outputs from an analytic chi2 after a set delay
+azrtools.synthetic   - synthetic .azr files (levels, channels, segments and their data files) of any size
+azrtools.benchmark   - scan, parameters2azr and pretty_printer throughput on synthetic models, saved to compare runs
+azrtools.chi2scan    - per grid-point machinery used by chi2explore (patching, running AZURE2, collecting outputs)
+'''
@@ -0,0 +1,127 @@
+'''
+adaptive.py
+
+Coarse-to-fine chi2 scan.
+
+The scan lives on a fine lattice with (coarse_steps-1)*2**levels+1 points along each scanned parameter, but only the
+coarse sub-lattice (every 2**levels-th point) is run at first. A cell of the current lattice is then cut in half along
+every parameter when
+  - one of its corners is the lowest chi2 found so far, or
+  - its corners straddle the contour chi2_min + delta_chi2,
+and only the new points of the cut cells are run. This is repeated until the lattice spacing is that of the fine
+lattice. Points keep the index they have on the fine lattice, so results, the checkpoint and the cache work as
+for a full grid; the rows in chisquared-output.dat just have irregular spacing.
+'''
+
+import itertools
+
+import numpy as np
+
+
+class AdaptiveLattice(object):
+    '''
+    AdaptiveLattice(list ranges, list coarse_steps, int levels):
+
+    ranges[k] = (low, high) and coarse_steps[k] are the range and the number of coarse points of parameter k.
+    '''
+    def __init__(self, ranges, coarse_steps, levels):
+        self.ranges = [(float(low), float(high)) for low, high in ranges]
+        self.levels = int(levels)
+        self.coarse_steps = [max(2, int(n)) for n in coarse_steps]
+        self.shape = [(n-1)*2**self.levels + 1 for n in self.coarse_steps]
+
+    def index(self, coord):
+        '''
+        Flat index of a fine-lattice coordinate, in the order of the nested loops of a full grid (last parameter fastest).
+        '''
+        return int(np.ravel_multi_index(coord, self.shape))
+
+    def values(self, coord):
+        return tuple(low + (high-low)*c/(n-1) for (low, high), c, n in zip(self.ranges, coord, self.shape))
+
+    def points(self, stride):
+        '''
+        All coordinates of the sub-lattice with the given stride.
+        '''
+        return itertools.product(*[range(0, n, stride) for n in self.shape])
+
+    def cells(self, stride):
+        '''
+        Lower corners of all cells of the sub-lattice with the given stride.
+        '''
+        return itertools.product(*[range(0, n-1, stride) for n in self.shape])
+
+    def corners(self, cell, stride):
+        return [tuple(c + d*stride for c, d in zip(cell, offset)) for offset in itertools.product((0, 1), repeat=len(cell))]
+
+
+def needs_refinement(corner_chi2, chi2_min, delta_chi2):
+    '''
+    needs_refinement(list corner_chi2, float chi2_min, float delta_chi2):
+
+    True when a cell holds the current minimum or its corners lie on both sides of chi2_min + delta_chi2.
+    Corners that did not give a chi2 (nan) are left out.
+    '''
+    finite = [c for c in corner_chi2 if np.isfinite(c)]
+    if len(finite) == 0:
+        return False
+    if min(finite) <= chi2_min:
+        return True
+    if delta_chi2 is None:
+        return False
+    level = chi2_min + delta_chi2
+    return min(finite) <= level < max(finite)
+
+
+def adaptive_scan(lattice, evaluate, delta_chi2=None, report=print):
+    '''
+    adaptive_scan(AdaptiveLattice lattice, function evaluate, float delta_chi2, function report):
+
+    Drive the refinement. evaluate(list of (index, values)) runs a batch of points and returns {index: chi2}
+    (the total chi2 of each point; points that failed can be left out).
+    Returns {index: chi2} for every point that was run.
+    '''
+    chi2 = {}
+
+    def run(coords):
+        batch = []
+        for coord in coords:
+            index = lattice.index(coord)
+            if index not in chi2:
+                chi2[index] = np.nan #Placeholder, so a point shared by two cells is only run once
+                batch.append((index, lattice.values(coord)))
+        if len(batch) > 0:
+            chi2.update(evaluate(batch))
+        return len(batch)
+
+    stride = 2**lattice.levels
+    n = run(lattice.points(stride))
+    report('Coarse lattice: '+str(n)+' points, spacing '+str(stride)+' fine steps.')
+    cells = list(lattice.cells(stride))
+
+    while stride > 1:
+        finite = [c for c in chi2.values() if np.isfinite(c)]
+        if len(finite) == 0:
+            report('No chi2 values to refine on, stopping.')
+            break
+        chi2_min = min(finite)
+        selected = []
+        for cell in cells:
+            corner_chi2 = [chi2.get(lattice.index(corner), np.nan) for corner in lattice.corners(cell, stride)]
+            if needs_refinement(corner_chi2, chi2_min, delta_chi2):
+                selected.append(cell)
+
+        half = stride//2
+        children = []
+        coords = []
+        for cell in selected:
+            for offset in itertools.product((0, 1), repeat=len(cell)):
+                children.append(tuple(c + d*half for c, d in zip(cell, offset)))
+            coords.extend(itertools.product(*[range(c, c+stride+1, half) for c in cell]))
+        n = run(coords)
+        report('Refined '+str(len(selected))+' of '+str(len(cells))+' cells around chi2_min = '+str(chi2_min)
+               +': '+str(n)+' new points, spacing '+str(half)+' fine steps.')
+        cells = children
+        stride = half
+
+    return dict((index, c) for index, c in chi2.items() if np.isfinite(c))
@@ -0,0 +1,38 @@
+'''
+api.py
+
+Everything the Azure2 processing scripts do, importable from one place, for programs that drive AZURE2 from a single
+long-lived Python process instead of running the scripts one interpreter at a time:
+
+    from azrtools import api
+
+    doc = api.read_azr('fit.azr')
+    levels = api.read_parameters_out('output/parameters.out')
+    api.parameters_to_azr('fit.azr', 'output/parameters.out', 'output/normalizations.out', 'fit-next.azr')
+
+    Evarylist, Widthvarylist = api.parameter_catalog('fit.azr')
+    things = [api.scan_range(thing, low, high, steps) for thing, (low, high, steps) in zip(api.find_parameters(Evarylist, Widthvarylist, [1, 5]), ranges)]
+    rows = api.run_scan(api.new_scan_definition('fit.azr', things), '/path/to/AZURE2', num_workers=4)
+
+Nothing here prompts or depends on the current settings of a script; the scripts are thin wrappers around these.
+'''
+
+from .common import read_proper_units, levelDict, segmentDict1, segmentDict2, configDict
+from .azrfile import read_azr, write_azr, parse_azr_string, azr_to_string, set_output_directories
+from .outfiles import (iter_parameters_out, read_parameters_out, read_parameters_arrays, read_normalizations_out,
+                       read_chisquared_out)
+from .leveltable import LevelTable
+from .transfer import apply_parameters, parameters_to_azr, batch_parameters_to_azr
+from .prettyprint import pretty_print, channel_filter, include_flags, find_runs, aggregate_runs, write_table
+from .runner import run_azure
+from .supervisor import RunPolicy, supervised_run
+from .explore import (parameter_catalog, find_parameters, scan_range, new_scan_definition, load_scan_definition,
+                      run_scan, write_timings)
+from .scanspec import read_scan_specs, select_parameter, spec_definition, run_scan_spec, run_scan_specs, scan_spec, write_scan_spec, submit_scan_spec
+from .workqueue import submit_scan, run_worker, collect_results, reclaim_leases, queue_status
+from .resultarray import load_results
+from .timing import ScanTimings, run_profiled, print_profile
+from .standin import run_model, standin_command
+from .synthetic import synthetic_azr
+from .benchmark import run_benchmarks, save_benchmarks, read_benchmarks, comparison_rows, comparison_table
+from .azureout import find_azureout_files, read_azureout, CurveArchive, open_curves, archive_saved_curves
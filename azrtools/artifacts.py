@@ -0,0 +1,138 @@
+'''
+artifacts.py
+
+Deduplicating store for the files kept for every grid point in chi2search_folder.
+
+Most of what AZURE2 writes barely changes from one grid point to the next (and a point answered from the cache
+gives the very same files), so every file is stored once under the SHA-256 of its contents:
+    chi2search_folder/objects/ab/abcdef...   - one file per distinct content
+    chi2search_folder/manifest.jsonl          - one line per saved point: {"index": i, "files": {name: hash}}
+    chi2search_folder/<name>                  - hard link to the object, under the usual per-point name
+                                                (chiSquared-12.out, param-12.sav, ..). Copied where links are not possible.
+Objects are written to a temporary name and renamed into place, so a crash never leaves a half-written object
+behind. Files are read and written in-process; no shell is started.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+class ArtifactStore(object):
+    '''
+    ArtifactStore(string folder, bool link_names):
+
+    Content-addressed store in 'folder'. With link_names, every saved file also appears under its own name in
+    'folder', as a hard link to the stored object. Treat those as read-only: editing one in place changes every
+    point that shares its content.
+    '''
+    def __init__(self, folder, link_names=True):
+        self.folder = folder
+        self.link_names = link_names
+        self.objects = os.path.join(folder, "objects")
+        if not os.path.isdir(self.objects):
+            os.makedirs(self.objects, exist_ok=True)
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+        self.lock = threading.Lock() #Worker threads save points concurrently
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def put_bytes(self, data):
+        '''
+        put_bytes(bytes data):
+
+        Store 'data' unless it is there already. Returns its hash.
+        '''
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.chmod(tmp, 0o644) #mkstemp makes it private
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return digest
+
+    def put_file(self, path):
+        '''
+        put_file(string path):
+
+        Store the contents of the file at 'path'. Returns its hash.
+        '''
+        with open(path, "rb") as f:
+            return self.put_bytes(f.read())
+
+    def _publish(self, digest, name):
+        #Make the object visible as folder/name
+        dest = os.path.join(self.folder, name)
+        tmp = dest + ".tmp"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        try:
+            os.link(self.object_path(digest), tmp)
+        except OSError:
+            with open(self.object_path(digest), "rb") as f:
+                data = f.read()
+            with open(tmp, "wb") as f:
+                f.write(data)
+        os.replace(tmp, dest)
+
+    def save_point(self, index, files):
+        '''
+        save_point(int index, dict files):
+
+        Store the files of grid point 'index'. 'files' maps the name a file is saved under to its current path;
+        files that do not exist are left out. Returns {name: hash} as recorded in the manifest.
+        '''
+        saved = {}
+        for name, path in files.items():
+            if os.path.isfile(path):
+                saved[name] = self.put_file(path)
+        if self.link_names:
+            for name, digest in saved.items():
+                self._publish(digest, name)
+        with self.lock:
+            with open(self.manifest_path, "a") as f:
+                f.write(json.dumps({'index': index, 'files': saved}, sort_keys=True) + '\n')
+        return saved
+
+    def manifest(self):
+        '''
+        manifest():
+
+        {index: {name: hash}} of every saved point. A point saved twice (e.g. rerun after --resume) keeps its
+        last entry. A line cut short by a crash is ignored.
+        '''
+        points = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    points[entry['index']] = entry['files']
+        return points
+
+    def point_files(self, index, manifest=None):
+        '''
+        point_files(int index, dict manifest):
+
+        {name: path of the stored object} for grid point 'index' (empty if it was never saved).
+        Pass the result of manifest() when looking up many points.
+        '''
+        if manifest is None:
+            manifest = self.manifest()
+        return dict((name, self.object_path(digest)) for name, digest in manifest.get(index, {}).items())
@@ -0,0 +1,97 @@
+'''
+azrfile.py
+
+In-memory model of an .azr file.
+
+An .azr file is a list of XML sections (<config>, <levels>, <segmentsData>, ..) with no single root element.
+xml_maker/azr_maker used to make it parseable by copying it to temp-in.xml with a wrapper tag, and strip the
+wrapper again from temp-out.xml after editing. Here the wrapper is added to the text in memory, the document is
+parsed once, and the edited sections are serialized straight back to the target .azr.
+
+The returned document has the same shape as ET.parse("temp-in.xml") had, so doc.find('levels') and
+root.xpath("//firstElement/levels") keep working.
+'''
+
+import lxml.etree as ET
+
+from .common import configDict
+
+WRAPPER_TAG = "firstElement"
+
+#Text content of <levels> and <segmentsData> can go past the default libxml2 limits on large models
+_parser = ET.XMLParser(huge_tree=True, remove_blank_text=False)
+
+
+def parse_azr_string(text):
+    '''
+    parse_azr_string(string/bytes text):
+
+    Parse the contents of an .azr file held in memory. Returns an lxml ElementTree whose root is the wrapper element.
+    '''
+    if isinstance(text, bytes):
+        wrapped = b"<" + WRAPPER_TAG.encode() + b">\n" + text + b"</" + WRAPPER_TAG.encode() + b">"
+    else:
+        wrapped = "<" + WRAPPER_TAG + ">\n" + text + "</" + WRAPPER_TAG + ">"
+    root = ET.fromstring(wrapped, _parser)
+    return ET.ElementTree(root)
+
+
+def read_azr(source):
+    '''
+    read_azr(string/file source):
+
+    Read and parse an .azr file given either its path or an open file object.
+    '''
+    if hasattr(source, "read"):
+        return parse_azr_string(source.read())
+    with open(source, "rb") as f:
+        return parse_azr_string(f.read())
+
+
+def azr_to_string(doc):
+    '''
+    azr_to_string(ElementTree/Element doc):
+
+    Serialize a parsed .azr back to the text of an .azr file, i.e. without the wrapper element.
+    '''
+    root = doc.getroot() if hasattr(doc, "getroot") else doc
+    pieces = [root.text[1:] if root.text and root.text.startswith("\n") else (root.text or "")]
+    for child in root:
+        pieces.append(ET.tostring(child, encoding="unicode", with_tail=True))
+    return "".join(pieces)
+
+
+def write_azr(doc, outfile):
+    '''
+    write_azr(ElementTree/Element doc, string/file outfile):
+
+    Write a parsed .azr to outfile, given either its path or an open text file object.
+    '''
+    text = azr_to_string(doc)
+    if hasattr(outfile, "write"):
+        outfile.write(text)
+    else:
+        with open(outfile, "w", encoding="utf-8") as fo:
+            fo.write(text)
+
+
+
+def set_output_directories(root, output_dir, checks_dir):
+    '''
+    set_output_directories(Element root, string output_dir, string checks_dir):
+
+    Point the <config> section of a parsed .azr at a different output and checks directory.
+    Returns the (output, checks) lines that were replaced.
+    '''
+    configloc = root.xpath("//firstElement/config")
+    configlines = configloc[0].text.split('\n')
+    offset = 1 if configlines[0].strip() == '' else 0 #Text starts right after the opening tag
+    replaced = []
+    for key, path in (('OutputDirectory', output_dir), ('ChecksDirectory', checks_dir)):
+        n = configDict[key] + offset
+        if n >= len(configlines) or not configlines[n].strip().endswith('/'):
+            raise ValueError("Could not find the "+key+" line in the <config> section of the .azr file")
+        replaced.append(configlines[n])
+        configlines[n] = path
+    configloc[0].text = '\n'.join(configlines)
+    return tuple(replaced)
@@ -0,0 +1,236 @@
+'''
+azureout.py
+
+AZUREOut_aa=<aa>_R=<R>.out files (the calculated curves of entrance pair aa to exit pair R, next to the data) as
+NumPy arrays, and a compact archive of them over the points of a scan.
+  find_azureout_files - every AZUREOut_aa=*_R=*.out in an output directory, by (aa, R)
+  read_azureout       - one file as a (rows, columns) float array, parsed by np.loadtxt, which refuses any token
+                        that is not a number
+  CurveArchive        - the curves of every point and reaction in one binary file, indexed by (point, aa, R)
+  archive_saved_curves - fill a CurveArchive from the AZUREOut_aa=*_R=*-N.out copies of an earlier scan
+
+Layout of an archive folder (e.g. chi2search_folder/curves/):
+    curves.f8 - every curve as raw little-endian float64, row after row, appended one after another
+    index.txt - one line per curve: point index, aa, R, byte offset in curves.f8, rows, columns
+Curves are written and flushed before their index line, so a crash leaves at most an unreferenced tail.
+Reading maps the requested rows and columns of one curve only.
+'''
+
+import os
+import re
+import threading
+
+import numpy as np
+
+AZUREOUT_FILE = re.compile(r'^AZUREOut_aa=(\d+)_R=(\d+)\.out$')
+SAVED_AZUREOUT_FILE = re.compile(r'^AZUREOut_aa=(\d+)_R=(\d+)-(\d+)\.out$')
+
+_DTYPE = np.dtype('<f8')
+
+
+def find_azureout_files(output_dir):
+    '''
+    find_azureout_files(string output_dir):
+
+    Sorted list of (aa, R, path) for the AZUREOut_aa=*_R=*.out files in output_dir.
+    '''
+    found = []
+    if not os.path.isdir(output_dir):
+        return found
+    for name in os.listdir(output_dir):
+        m = AZUREOUT_FILE.match(name)
+        if m:
+            found.append((int(m.group(1)), int(m.group(2)), os.path.join(output_dir, name)))
+    found.sort()
+    return found
+
+
+def read_azureout(path):
+    '''
+    read_azureout(string path):
+
+    The numbers of an AZUREOut file as a float array of shape (rows, columns). Leading lines that do not start
+    with a number (headers) are skipped; the number of columns is that of the first numeric line.
+    Raises ValueError if a field is not a number or the rows do not all have that many columns.
+    '''
+    with open(path, "r") as f:
+        skip = 0
+        numcolumns = 0
+        for line in f:
+            fields = line.split()
+            if len(fields) > 0:
+                try:
+                    float(fields[0])
+                    numcolumns = len(fields)
+                    break
+                except ValueError:
+                    pass
+            skip += 1
+        if numcolumns == 0:
+            return np.zeros((0, 0))
+        f.seek(0)
+        try:
+            values = np.loadtxt(f, dtype=float, comments=None, skiprows=skip, ndmin=2)
+        except ValueError as error:
+            #A field that is not a number, or a row of another length
+            raise ValueError(path+": "+str(error))
+    if values.size % numcolumns != 0 or values.shape[1] != numcolumns:
+        raise ValueError(path+": "+str(values.size)+" numbers do not fill rows of "+str(numcolumns)+" columns")
+    return values
+
+
+class CurveArchive(object):
+    '''
+    CurveArchive(string folder):
+
+    Binary archive of the AZUREOut curves of a scan, kept in 'folder' (created if needed). Reopening an existing
+    folder (e.g. on --resume) appends to it; a curve added again for the same (point, aa, R) replaces the old one.
+    '''
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.data_path = os.path.join(folder, "curves.f8")
+        self.index_path = os.path.join(folder, "index.txt")
+        self.lock = threading.Lock()
+        self._records = None
+
+    def _index(self):
+        if self._records is None:
+            self._records = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r") as f:
+                    for line in f:
+                        array = line.split()
+                        if line.endswith('\n') and len(array) == 6:
+                            index, aa, R, offset, rows, columns = [int(x) for x in array]
+                            self._records[(index, aa, R)] = (offset, rows, columns)
+        return self._records
+
+    def add(self, index, aa, R, curve):
+        '''
+        add(int index, int aa, int R, array curve):
+
+        Archive the (rows, columns) array 'curve' of reaction aa -> R at grid point 'index'.
+        '''
+        curve = np.ascontiguousarray(curve, dtype=_DTYPE)
+        if curve.ndim != 2:
+            raise ValueError("A curve is a (rows, columns) array, got shape "+str(curve.shape))
+        with self.lock:
+            records = self._index()
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(curve.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "a") as f:
+                f.write("%d %d %d %d %d %d\n" % ((index, aa, R, offset) + curve.shape))
+                f.flush()
+                os.fsync(f.fileno())
+            records[(index, aa, R)] = (offset,) + curve.shape
+
+    def add_output_dir(self, index, output_dir):
+        '''
+        add_output_dir(int index, string output_dir):
+
+        Archive every AZUREOut_aa=*_R=*.out of output_dir for grid point 'index'. Returns the (aa, R) archived.
+        '''
+        added = []
+        for aa, R, path in find_azureout_files(output_dir):
+            self.add(index, aa, R, read_azureout(path))
+            added.append((aa, R))
+        return added
+
+    def keys(self):
+        '''
+        Sorted (point index, aa, R) of the curves in the archive.
+        '''
+        with self.lock:
+            return sorted(self._index().keys())
+
+    def points(self):
+        '''
+        Sorted indices of the points with at least one curve.
+        '''
+        return sorted(set(key[0] for key in self.keys()))
+
+    def reactions(self, index=None):
+        '''
+        reactions(int index):
+
+        Sorted (aa, R) archived for point 'index', or for any point when index is None.
+        '''
+        return sorted(set(key[1:] for key in self.keys() if index is None or key[0] == index))
+
+    def shape(self, index, aa=1, R=1):
+        '''
+        shape(int index, int aa, int R):
+
+        (rows, columns) of a curve. Raises KeyError if it was never archived.
+        '''
+        with self.lock:
+            return self._index()[(index, aa, R)][1:]
+
+    def read(self, index, aa=1, R=1, rows=None, columns=None):
+        '''
+        read(int index, int aa, int R, rows, columns):
+
+        The curve of reaction aa -> R at grid point 'index', or only the given rows and/or columns of it
+        (anything that indexes a NumPy axis: an int, a slice, a list of indices, a boolean mask).
+        Only that curve of curves.f8 is mapped. Raises KeyError if it was never archived.
+        '''
+        with self.lock:
+            offset, numrows, numcolumns = self._index()[(index, aa, R)]
+        if numrows*numcolumns == 0:
+            return np.zeros((numrows, numcolumns))[_rows(rows)][..., _columns(columns)]
+        curve = np.memmap(self.data_path, dtype=_DTYPE, mode='r', offset=offset, shape=(numrows, numcolumns))
+        selected = np.array(curve[_rows(rows)][..., _columns(columns)])
+        del curve
+        return selected
+
+    def column(self, column, aa=1, R=1, points=None, rows=None):
+        '''
+        column(int column, int aa, int R, list points, rows):
+
+        {point index: values} of one column of reaction aa -> R, over 'points' (all archived points by default).
+        '''
+        if points is None:
+            points = [key[0] for key in self.keys() if key[1:] == (aa, R)]
+        return dict((index, self.read(index, aa, R, rows, column)) for index in points)
+
+
+def _rows(rows):
+    return slice(None) if rows is None else rows
+
+
+def _columns(columns):
+    return slice(None) if columns is None else columns
+
+
+def open_curves(chi2search_folder):
+    '''
+    open_curves(string chi2search_folder):
+
+    The CurveArchive kept under chi2search_folder/curves/.
+    '''
+    return CurveArchive(os.path.join(chi2search_folder, "curves"))
+
+
+def archive_saved_curves(chi2search_folder, archive=None):
+    '''
+    archive_saved_curves(string chi2search_folder, CurveArchive archive):
+
+    Archive the AZUREOut_aa=*_R=*-N.out files that a scan saved as text in chi2search_folder (into its curves/
+    archive by default). The text files are left in place. Returns the (point index, aa, R) archived.
+    '''
+    if archive is None:
+        archive = open_curves(chi2search_folder)
+    added = []
+    for name in sorted(os.listdir(chi2search_folder)):
+        m = SAVED_AZUREOUT_FILE.match(name)
+        if m:
+            aa, R, index = int(m.group(1)), int(m.group(2)), int(m.group(3))
+            archive.add(index, aa, R, read_azureout(os.path.join(chi2search_folder, name)))
+            added.append((index, aa, R))
+    added.sort()
+    return added
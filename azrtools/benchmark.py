@@ -0,0 +1,252 @@
+'''
+benchmark.py
+
+Throughput of the scripts on synthetic .azr files (see synthetic.py) with the AZURE2 stand-in (see standin.py), so
+that it can be measured, and compared from one version of the code to the next, without AZURE2 or real data.
+  bench_scan           - a grid scan through run_scan, points per second, split into AZURE2 time and overhead
+  bench_parameters2azr - parameters_to_azr of a fit's parameters.out / normalizations.out, channels per second
+  bench_pretty_printer - pretty_print of the same outputs, channels per second
+  run_benchmarks       - any of the three at any of the SIZES, results tagged with the run, commit and versions
+  save_benchmarks      - append results to a JSON-lines file, one line per scenario and size
+  read_benchmarks      - all results saved in such a file
+  comparison_rows      - one run against an earlier one, scenario by scenario
+  comparison_table     - the same as text
+
+Every benchmark works in a folder of its own under the folder given, which it empties first.
+'''
+
+import csv
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from .explore import parameter_catalog, scan_range, new_scan_definition, run_scan
+from .prettyprint import DEFAULT_OUTPUTS, pretty_print
+from .standin import run_model, standin_command
+from .synthetic import synthetic_azr
+from .transfer import parameters_to_azr
+
+#(levels, channels per level, segments, points per segment) of the synthetic .azr at each size
+SIZES = {'small': (4, 2, 2, 20),
+         'medium': (32, 3, 8, 100),
+         'large': (256, 4, 32, 200)}
+
+SCENARIOS = ('scan', 'parameters2azr', 'pretty_printer')
+
+
+def _workspace(folder, scenario, size):
+    path = os.path.join(folder, scenario+'-'+size)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    return path
+
+
+def _synthetic(path, size, output_dir='output/'):
+    num_levels, channels_per_level, num_segments, points_per_segment = SIZES[size]
+    return synthetic_azr(os.path.join(path, 'synthetic.azr'), num_levels, channels_per_level, num_segments,
+                         points_per_segment, output_dir=output_dir)
+
+
+def _record(scenario, size, seconds, items, unit, **extra):
+    #seconds: one entry per repeat
+    record = {'scenario': scenario, 'size': size, 'repeats': len(seconds),
+              'seconds': float(np.median(seconds)), 'best': float(np.min(seconds)), 'items': items, 'unit': unit,
+              'rate': items/float(np.median(seconds)) if np.median(seconds) > 0 else None}
+    record.update(extra)
+    return record
+
+
+def bench_scan(folder, size, steps=4, num_workers=2, delay=0.0):
+    '''
+    bench_scan(string folder, string size, int steps, int num_workers, float delay):
+
+    Time a steps x steps grid scan of the first energy and the first width of the synthetic .azr of 'size', on
+    num_workers workers, the stand-in taking 'delay' seconds per run. The per-point phase times of the scan
+    (see timing.py) give the mean AZURE2 time and the mean overhead of the scan code around it.
+    '''
+    path = _workspace(folder, 'scan', size)
+    back = os.getcwd()
+    os.chdir(path)
+    try:
+        _synthetic('.', size)
+        Evarylist, Widthvarylist = parameter_catalog('synthetic.azr')
+        things = []
+        for ID, parameter in (Evarylist[0], Widthvarylist[0]):
+            value = parameter[0] if len(parameter) == 4 else parameter[5]
+            things.append(scan_range((ID, parameter), 0.9*value, 1.1*value, steps))
+        definition = new_scan_definition('synthetic.azr', things, 'synthetic-chi2test.azr')
+        start = time.perf_counter()
+        run_scan(definition, standin_command(delay), num_workers=num_workers, timings_file='timings.csv')
+        seconds = time.perf_counter() - start
+        with open('timings.csv', "r") as f:
+            rows = list(csv.DictReader(f))
+    finally:
+        os.chdir(back)
+    azure = float(np.mean([float(row['azure']) for row in rows if row.get('azure')])) if rows else None
+    total = float(np.mean([float(row['total']) for row in rows])) if rows else None
+    return _record('scan', size, [seconds], steps*steps, 'points', workers=num_workers, delay=delay,
+                   azure_mean=azure, overhead_mean=(total - azure) if rows and azure is not None else None)
+
+
+def _fit_outputs(folder, scenario, size):
+    #Synthetic .azr and the outputs of a stand-in fit of it
+    path = _workspace(folder, scenario, size)
+    azr_file = _synthetic(path, size, output_dir=os.path.join(path, 'output')+'/')
+    back = os.getcwd()
+    os.chdir(path)
+    try:
+        run_model(azr_file, "2")
+    finally:
+        os.chdir(back)
+    num_levels, channels_per_level = SIZES[size][:2]
+    return path, azr_file, num_levels*channels_per_level
+
+
+def bench_parameters2azr(folder, size, repeats=5):
+    '''
+    bench_parameters2azr(string folder, string size, int repeats):
+
+    Time parameters_to_azr of a stand-in fit of the synthetic .azr of 'size', 'repeats' times.
+    '''
+    path, azr_file, channels = _fit_outputs(folder, 'parameters2azr', size)
+    seconds = []
+    for k in range(repeats):
+        start = time.perf_counter()
+        parameters_to_azr(azr_file, os.path.join(path, 'output', 'parameters.out'),
+                          os.path.join(path, 'output', 'normalizations.out'), os.path.join(path, 'transferred.azr'))
+        seconds.append(time.perf_counter() - start)
+    return _record('parameters2azr', size, seconds, channels, 'channels')
+
+
+def bench_pretty_printer(folder, size, repeats=5):
+    '''
+    bench_pretty_printer(string folder, string size, int repeats):
+
+    Time pretty_print (the three default tables) of a stand-in fit of the synthetic .azr of 'size', 'repeats' times.
+    '''
+    path, azr_file, channels = _fit_outputs(folder, 'pretty_printer', size)
+    outputs = [(os.path.join(path, name), predicate) for name, predicate in DEFAULT_OUTPUTS]
+    seconds = []
+    for k in range(repeats):
+        start = time.perf_counter()
+        pretty_print(os.path.join(path, 'output', 'parameters.out'), os.path.join(path, 'output', 'normalizations.out'),
+                     os.path.join(path, 'output', 'chiSquared.out'), outputs)
+        seconds.append(time.perf_counter() - start)
+    return _record('pretty_printer', size, seconds, channels, 'channels')
+
+
+def _commit():
+    #Short commit of the code being measured, or None outside a git checkout
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if out.returncode != 0:
+        return None
+    return out.stdout.decode().strip() or None
+
+
+def run_benchmarks(folder, scenarios=SCENARIOS, sizes=('small', 'medium', 'large'), repeats=5, scan_steps=4,
+                   scan_workers=2, delay=0.0):
+    '''
+    run_benchmarks(string folder, list scenarios, list sizes, int repeats, int scan_steps, int scan_workers, float delay):
+
+    Run every scenario of SCENARIOS asked for at every size, working under 'folder' (the scan once, the others
+    'repeats' times). Returns one record (dict) per
+    scenario and size: median and best seconds, items (points or channels) and their rate per second, tagged with
+    the run (start time), commit, host and Python and NumPy versions.
+    '''
+    unknown = [name for name in scenarios if name not in SCENARIOS] + [size for size in sizes if size not in SIZES]
+    if unknown:
+        raise ValueError("Unknown benchmark scenario(s) or size(s): "+', '.join(unknown))
+    tags = {'run': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), 'commit': _commit(),
+            'host': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__}
+    folder = os.path.abspath(folder)
+    records = []
+    for scenario in scenarios:
+        for size in sizes:
+            print('Benchmark', scenario, size, '..')
+            if scenario == 'scan':
+                record = bench_scan(folder, size, scan_steps, scan_workers, delay)
+            elif scenario == 'parameters2azr':
+                record = bench_parameters2azr(folder, size, repeats)
+            else:
+                record = bench_pretty_printer(folder, size, repeats)
+            record.update(tags)
+            records.append(record)
+            print('   %.4f s, %.1f %s/s' % (record['seconds'], record['rate'] or 0.0, record['unit']))
+    return records
+
+
+def save_benchmarks(records, results_file):
+    '''
+    save_benchmarks(list records, string results_file):
+
+    Append the records of run_benchmarks to results_file, one JSON object per line.
+    '''
+    with open(results_file, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def read_benchmarks(results_file):
+    '''
+    read_benchmarks(string results_file):
+
+    Every record saved in results_file, oldest first. Lines that cannot be read are skipped.
+    '''
+    records = []
+    if not os.path.exists(results_file):
+        return records
+    with open(results_file, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def comparison_rows(records, run=None, baseline=None):
+    '''
+    comparison_rows(list records, string run, string baseline):
+
+    [(scenario, size, baseline seconds, seconds, ratio)] of run 'run' (by default the last one in records) against
+    run 'baseline' (by default, for each scenario and size, the last earlier run that measured it). The ratio is
+    seconds/baseline seconds (below 1 is faster); baseline seconds and ratio are None where there is nothing to
+    compare with.
+    '''
+    if run is None:
+        run = records[-1].get('run') if records else None
+    before = {}
+    rows = []
+    for record in records:
+        key = (record['scenario'], record['size'])
+        if record.get('run') == run:
+            old = before.get(key)
+            rows.append((key[0], key[1], old, record['seconds'], record['seconds']/old if old else None))
+        elif record.get('run') == baseline or (baseline is None and not rows):
+            #Without a baseline, only the runs saved before 'run' count
+            before[key] = record['seconds']
+    return rows
+
+
+def comparison_table(rows):
+    '''
+    comparison_table(list rows):
+
+    The rows of comparison_rows as text.
+    '''
+    lines = ["%-16s %-8s %12s %12s %7s" % ("scenario", "size", "before(s)", "now(s)", "ratio")]
+    for scenario, size, old, new, ratio in rows:
+        lines.append("%-16s %-8s %12s %12.4f %7s" % (scenario, size, '%.4f' % old if old is not None else '-', new,
+                                                      '%.3f' % ratio if ratio is not None else '-'))
+    return '\n'.join(lines) + '\n'
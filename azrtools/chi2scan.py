@@ -0,0 +1,517 @@
+'''
+chi2scan.py
+
+Grid-point machinery behind chi2explore: patch the scanned levels into a copy of the input .azr,
+run AZURE2 on it, read chiSquared.out and file the outputs away in chi2search_folder.
+
+Every AZURE2 run in flight needs its own working .azr and output directory, so
+these are bundled in a WorkerSlot. A serial scan uses one slot that points at the usual
+./output/ directory; a parallel scan uses one scratch directory per worker.
+'''
+
+import io
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from .azrfile import read_azr
+from .levelpatch import PatchTemplate
+from .supervisor import RunPolicy, supervised_run
+from .timing import ScanTimings
+from .resultcache import segment_data_salt
+from .artifacts import ArtifactStore
+from .snapshots import open_snapshots
+from .azureout import AZUREOUT_FILE, find_azureout_files, open_curves
+from .adaptive import adaptive_scan
+from .minimize import minimize
+from .warmstart import warm_start_values
+
+#Points whose AZURE2 runs all failed are listed here, in chi2search_folder: index, values, what went wrong
+FAILED_POINTS_FILE = "failed-points.txt"
+
+#Output files kept for every grid point, and their names in chi2search_folder ('#' becomes the point index)
+POINT_OUTPUT_FILES = [("chiSquared.out", "chiSquared-#.out"),
+                      ("param.sav", "param-#.sav"),
+                      ("param.par", "param-#.par"),
+                      ("normalizations.out", "normalizations-#.out"),
+                      ("AZUREOut_aa=1_R=1.out", "AZUREOut_aa=1_R=1-#.out"),
+                      ("parameters.out", "parameters-#.out")]
+
+
+class WorkerSlot(object):
+    '''
+    WorkerSlot(string workdir, string working_azr_file, string output_dir, string checks_dir, bool redirect_output)
+
+    Files owned by one AZURE2 run. When redirect_output is set, the working .azr gets its output and
+    checks directories rewritten to point into workdir, so runs in different slots never share files.
+    'point' is the (values, warm) of the grid point last written to the working .azr.
+    '''
+    def __init__(self, workdir, working_azr_file, output_dir, checks_dir=None, redirect_output=False):
+        self.workdir = workdir
+        self.working_azr_file = working_azr_file
+        self.output_dir = output_dir
+        self.checks_dir = checks_dir
+        self.redirect_output = redirect_output
+        self.point = None
+
+
+class ScanJob(object):
+    '''
+    ScanJob(string template_azr_file, list things, string executable, ...)
+
+    Everything that stays fixed over a scan. 'things' is the thingstovary_withrange list built by chi2explore,
+    with entries (ID, parameter tuple, (low, high, steps), 'Energy' or 'Width').
+    The template .azr is read and compiled against 'things' once, here.
+    With a ResultCache, points that AZURE2 has already seen (in this or any earlier scan) are not run again.
+    With warm_start, the template is also compiled for warm-started fits (see warmstart.py).
+    The files kept for each point go into an ArtifactStore in chi2search_folder. With archive_snapshots,
+    parameters.out and param.sav are kept as deltas against the first point instead (see snapshots.py).
+    With archive_curves, every AZUREOut_aa=*_R=*.out goes into one binary CurveArchive instead (see azureout.py).
+    AZURE2 runs under 'policy' (time limits and retries, see supervisor.py), by default one retry and no time limit.
+    With a ScanTimings, the phases of every point are timed into it (see timing.py).
+    With free_widths_only, scanned widths are only written to lines with FixWidth? = 0 (see levelpatch.py).
+    '''
+    def __init__(self, template_azr_file, things, executable, menu_choice="2", azure_options="--no-gui",
+                 chi2search_folder="./chi2search_folder", save_out_files=True, save_azr_files=True, cache=None,
+                 warm_start=False, archive_snapshots=False, archive_curves=False, policy=None,
+                 timings=None, free_widths_only=False):
+        self.template_azr_file = template_azr_file
+        self.things = things
+        self.executable = executable
+        self.menu_choice = menu_choice
+        self.azure_options = azure_options
+        self.chi2search_folder = chi2search_folder
+        self.save_out_files = save_out_files
+        self.save_azr_files = save_azr_files
+        self.artifacts = ArtifactStore(chi2search_folder)
+        self.snapshots = open_snapshots(chi2search_folder) if archive_snapshots else None
+        self.curves = open_curves(chi2search_folder) if archive_curves else None
+        self.warm_start = warm_start
+        self.policy = policy if policy is not None else RunPolicy()
+        self.failure_lock = threading.Lock()
+        self.failures = {}
+        self.timings = timings if timings is not None else ScanTimings(enabled=False)
+        doc = read_azr(template_azr_file)
+        segments = doc.find('segmentsData')
+        self.num_segments = len([line for line in (segments.text or "").split('\n') if line.strip()]) if segments is not None else 0
+        self.template = PatchTemplate(doc, things, warm_fields=warm_start, free_widths_only=free_widths_only)
+        self.cache = cache
+        if cache is not None:
+            #The data files are part of what a result depends on. AZURE2 resolves their paths from the directory it runs in.
+            self.cache_salt = segment_data_salt(segments.text if segments is not None else "")
+
+
+def make_worker_slots(num_workers, working_azr_file, scratch_root="./chi2scan_workers", isolated=False):
+    '''
+    make_worker_slots(int num_workers, string working_azr_file, string scratch_root, bool isolated):
+
+    One worker keeps the original layout (working .azr in place, results in ./output/), unless isolated is set.
+    More workers get a scratch directory each under scratch_root, holding their own copy of the working .azr,
+    and an output/ and checks/ directory.
+    '''
+    if num_workers <= 1 and not isolated:
+        return [WorkerSlot(".", working_azr_file, "./output/")]
+
+    slots = []
+    for k in range(num_workers):
+        workdir = os.path.abspath(os.path.join(scratch_root, "worker-"+str(k)))
+        output_dir = os.path.join(workdir, "output") + "/"
+        checks_dir = os.path.join(workdir, "checks") + "/"
+        for folder in (output_dir, checks_dir):
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        slot_azr_file = os.path.join(workdir, os.path.basename(working_azr_file))
+        slots.append(WorkerSlot(workdir, slot_azr_file, output_dir, checks_dir, redirect_output=True))
+    return slots
+
+
+def write_point_azr(job, slot, values, warm=None):
+    '''
+    write_point_azr(ScanJob job, WorkerSlot slot, list values, dict warm):
+
+    Generate the working .azr of one grid point by splicing its values into the compiled template of the scan.
+    warm holds the fitted parameters of the previous point for a warm-started fit.
+    '''
+    if slot.redirect_output:
+        job.template.write(slot.working_azr_file, values, slot.output_dir, slot.checks_dir, warm)
+    else:
+        job.template.write(slot.working_azr_file, values, warm=warm)
+    slot.point = (values, warm)
+
+
+def saved_point_azr(job, slot):
+    '''
+    saved_point_azr(ScanJob job, WorkerSlot slot):
+
+    Path of the .azr of the slot's last grid point as it is kept in chi2search_folder: with the output and checks
+    directories of the input .azr, so it can be run again like the serial script's copies. That is the working .azr
+    itself, unless the slot redirects its outputs; then the point is rendered again, without the redirect, into
+    workdir/saved/ under the same name.
+    '''
+    if not slot.redirect_output or slot.point is None:
+        return slot.working_azr_file
+    values, warm = slot.point
+    saved = os.path.join(slot.workdir, "saved", os.path.basename(slot.working_azr_file))
+    os.makedirs(os.path.dirname(saved), exist_ok=True)
+    job.template.write(saved, values, warm=warm)
+    return saved
+
+
+def read_chi2_values(chi2_out_path_file):
+    '''
+    read_chi2_values(string chi2_out_path_file):
+
+    Returns the chi2 numbers found between the first and last lines of chiSquared.out
+    '''
+    values = []
+    with open(chi2_out_path_file, "r") as f:
+        lines = f.readlines()
+    for line in lines[1:-1]:
+        array = line.split()
+        #Array output would look like
+        #['Segment', '#2', 'Chi-Squared/N:', '76.383']
+        #['Total', 'Chi-Squared:', '6339.79']
+        #The number is always the last element
+        if len(array) > 0:
+            values.append(float(array[-1]))
+    return values
+
+
+def check_chi2_out(output_dir):
+    '''
+    Problem with the chiSquared.out of a run (see supervisor.supervised_run), None if it holds chi2 values.
+    '''
+    try:
+        if len(read_chi2_values(os.path.join(output_dir, "chiSquared.out"))) == 0:
+            return "wrote no chi2 to chiSquared.out"
+    except (IOError, OSError, ValueError):
+        return "wrote a chiSquared.out that cannot be read"
+    return None
+
+
+def record_failure(job, index, values, problem):
+    '''
+    record_failure(ScanJob job, int index, list values, string problem):
+
+    Add grid point 'index' to FAILED_POINTS_FILE in chi2search_folder, and to job.failures.
+    '''
+    with job.failure_lock:
+        job.failures[index] = problem
+        with open(os.path.join(job.chi2search_folder, FAILED_POINTS_FILE), "a") as f:
+            f.write(str(index) + '\t' + ' '.join(str(value) for value in values) + '\t' + problem + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def save_point_files(job, slot, index, outputs_available=True):
+    '''
+    save_point_files(ScanJob job, WorkerSlot slot, int index, bool outputs_available):
+
+    Store the AZURE2 outputs and the working .azr of grid point 'index' in chi2search_folder (see artifacts.py).
+    outputs_available is False when the point came from the cache without its output files.
+    '''
+    files = {}
+    if job.save_out_files and outputs_available:
+        for name, saved_name in POINT_OUTPUT_FILES:
+            path = os.path.join(slot.output_dir, name)
+            if job.curves is not None and AZUREOUT_FILE.match(name):
+                continue
+            elif job.snapshots is not None and name in job.snapshots:
+                if os.path.isfile(path):
+                    job.snapshots[name].add_file(index, path)
+            else:
+                files[saved_name.replace('#', str(index))] = path
+
+        if job.curves is not None:
+            job.curves.add_output_dir(index, slot.output_dir)
+
+    if job.save_azr_files:
+        azr_name = os.path.basename(slot.working_azr_file)
+        files[azr_name[:-4]+"-"+str(index)+".azr"] = saved_point_azr(job, slot)
+
+    if len(files) > 0:
+        job.artifacts.save_point(index, files)
+
+
+def point_output_names(job, slot):
+    '''
+    point_output_names(ScanJob job, WorkerSlot slot):
+
+    Names of the output files of a point to keep in the cache: those of POINT_OUTPUT_FILES, and with
+    archive_curves every AZUREOut file of the slot's output directory.
+    '''
+    names = [name for name, saved_name in POINT_OUTPUT_FILES]
+    if job.curves is not None:
+        names += [os.path.basename(path) for aa, R, path in find_azureout_files(slot.output_dir) if os.path.basename(path) not in names]
+    return names
+
+
+def cache_key(job, values, warm=None):
+    '''
+    cache_key(ScanJob job, list values, dict warm):
+
+    Key of a grid point in job.cache. The .azr is rendered with blank output/checks directories, so the key
+    does not depend on which worker runs the point.
+    '''
+    if job.template.config_lines is not None:
+        azr_text = job.template.render(values, "", "", warm)
+    else:
+        azr_text = job.template.render(values, warm=warm)
+    return job.cache.key(azr_text, str(job.menu_choice)+" "+job.azure_options, job.cache_salt)
+
+
+def evaluate_point(job, slot, index, values, warm=None):
+    '''
+    evaluate_point(ScanJob job, WorkerSlot slot, int index, list values, dict warm):
+
+    Run one grid point start to finish in 'slot'. Returns (rows, outputs_available): the rows (index, p1, p2, .., chi2)
+    for chisquared-output.dat, and whether slot.output_dir now holds this point's outputs (AZURE2 ran, or the cache
+    restored them). When the scan has a cache and already knows the point, AZURE2 is not run.
+    AZURE2 runs under job.policy. A point that fails every attempt gives no rows and is added to FAILED_POINTS_FILE;
+    only its .azr is kept. It is tried again if the scan is resumed.
+    '''
+    timings = job.timings
+    with timings.phase(index, 'patch'):
+        write_point_azr(job, slot, values, warm)
+
+    chi2values = None
+    outputs_available = True
+    if job.cache is not None:
+        with timings.phase(index, 'cache'):
+            key = cache_key(job, values, warm)
+            entry = job.cache.get(key)
+            if entry is not None:
+                chi2values = entry['chi2']
+                #Outputs left by the slot's previous point must not be taken for this one's
+                for name, saved_name in POINT_OUTPUT_FILES:
+                    if os.path.isfile(os.path.join(slot.output_dir, name)):
+                        os.remove(os.path.join(slot.output_dir, name))
+                if job.curves is not None:
+                    for aa, R, path in find_azureout_files(slot.output_dir):
+                        os.remove(path)
+                outputs_available = job.cache.restore_outputs(key, entry, slot.output_dir)
+                if job.save_out_files and not outputs_available and job.cache.store_outputs:
+                    chi2values = None #Output files were asked for but are gone, run it again
+                else:
+                    print("Point", index, " found in cache")
+
+    if chi2values is None:
+        with timings.phase(index, 'azure'):
+            #Old outputs are cleared first: after a crash nothing is left to be read as this point's results
+            outputs = [os.path.basename(path) for aa, R, path in find_azureout_files(slot.output_dir)]
+            outputs += [name for name, saved_name in POINT_OUTPUT_FILES]
+            run = supervised_run(job.policy, job.executable, slot.working_azr_file, job.menu_choice, job.azure_options,
+                                 slot.output_dir, outputs, check=check_chi2_out, label="Point "+str(index))
+        if run.problem is not None:
+            print("Point", index, " failed after", run.attempts, "attempt(s):", run.problem)
+            record_failure(job, index, values, run.problem)
+            with timings.phase(index, 'save'):
+                save_point_files(job, slot, index, outputs_available=False)
+            return [], False
+        print("Point", index, " AZURE2 ran for %.2f s" % run.elapsed)
+        with timings.phase(index, 'parse'):
+            chi2values = read_chi2_values(os.path.join(slot.output_dir, "chiSquared.out"))
+        outputs_available = True
+        if job.cache is not None:
+            with timings.phase(index, 'cache'):
+                job.cache.put(key, chi2values, slot.output_dir, point_output_names(job, slot))
+
+    rows = []
+    for chi2 in chi2values:
+        rows.append((index,) + tuple(values) + (chi2,))
+    with timings.phase(index, 'save'):
+        save_point_files(job, slot, index, outputs_available)
+    return rows, outputs_available
+
+
+def run_points(job, slots, points, results=None, checkpoint=None, done=None):
+    '''
+    run_points(ScanJob job, list slots, iterable points, ResultWriter results, ScanCheckpoint checkpoint, set done):
+
+    Evaluate every (index, values) in points, keeping one AZURE2 run in flight per slot.
+    Points whose index is in 'done' are skipped. As soon as a point finishes, its rows go to 'results'
+    and its index to 'checkpoint' (both optional, see scanstate.py).
+    Returns the result rows of the points run here, sorted by index.
+    '''
+    free_slots = queue.Queue()
+    for slot in slots:
+        free_slots.put(slot)
+
+    def run_in_free_slot(index, values):
+        slot = free_slots.get()
+        try:
+            return evaluate_point(job, slot, index, values)[0]
+        finally:
+            free_slots.put(slot)
+
+    #Points are pulled from the generator only as slots free up, so the plan is never held in memory
+    points = iter(points)
+    window = 2*len(slots)
+    chisqlist = []
+    with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    index, values = next(points)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if done is None or index not in done:
+                    pending.add(pool.submit(run_in_free_slot, index, values))
+            if len(pending) == 0:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                rows = future.result()
+                for row in rows:
+                    chisqlist.append(row)
+                    print("Point", row[0], " params:", row[1:-1], "  chi2:", row[-1])
+                if len(rows) > 0:
+                    with job.timings.phase(rows[0][0], 'results'):
+                        if results is not None:
+                            results.write_point(rows)
+                        if checkpoint is not None:
+                            checkpoint.mark_done(rows[0][0])
+
+    chisqlist.sort(key=lambda row: row[0])
+    return chisqlist
+
+
+def saved_warm_start(job, index):
+    '''
+    saved_warm_start(ScanJob job, int index):
+
+    Warm-start fill from the outputs of grid point 'index' saved in chi2search_folder by an earlier run, or None.
+    '''
+    names = dict(POINT_OUTPUT_FILES)
+    param_out = os.path.join(job.chi2search_folder, names["parameters.out"].replace('#', str(index)))
+    if job.snapshots is not None and "parameters.out" in job.snapshots:
+        try:
+            param_out = io.StringIO(job.snapshots["parameters.out"].read(index).decode())
+        except (KeyError, IOError, OSError, ValueError):
+            return None
+    return warm_start_values(job.template, param_out,
+                             os.path.join(job.chi2search_folder, names["normalizations.out"].replace('#', str(index))))
+
+
+def run_chain(job, slot, chain, record, done=None):
+    '''
+    run_chain(ScanJob job, WorkerSlot slot, iterable chain, function record, set done):
+
+    Evaluate the (index, values) of 'chain' one after the other in 'slot', starting each fit from the parameters the
+    previous one converged to. The first point, and any point after a failed run, starts from the template.
+    record(rows) is called with the rows of every point run. Points in 'done' are skipped, but their saved
+    outputs still pass the warm start on.
+    '''
+    warm = None
+    previous = None
+    for index, values in chain:
+        if done is not None and index in done:
+            warm = saved_warm_start(job, index)
+            previous = index
+            continue
+        if warm is not None:
+            print("Point", index, " starts from the fit of point", previous)
+        rows, outputs_available = evaluate_point(job, slot, index, values, warm)
+        record(rows)
+        warm = None
+        #Only take over outputs of this point, not ones left behind by an earlier point or run
+        if len(rows) > 0 and outputs_available:
+            warm = warm_start_values(job.template, os.path.join(slot.output_dir, "parameters.out"),
+                                     os.path.join(slot.output_dir, "normalizations.out"))
+        previous = index
+
+
+def run_chains(job, slots, chains, results=None, checkpoint=None, done=None):
+    '''
+    run_chains(ScanJob job, list slots, list chains, ResultWriter results, ScanCheckpoint checkpoint, set done):
+
+    Warm-started scan: every chain (an iterable of (index, values), see run_chain) runs in a slot of its own,
+    so there should be no more chains than slots. Rows go to 'results' and indices to 'checkpoint' as points finish.
+    Returns the result rows of the points run here, sorted by index.
+    '''
+    chisqlist = []
+    lock = threading.Lock()
+
+    def record(rows):
+        with lock:
+            for row in rows:
+                chisqlist.append(row)
+                print("Point", row[0], " params:", row[1:-1], "  chi2:", row[-1])
+            if len(rows) > 0:
+                with job.timings.phase(rows[0][0], 'results'):
+                    if results is not None:
+                        results.write_point(rows)
+                    if checkpoint is not None:
+                        checkpoint.mark_done(rows[0][0])
+
+    with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+        futures = [pool.submit(run_chain, job, slot, chain, record, done) for slot, chain in zip(slots, chains)]
+        for future in futures:
+            future.result()
+
+    chisqlist.sort(key=lambda row: row[0])
+    return chisqlist
+
+
+def run_adaptive(job, slots, lattice, delta_chi2=None, results=None, checkpoint=None, done=None, known=None):
+    '''
+    run_adaptive(ScanJob job, list slots, AdaptiveLattice lattice, float delta_chi2, ..., dict known):
+
+    Coarse-to-fine scan (see adaptive.py), each refinement round being run in parallel by run_points.
+    When resuming, 'known' gives the total chi2 of the points in 'done', so the refinement takes the same path.
+    Returns the result rows of the points run here, sorted by index.
+    '''
+    chisqlist = []
+
+    def evaluate(batch):
+        rows = run_points(job, slots, batch, results, checkpoint, done)
+        chisqlist.extend(rows)
+        totals = {}
+        for row in rows:
+            totals[row[0]] = row[-1] #The last line of chiSquared.out holds the total
+        if known is not None:
+            for index, values in batch:
+                if index in known and index not in totals:
+                    totals[index] = known[index]
+        return totals
+
+    adaptive_scan(lattice, evaluate, delta_chi2)
+    chisqlist.sort(key=lambda row: row[0])
+    return chisqlist
+
+
+def run_minimize(job, slot, start, bounds, method="nelder-mead", xtol=1e-3, ftol=1e-2, max_evals=100, results=None):
+    '''
+    run_minimize(ScanJob job, WorkerSlot slot, list start, list bounds, string method, ..., ResultWriter results):
+
+    Minimize the total chi2 over the scanned parameters (see minimize.py), each evaluation being one AZURE2 run
+    in 'slot'. Evaluations are numbered in the order they are run; their rows go to 'results' as they come in,
+    and their outputs to chi2search_folder as for a grid point. With job.warm_start, each fit starts from the
+    parameters the previous evaluation converged to. Returns a MinimizeResult.
+    '''
+    counter = [0]
+    warm = [None]
+
+    def objective(values):
+        index = counter[0]
+        counter[0] = index + 1
+        rows, outputs_available = evaluate_point(job, slot, index, list(values), warm[0])
+        if job.warm_start and len(rows) > 0 and outputs_available:
+            warm[0] = warm_start_values(job.template, os.path.join(slot.output_dir, "parameters.out"),
+                                        os.path.join(slot.output_dir, "normalizations.out"))
+        if len(rows) == 0:
+            print("Evaluation", index, " params:", tuple(values), "  no chi2 found")
+            return np.inf
+        print("Evaluation", index, " params:", tuple(values), "  chi2:", rows[-1][-1])
+        if results is not None:
+            with job.timings.phase(index, 'results'):
+                results.write_point(rows)
+        return rows[-1][-1] #The last line of chiSquared.out holds the total
+
+    return minimize(objective, start, bounds, method, xtol, ftol, max_evals)
@@ -0,0 +1,95 @@
+'''
+common.py
+
+Function and dictionary definitions shared by the Azure2 processing scripts.
+These used to be copied at the top of every script.
+'''
+
+def read_proper_units(valuestr, unitstr):
+    '''
+    A dictionary to convert energies in multiple units to eV
+    '''
+    units_dict = {'meV':1e-3,'eV':1,'keV':1e3,'MeV':1e6,'GeV':1e9}
+    #Longest names first, so 'eV' does not match inside 'MeV'
+    for key in sorted(units_dict.keys(), key=len, reverse=True):
+        if key in unitstr:
+            multiplier = float(units_dict[key])
+            return float(valuestr)*multiplier #value in eV!
+
+
+#Dictionary mapping the contents of one line of 'levels' by category
+levelDict = {'J-channel':0,
+             'Pi-channel':1,
+            'ExcEnergyChannelMeV':2,
+             'FixE?':3,
+             'UnknownFlag':4,
+             'ParticlePair#':5,
+             '2S':6,
+             '2L':7,
+             'ChannelIndex':8,
+             'IncludeLevel?':9,
+             'FixWidth?':10,
+             'WidthChanneleV':11,
+             'J-light':12,
+             'Pi-light':13,
+             'J-heavy':14,
+             'Pi-heavy':15,
+             'ExcEnergyInputMeV':16,
+             'A-Light':17,
+             'A-Heavy':18,
+             'Z-light':19,
+             'Z-Heavy':20,
+             'UnknownSeparationEnergyMeV':21,
+             'ParticlePair#SeparationEnergyMeV':22,
+             'Unknown#1':23,
+             'Unknown#1':24,
+             'Unknown#1':25,
+             'Unknown#1':26,
+             'ChannelRadiusfm':27,
+             'Unknown#1':28,
+             'Unknown#1':29,
+             'Unknown#1':30
+             }
+
+#Two dictionaries to use with segment data
+#Dictionary to use when segments have angle-integrated,differential,or angle-integrated-total-capture data
+segmentDict1 = {'Include?':0,
+                'EntrancePair':1,
+                'ExitPair':2,#Becomes -1 when DataType=3.
+                'LowLabEnergyMeV':3,
+                'HighLabEnergyMeV':4,
+                'LowLabAngleDeg':5,#Automatically goes to 0 for DataType=0,3
+                'HighLabAngleDeg':6,#Automatically goes to 180 for DataType=0,3
+                'DataType':7,#0 - Angle Integrated, 1 - Differential, 3- Angle Integrated Total Capture
+                'Normalization':8,
+                'VaryNorm?':9,
+                'NormError%':10,
+                'DataFilePath':11
+                }
+
+#Dictionary to use when segments have phase-shift data,
+segmentDict2 = {'Include?':0,
+                'EntrancePair':1,
+                'ExitPair':2,#Becomes -1 when DataType=3.
+                'LowLabEnergyMeV':3,
+                'HighLabEnergyMeV':4,
+                'LowLabAngleDeg':5,#Automatically goes to 0 for DataType=0,3
+                'HighLabAngleDeg':6,#Automatically goes to 180 for DataType=0,3
+                'DataType':7,#2 - Phase-shift
+                'J':8,
+                'l':9,
+                'Normalization':10,
+                'VaryNorm?':11,
+                'NormError%':12,
+                'DataFilePath':13
+                }
+
+#Dictionary mapping the lines of the 'config' section (counted after the opening tag)
+#Only the two directory lines are touched by these scripts. AZURE2 appends file names directly, so both end with '/'.
+configDict = {'UseAMatrix?':0,
+              'UnknownConfigFlag':1,
+              'OutputDirectory':2,
+              'ChecksDirectory':3,
+              'ExternalCaptureFile':4,
+              'UnknownConfigFile':5
+              }
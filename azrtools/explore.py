@@ -0,0 +1,308 @@
+'''
+explore.py
+
+What chi2explore does, as functions that can be called many times from one process:
+  parameter_catalog    - the numbered energies and widths of an .azr that can be scanned (the IDs chi2explore prints)
+  find_parameters      - catalog entries of a list of IDs
+  scan_range           - attach a (low, high, steps) range to a catalog entry, giving a thingstovary_withrange entry
+  ask_parameters       - the interactive prompts of the chi2explore scripts, built on the three above
+  new_scan_definition  - everything that defines a scan, as stored in its checkpoint
+  load_scan_definition - definition and finished points of an interrupted scan, for --resume
+  run_scan             - run a scan (grid, sampled, adaptive or minimization) start to finish
+  write_timings        - per-point CSV and summary table of the phase timings of a scan
+
+The definition is a plain dict so that it can go to the checkpoint as it is. The per-point machinery is in chi2scan.py.
+'''
+
+import os
+import shutil
+
+import numpy as np
+
+from .azrfile import read_azr
+from .leveltable import LevelTable
+from .chi2scan import ScanJob, make_worker_slots, run_points, run_chains, run_adaptive, run_minimize
+from .sampling import grid_points, grid_size, serpentine_points, sobol_points, lhs_points
+from .warmstart import nearest_neighbour_order
+from .scanstate import ScanCheckpoint, ResultWriter, ResultTee, read_point_totals
+from .resultarray import ResultArray
+from .adaptive import AdaptiveLattice
+from .resultcache import ResultCache
+from .supervisor import RunPolicy
+from .timing import ScanTimings
+
+SCAN_MODES = ('grid', 'adaptive', 'sobol', 'lhs', 'minimize')
+
+
+def parameter_catalog(azr, free_only=False):
+    '''
+    parameter_catalog(string/ElementTree/LevelTable azr, bool free_only):
+
+    Returns (Evarylist, Widthvarylist): [(ID, (E, J, pi, NumE))] and [(ID, (E, J, pi, L, S, W))] of the included levels
+    of an .azr (its path, the parsed file or its LevelTable). IDs count from 1, energies first, numbered as the
+    original chi2explore scripts numbered them: their catalog never had the energy of the last level group of the
+    file, so that energy comes last in Evarylist with the ID after the last width, and every other ID is unchanged.
+    With free_only, levels and widths fixed in the .azr are left out.
+    '''
+    if not isinstance(azr, LevelTable):
+        doc = read_azr(azr) if isinstance(azr, str) else azr
+        azr = LevelTable(doc.find('levels').text)
+    energies = azr.varied_energies(free_only, last_group=False)
+    widths = azr.varied_widths(free_only)
+    Evarylist = list(enumerate(energies, 1))
+    Widthvarylist = list(enumerate(widths, len(energies)+1))
+    last = [E for E in azr.varied_energies(free_only) if E not in energies]
+    Evarylist += list(enumerate(last, len(energies)+len(widths)+1))
+    return Evarylist, Widthvarylist
+
+
+def find_parameters(Evarylist, Widthvarylist, idstovary):
+    '''
+    find_parameters(list Evarylist, list Widthvarylist, list idstovary):
+
+    Catalog entries (ID, tuple) of the IDs in idstovary, in that order. IDs not in the catalog are left out.
+    '''
+    byID = dict((entry[0], entry) for entry in Evarylist + Widthvarylist)
+    return [byID[ID] for ID in idstovary if ID in byID]
+
+
+def scan_range(thing, low, high, steps):
+    '''
+    scan_range(tuple thing, float low, float high, int steps):
+
+    thingstovary_withrange entry (ID, tuple, (low, high, steps), 'Energy' or 'Width') of a catalog entry.
+    An empty or reversed range falls back to +-10% of the present value in 10 steps.
+    '''
+    ID, parameter = thing
+    kind = "Energy" if len(parameter) == 4 else "Width"
+    if (low > high) or (steps <= 0):
+        value = parameter[0] if kind == "Energy" else parameter[5]
+        low = value - 0.1*value
+        high = value + 0.1*value
+        steps = 10
+        print('Erroneous range.. choosing default values..', ' low:', low, ' high:', high, ' steps:', steps)
+    return (ID, parameter, (float(low), float(high), int(steps)), kind)
+
+
+def ask_parameters(Evarylist, Widthvarylist, numparam=None):
+    '''
+    ask_parameters(list Evarylist, list Widthvarylist, int numparam):
+
+    Prompt for the IDs to vary (first for how many, unless numparam is given) and for the range of each.
+    Returns thingstovary_withrange, empty when none of the IDs is in the catalog.
+    '''
+    if numparam is None:
+        numparam = input('How many parameters to vary? (default 2):')
+        try:
+            numparam = int(numparam)
+        except ValueError:
+            numparam = 2
+        if numparam < 1:
+            numparam = 2
+
+    idstovary = []
+    for ctr in range(numparam):
+        id1 = input('Enter ID of param number '+str(ctr+1)+' :')
+        idstovary.append(int(id1))
+    print(idstovary)
+
+    thingstovary = find_parameters(Evarylist, Widthvarylist, idstovary)
+    thingstovary_withrange = []
+    for thing in thingstovary:
+        if len(thing[1]) == 4:
+            print('Energy found:', thing)
+            name = 'energy'
+        else:
+            print('Width found:', thing)
+            name = 'width'
+        low = float(input('Varying '+name+' at '+str(thing[1])+', enter low value:'))
+        high = float(input('Varying '+name+' at '+str(thing[1])+', enter high value:'))
+        steps = int(input('Varying '+name+' at '+str(thing[1])+', enter # of steps:'))
+        thingstovary_withrange.append(scan_range(thing, low, high, steps))
+    return thingstovary_withrange
+
+
+def new_scan_definition(input_azr_file, thingstovary_withrange, working_azr_file=None, scan_mode='grid',
+                        adaptive_levels=3, adaptive_delta_chi2=2.30, num_samples=256, sampling_seed=0,
+                        warm_start=False, archive_snapshots=False, archive_curves=False, free_widths_only=False):
+    '''
+    new_scan_definition(string input_azr_file, list thingstovary_withrange, string working_azr_file, string scan_mode, ...):
+
+    Definition of a new scan, for run_scan. The values of every parameter run over np.linspace(low, high, steps).
+    working_azr_file defaults to the input file name with '-chi2test' added.
+    With free_widths_only, a scanned width is only written to the lines with FixWidth? = 0 (chi2explore v0.2).
+    '''
+    if scan_mode not in SCAN_MODES:
+        raise ValueError("Unknown scan mode '"+str(scan_mode)+"', use one of "+', '.join(SCAN_MODES))
+    if working_azr_file is None:
+        working_azr_file = input_azr_file[:-4]+'-chi2test.azr'
+    return {'input_azr_file':input_azr_file, 'working_azr_file':working_azr_file,
+            'thingstovary_withrange':[tuple(thing) for thing in thingstovary_withrange],
+            'paramarrays':[np.linspace(thing[2][0], thing[2][1], thing[2][2]) for thing in thingstovary_withrange],
+            'scan_mode':scan_mode, 'adaptive_levels':adaptive_levels, 'adaptive_delta_chi2':adaptive_delta_chi2,
+            'num_samples':num_samples, 'sampling_seed':sampling_seed, 'warm_start':warm_start,
+            'archive_snapshots':archive_snapshots, 'archive_curves':archive_curves, 'free_widths_only':free_widths_only}
+
+
+def load_scan_definition(checkpoint_file='./chi2scan-checkpoint.json'):
+    '''
+    load_scan_definition(string checkpoint_file):
+
+    Returns (definition, set of finished indices) of the scan checkpointed in checkpoint_file, with the defaults of
+    new_scan_definition filled in for checkpoints written by older versions.
+    '''
+    checkpoint = ScanCheckpoint(checkpoint_file)
+    scan_definition, done_indices = checkpoint.load()
+    checkpoint.close()
+    if 'paramarrays' in scan_definition:
+        paramarrays = [np.array(paramarray) for paramarray in scan_definition['paramarrays']]
+    else: #Checkpoint of a two-parameter scan
+        paramarrays = [np.array(scan_definition['param1array']), np.array(scan_definition['param2array'])]
+    definition = new_scan_definition(scan_definition['input_azr_file'], scan_definition['thingstovary_withrange'],
+                                     scan_definition['working_azr_file'], scan_definition.get('scan_mode', 'grid'))
+    for key in definition:
+        if key in scan_definition:
+            definition[key] = scan_definition[key]
+    definition['paramarrays'] = paramarrays
+    return definition, done_indices
+
+
+def _chains(definition, ranges, num_chains):
+    #Warm-started walk, cut into one contiguous chain per worker
+    paramarrays = definition['paramarrays']
+    if definition['scan_mode'] in ('sobol', 'lhs'):
+        if definition['scan_mode'] == 'sobol':
+            points = sobol_points(ranges, definition['num_samples'])
+        else:
+            points = lhs_points(ranges, definition['num_samples'], definition['sampling_seed'])
+        walk = nearest_neighbour_order(points, ranges)
+        numpoints = len(walk)
+        bounds = [numpoints*k//num_chains for k in range(num_chains+1)]
+        return numpoints, [walk[bounds[k]:bounds[k+1]] for k in range(num_chains)]
+    numpoints = grid_size(*paramarrays)
+    bounds = [numpoints*k//num_chains for k in range(num_chains+1)]
+    return numpoints, [serpentine_points(*paramarrays, start=bounds[k], stop=bounds[k+1]) for k in range(num_chains)]
+
+
+def run_scan(definition, executable, done_indices=None, checkpoint_file='./chi2scan-checkpoint.json',
+             num_workers=1, scratch_folder='./chi2scan_workers', chi2search_folder='./chi2search_folder',
+             results_file='chisquared-output.dat', results_array_file='chisquared-output.npy',
+             save_out_files=True, save_azr_files=True, cache_folder=None, cache_max_mb=2000,
+             minimizer_method='nelder-mead', minimizer_xtol=1e-3, minimizer_ftol=1e-2, minimizer_max_evals=100,
+             menu_choice="2", azure_options="--no-gui", wall_timeout=None, cpu_timeout=None, retries=1,
+             learn_timeouts=False, timings_file=None):
+    '''
+    run_scan(dict definition, string executable, set done_indices, string checkpoint_file, int num_workers, ...):
+
+    Run the scan of 'definition' (see new_scan_definition) with the AZURE2 at 'executable', writing the rows
+    (index, p1, p2, .., chi2) to results_file and results_array_file (None for no .npy) as points finish.
+    With done_indices (from load_scan_definition) an interrupted scan is carried on, skipping those points;
+    otherwise the checkpoint is started afresh and the working .azr copied from the input .azr.
+    A shared AZURE2 result cache is used when cache_folder is given.
+    Every AZURE2 run is supervised (see supervisor.RunPolicy): killed past wall_timeout / cpu_timeout seconds (or
+    limits learned from the runs so far, with learn_timeouts) and tried up to 'retries' more times. Points that
+    still fail are listed in chi2search_folder/failed-points.txt.
+    With timings_file, every phase of every point run is timed (see timing.py): the per-point times go to that CSV
+    file and the summary (mean, p50, p95, max per phase) is printed and written next to it as <name>-summary.txt.
+    Returns the result rows of the points run here, sorted by index, or the MinimizeResult in 'minimize' mode.
+    '''
+    input_azr_file = definition['input_azr_file']
+    working_azr_file = definition['working_azr_file']
+    thingstovary_withrange = definition['thingstovary_withrange']
+    paramarrays = definition['paramarrays']
+    scan_mode = definition['scan_mode']
+    warm_start = definition['warm_start']
+
+    checkpoint = ScanCheckpoint(checkpoint_file)
+    resume = done_indices is not None
+    if resume:
+        done_indices = set(done_indices)
+        checkpoint.load()
+    else:
+        shutil.copyfile(input_azr_file, working_azr_file)
+        os.makedirs(chi2search_folder, exist_ok=True)
+        checkpoint.start(definition)
+
+    #Every grid point is generated from the input .azr, so points do not depend on each other and can run in any order
+    #(unless they are warm-started, in which case each point waits for the one before it in its chain).
+    cache = None
+    if cache_folder is not None:
+        cache = ResultCache(cache_folder, cache_max_mb, store_outputs=save_out_files)
+    job = ScanJob(input_azr_file, thingstovary_withrange, executable, menu_choice=menu_choice, azure_options=azure_options,
+                  chi2search_folder=chi2search_folder, save_out_files=save_out_files, save_azr_files=save_azr_files,
+                  cache=cache, warm_start=warm_start,
+                  archive_snapshots=definition['archive_snapshots'], archive_curves=definition['archive_curves'],
+                  policy=RunPolicy(wall_timeout, cpu_timeout, retries, learn_timeouts),
+                  timings=ScanTimings(enabled=timings_file is not None), free_widths_only=definition['free_widths_only'])
+    slots = make_worker_slots(num_workers, working_azr_file, scratch_folder)
+
+    #Rows reach results_file as each point finishes
+    known_chi2 = read_point_totals(results_file) if resume else None
+    results_metadata = {'input_azr_file':input_azr_file, 'scan_mode':scan_mode, 'thingstovary_withrange':thingstovary_withrange,
+                        'segment_values':'Chi-Squared/N from chiSquared.out, in file order'}
+
+    def open_results(keep_indices):
+        #The .npy first: it refuses (ValueError) results it cannot keep, before anything has been opened
+        array = None
+        if results_array_file is not None:
+            array = ResultArray(results_array_file, len(thingstovary_withrange), job.num_segments, results_metadata, keep_indices)
+        writers = [ResultWriter(results_file, keep_indices=keep_indices)]
+        if array is not None:
+            writers.append(array)
+        return ResultTee(*writers)
+
+    ranges = [(paramarray[0], paramarray[-1]) for paramarray in paramarrays]
+    results = None
+    try:
+        if scan_mode == 'minimize':
+            #Evaluations are sequential, so one worker does. A resumed minimization starts over (the result cache makes that cheap).
+            start = [thing[1][0] if thing[3] == "Energy" else thing[1][5] for thing in thingstovary_withrange]
+            results = open_results(None)
+            best = run_minimize(job, slots[0], start, ranges, minimizer_method, minimizer_xtol, minimizer_ftol,
+                                minimizer_max_evals, results)
+            print('Minimum chi2',best.fun,'at',list(best.x),'after',best.nevals,'AZURE2 runs ('+best.message+').')
+            return best
+
+        results = open_results(done_indices)
+        if scan_mode == 'adaptive':
+            lattice = AdaptiveLattice(ranges, [len(paramarray) for paramarray in paramarrays], definition['adaptive_levels'])
+            print('Adaptive scan on',len(slots),'worker(s), down to a',' x '.join(str(n) for n in lattice.shape),'grid..')
+            if warm_start:
+                print('Warm start is not used in adaptive mode, every point starts from the input .azr.')
+            return run_adaptive(job, slots, lattice, definition['adaptive_delta_chi2'], results, checkpoint, done_indices, known_chi2)
+        if warm_start:
+            numpoints, chains = _chains(definition, ranges, len(slots))
+            print('Running',numpoints,scan_mode,'points warm-started, in',len(slots),'chain(s)..')
+            return run_chains(job, slots, chains, results, checkpoint, done_indices)
+
+        if scan_mode == 'sobol':
+            points = sobol_points(ranges, definition['num_samples'])
+            numpoints = definition['num_samples']
+        elif scan_mode == 'lhs':
+            points = lhs_points(ranges, definition['num_samples'], definition['sampling_seed'])
+            numpoints = definition['num_samples']
+        else:
+            points = grid_points(*paramarrays)
+            numpoints = grid_size(*paramarrays)
+        print('Running',numpoints,scan_mode,'points on',len(slots),'worker(s)..')
+        return run_points(job, slots, points, results, checkpoint, done_indices)
+    finally:
+        if results is not None:
+            results.close()
+        checkpoint.close()
+        if timings_file is not None:
+            write_timings(job.timings, timings_file)
+
+
+def write_timings(timings, timings_file):
+    '''
+    write_timings(ScanTimings timings, string timings_file):
+
+    Per-point CSV to timings_file, and the summary table to <name>-summary.txt and the console.
+    '''
+    timings.write_csv(timings_file)
+    summary = timings.summary()
+    with open(os.path.splitext(timings_file)[0]+'-summary.txt', "w") as f:
+        f.write(summary)
+    print('Time per point and phase (details in', timings_file+'):')
+    print(summary, end='')
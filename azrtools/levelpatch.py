@@ -0,0 +1,219 @@
+'''
+levelpatch.py
+
+Precompiled patch template for generating one .azr per grid point.
+
+Only the scanned columns of a few <levels> lines (ExcEnergyChannelMeV / WidthChanneleV) change between
+grid points, so the template .azr is parsed and matched against the scanned parameters once. What is kept
+is the serialized text cut at the fields being varied (and at the two <config> directory lines, so a worker
+can redirect its outputs). Rendering a grid point just splices the new values between the fixed pieces,
+at a cost proportional to the number of varied fields rather than the size of the file.
+
+For warm-started scans the template can also be cut at the energy and width of every level line and at the
+normalization of every segment, so the fitted values of a neighbouring grid point can be spliced in as well.
+'''
+
+import copy
+import re
+
+from .common import levelDict, segmentDict1, segmentDict2
+from .azrfile import azr_to_string, set_output_directories
+from .leveltable import LevelTable
+
+_field = re.compile(r'\S+')
+
+#Placeholders put into the tree before serializing, so the text can be cut where the section contents go
+_LEVELS_MARK = "@@azrtools-levels@@"
+_SEGMENTS_MARK = "@@azrtools-segments@@"
+_section_marks = re.compile('('+re.escape(_LEVELS_MARK)+'|'+re.escape(_SEGMENTS_MARK)+')')
+_OUTPUT_MARK = "@@azrtools-output-dir@@"
+_CHECKS_MARK = "@@azrtools-checks-dir@@"
+_config_marks = re.compile('('+re.escape(_OUTPUT_MARK)+'|'+re.escape(_CHECKS_MARK)+')')
+
+#Hole keys that are not parameter indices
+OUTPUT_DIR = 'output'
+CHECKS_DIR = 'checks'
+#Warm-start hole keys are tuples: (LEVEL_ENERGY, n) and (LEVEL_WIDTH, n) for the n-th level line (from 0),
+#(NORMALIZATION, n) for the n-th segment (from 1, as in normalizations.out)
+LEVEL_ENERGY = 'E'
+LEVEL_WIDTH = 'W'
+NORMALIZATION = 'N'
+
+
+def match_scanned_fields(levels, things, warm_fields=False, table=None, free_widths_only=False):
+    '''
+    match_scanned_fields(string levels, list things, bool warm_fields, LevelTable table, bool free_widths_only):
+
+    Find the fields of the <levels> text that a grid point overwrites. Returns a list of (start, end, k):
+    the character span of the field within 'levels' and the index in 'things' of the value that goes there.
+
+    'things' is the thingstovary_withrange list of chi2explore, with entries (ID, parameter tuple, range, 'Energy' or 'Width').
+    For energies, match E, J and pi, and change the first NumE sublevels found (NumE is stored in the tuple).
+    For widths, match E, J, pi, L, S, W. If the energy of the same state is also scanned, the width's
+    sublevel moves along with it. With free_widths_only, only lines with FixWidth? = 0 get the width (and
+    the energy that moves with it), as chi2explore v0.2 did.
+    With warm_fields, the energy and width fields that are not scanned are returned too, with the keys
+    (LEVEL_ENERGY, n) and (LEVEL_WIDTH, n) in place of k.
+    The lines are found through the indexes of 'table' (built from 'levels' if not given), so only the rows
+    that match are looked at.
+    '''
+    if table is None:
+        table = LevelTable(levels)
+
+    #Index of the scanned energy (if any) that belongs to the same state as each scanned width
+    partner_energy = [None]*len(things)
+    for k, thing in enumerate(things):
+        if thing[3] == "Width":
+            for m, other in enumerate(things):
+                if other[3] == "Energy" and tuple(other[1][:3]) == tuple(thing[1][:3]):
+                    partner_energy[k] = m
+
+    Ecol = levelDict['ExcEnergyChannelMeV']
+    Wcol = levelDict['WidthChanneleV']
+    fixed = table.columns['FixWidth?']
+
+    #Row -> {column -> index of the value written there}. Later matches win, as they did when patching in place.
+    assigned = {}
+    for k, thing in enumerate(things):
+        param = thing[1]
+        if thing[3] == "Energy":
+            for row in table.energy_index.get(tuple(param[:3]), [])[:int(param[3])]: #The first NumE sublevels
+                assigned.setdefault(row, {})[Ecol] = k
+        elif thing[3] == "Width":
+            for row in table.channel_index.get(tuple(param[:5]), []):
+                if table.values[row, Wcol] == param[5] and not (free_widths_only and fixed[row] != 0):
+                    assigned.setdefault(row, {})[Wcol] = k
+                    if partner_energy[k] is not None:
+                        assigned[row][Ecol] = partner_energy[k]
+    if warm_fields:
+        for row in range(len(table)):
+            assigned.setdefault(row, {}).setdefault(Ecol, (LEVEL_ENERGY, row))
+            assigned[row].setdefault(Wcol, (LEVEL_WIDTH, row))
+
+    holes = []
+    for row in sorted(assigned):
+        for col in sorted(assigned[row]):
+            start, end = table.field_span(row, col)
+            holes.append((start, end, assigned[row][col]))
+    return holes
+
+
+def match_normalization_fields(segments):
+    '''
+    match_normalization_fields(string segments):
+
+    Character spans (start, end, (NORMALIZATION, n)) of the normalization of every line of a <segmentsData> text,
+    numbering the segments from 1. The column depends on the data type (phase shifts have two extra columns).
+    '''
+    holes = []
+    linestart = 0
+    n = 1
+    for testsegment in segments.split('\n'):
+        fields = [(m.start(), m.end()) for m in _field.finditer(testsegment)]
+        if len(fields) > 0:
+            datatype = int(testsegment.split()[segmentDict1['DataType']])
+            col = segmentDict2['Normalization'] if datatype == 2 else segmentDict1['Normalization']
+            holes.append((linestart+fields[col][0], linestart+fields[col][1], (NORMALIZATION, n)))
+            n = n + 1
+        linestart = linestart + len(testsegment) + 1
+    return holes
+
+
+class PatchTemplate(object):
+    '''
+    PatchTemplate(ElementTree doc, list things, bool warm_fields, bool free_widths_only):
+
+    The template .azr of a scan, compiled against the parameters being scanned.
+    'doc' is a parsed .azr (see azrfile.read_azr). It is not modified.
+    With warm_fields, every level energy/width and segment normalization can be overridden at render time.
+    With free_widths_only, scanned widths leave the lines with FixWidth? != 0 alone (see match_scanned_fields).
+    '''
+    def __init__(self, doc, things, warm_fields=False, free_widths_only=False):
+        self.things = things
+        self.warm_fields = warm_fields
+
+        root = doc.getroot() if hasattr(doc, "getroot") else doc
+        root = copy.deepcopy(root) #Placeholders go into a copy, not the caller's tree
+        levelloc = root.find('levels')
+        levels = levelloc.text
+        levelloc.text = _LEVELS_MARK
+        self.table = LevelTable(levels)
+        sections = {_LEVELS_MARK: (levels, match_scanned_fields(levels, things, warm_fields, self.table, free_widths_only))}
+        if warm_fields:
+            segmentloc = root.find('segmentsData')
+            if segmentloc is not None and segmentloc.text is not None:
+                sections[_SEGMENTS_MARK] = (segmentloc.text, match_normalization_fields(segmentloc.text))
+                segmentloc.text = _SEGMENTS_MARK
+        try:
+            self.config_lines = set_output_directories(root, _OUTPUT_MARK, _CHECKS_MARK)
+        except (ValueError, AttributeError, IndexError):
+            self.config_lines = None
+        text = azr_to_string(root)
+
+        #Cut the serialized text into fixed pieces and holes, in file order
+        self.pieces = ['']
+        self.keys = []
+        self.defaults = {} #Template text of the warm-start holes
+        for segment in _section_marks.split(text):
+            if segment in sections:
+                section, holes = sections[segment]
+                last = 0
+                for start, end, k in holes:
+                    self._append(section[last:start])
+                    self._hole(k)
+                    if not isinstance(k, int):
+                        self.defaults[k] = section[start:end]
+                    last = end
+                self._append(section[last:])
+            else:
+                self._append(segment)
+        self.num_varied_fields = sum(1 for k in self.keys if isinstance(k, int))
+
+    def _hole(self, key):
+        self.keys.append(key)
+        self.pieces.append('')
+
+    def _append(self, text):
+        #Fixed text, except for the config directory placeholders which become holes
+        for segment in _config_marks.split(text):
+            if segment == _OUTPUT_MARK:
+                self._hole(OUTPUT_DIR)
+            elif segment == _CHECKS_MARK:
+                self._hole(CHECKS_DIR)
+            else:
+                self.pieces[-1] = self.pieces[-1] + segment
+
+    def render(self, values, output_dir=None, checks_dir=None, warm=None):
+        '''
+        render(list values, string output_dir, string checks_dir, dict warm):
+
+        Text of the .azr for one grid point. values[k] goes into every field matched by things[k].
+        Without output_dir/checks_dir the <config> directories of the template are kept.
+        warm maps warm-start hole keys to the text that goes there (see warmstart.py); holes it does not
+        mention keep the template value.
+        '''
+        fill = dict(self.defaults)
+        if warm is not None:
+            fill.update(warm)
+        if self.config_lines is not None:
+            fill[OUTPUT_DIR] = output_dir if output_dir is not None else self.config_lines[0]
+            fill[CHECKS_DIR] = checks_dir if checks_dir is not None else self.config_lines[1]
+        elif output_dir is not None or checks_dir is not None:
+            raise ValueError("The <config> section of the template has no output/checks directory lines to redirect")
+
+        strvalues = [str(v) for v in values]
+        out = [self.pieces[0]]
+        for key, piece in zip(self.keys, self.pieces[1:]):
+            out.append(strvalues[key] if isinstance(key, int) else fill[key])
+            out.append(piece)
+        return ''.join(out)
+
+    def write(self, outfile, values, output_dir=None, checks_dir=None, warm=None):
+        '''
+        write(string outfile, list values, string output_dir, string checks_dir, dict warm):
+
+        Render one grid point and write it to outfile.
+        '''
+        with open(outfile, "w", encoding="utf-8") as fo:
+            fo.write(self.render(values, output_dir, checks_dir, warm))
+
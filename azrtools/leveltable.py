@@ -0,0 +1,176 @@
+'''
+leveltable.py
+
+The <levels> block of an .azr file as a table: one NumPy column per levelDict field, one row per level line,
+with hashed indexes for the lookups the scripts do over and over:
+  energy_index  - (E, J, pi)       -> rows of that energy group (its sublevels, one per channel)
+  channel_index - (E, J, pi, L, S) -> rows of that channel
+  spin_index    - (J, pi, L, S)    -> rows, for matching against parameters.out, whose energies have moved in a fit
+Rows are kept in file order within every index entry. The text of the block is kept as it is, and the character
+span of any field can be looked up, so the k rows found through an index can be patched without touching the rest.
+'''
+
+import re
+
+import numpy as np
+
+from .common import levelDict
+
+_field = re.compile(r'\S+')
+
+NUM_LEVEL_FIELDS = max(levelDict.values()) + 1
+
+
+class LevelTable(object):
+    '''
+    LevelTable(string levels):
+
+    Table of the level lines in a <levels> text. columns[name] is the array of field levelDict[name] (as float,
+    nan where a line is too short); L and S are also given in units of hbar as columns 'L' and 'S'.
+    '''
+    def __init__(self, levels):
+        self.text = levels
+        self.lines = []
+        self.starts = [] #Offset of every line in 'levels'
+        linestart = 0
+        for testlevel in levels.split('\n'):
+            if len(testlevel.strip()) > 0:
+                self.lines.append(testlevel)
+                self.starts.append(linestart)
+            linestart = linestart + len(testlevel) + 1
+
+        self.values = np.full((len(self.lines), NUM_LEVEL_FIELDS), np.nan)
+        for row, testlevel in enumerate(self.lines):
+            for col, field in enumerate(testlevel.split()[:NUM_LEVEL_FIELDS]):
+                try:
+                    self.values[row, col] = float(field)
+                except ValueError:
+                    pass
+        self.columns = dict((name, self.values[:, col]) for name, col in levelDict.items())
+        self.columns['L'] = self.columns['2L']/2.0
+        self.columns['S'] = self.columns['2S']/2.0
+
+        E = self.columns['ExcEnergyChannelMeV'].tolist()
+        J = self.columns['J-channel'].tolist()
+        Pi = self.columns['Pi-channel'].tolist()
+        L = self.columns['L'].tolist()
+        S = self.columns['S'].tolist()
+        self.energy_index = {}
+        self.channel_index = {}
+        self.spin_index = {}
+        for row in range(len(self.lines)):
+            self.energy_index.setdefault((E[row], J[row], Pi[row]), []).append(row)
+            self.channel_index.setdefault((E[row], J[row], Pi[row], L[row], S[row]), []).append(row)
+            self.spin_index.setdefault((J[row], Pi[row], L[row], S[row]), []).append(row)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def key(self, row):
+        '''
+        (J, pi, L, S) of a row.
+        '''
+        return (float(self.columns['J-channel'][row]), float(self.columns['Pi-channel'][row]),
+                float(self.columns['L'][row]), float(self.columns['S'][row]))
+
+    def field_span(self, row, col):
+        '''
+        field_span(int row, int col):
+
+        (start, end) of field 'col' of a row, as character offsets into the <levels> text.
+        '''
+        for n, m in enumerate(_field.finditer(self.lines[row])):
+            if n == col:
+                return (self.starts[row]+m.start(), self.starts[row]+m.end())
+        raise IndexError("Level line "+str(row)+" has no field "+str(col))
+
+    def tokens(self, row):
+        return self.lines[row].split()
+
+    def energy_groups(self):
+        '''
+        Runs of consecutive rows with the same energy, J, pi and FixE? flag, as (E, J, pi, number of rows, last row).
+        '''
+        groups = []
+        values = self.values
+        cols = [levelDict['ExcEnergyChannelMeV'], levelDict['J-channel'], levelDict['Pi-channel'], levelDict['FixE?']]
+        start = 0
+        for row in range(1, len(self.lines)+1):
+            if row == len(self.lines) or any(values[row, c] != values[start, c] for c in cols):
+                E, J, Pi = (float(values[start, c]) for c in cols[:3])
+                groups.append((E, J, Pi, row-start, row-1))
+                start = row
+        return groups
+
+    def varied_energies(self, free_only=False, last_group=True):
+        '''
+        varied_energies(bool free_only, bool last_group):
+
+        Catalog of energies that can be scanned: (E, J, pi, NumE) for every energy group whose last line is
+        included in the calculation, without repeats, in file order. With free_only, only groups not fixed (FixE? = 0).
+        last_group=False leaves out the last group of the file, as the catalog loop of the original scripts did.
+        '''
+        include = self.columns['IncludeLevel?']
+        fixed = self.columns['FixE?']
+        catalog = []
+        seen = set()
+        groups = self.energy_groups()
+        if not last_group:
+            groups = groups[:-1]
+        for E, J, Pi, NumE, last in groups:
+            if (E, J, Pi, NumE) not in seen and include[last] == 1 and not (free_only and fixed[last] != 0):
+                seen.add((E, J, Pi, NumE))
+                catalog.append((E, J, Pi, NumE))
+        return catalog
+
+    def varied_widths(self, free_only=False):
+        '''
+        varied_widths(bool free_only):
+
+        Catalog of widths that can be scanned: (E, J, pi, L, S, W) for every included line, without repeats, in file order.
+        With free_only, only the widths not fixed (FixWidth? = 0).
+        '''
+        include = self.columns['IncludeLevel?']
+        fixed = self.columns['FixWidth?']
+        columns = [self.columns[name].tolist() for name in ('ExcEnergyChannelMeV', 'J-channel', 'Pi-channel', 'L', 'S', 'WidthChanneleV')]
+        catalog = []
+        seen = set()
+        for row in range(len(self.lines)):
+            key = tuple(column[row] for column in columns)
+            if key not in seen and include[row] == 1 and not (free_only and fixed[row] != 0):
+                seen.add(key)
+                catalog.append(key)
+        return catalog
+
+    def channel_rows(self, keys):
+        '''
+        channel_rows(list keys):
+
+        Row of every channel of parameters.out, given their (J, pi, L, S) in file order: the n-th channel with a given
+        key goes to the n-th row with that key. When parameters.out leaves out the lines not included in the
+        calculation, so are the rows. None for a channel without a row.
+        '''
+        counts = {}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        include = self.columns['IncludeLevel?']
+        byKey = {}
+        for key, found in counts.items():
+            rows = self.spin_index.get(key, [])
+            included = [row for row in rows if include[row] == 1]
+            if found == len(included) and found != len(rows):
+                rows = included
+            byKey[key] = iter(rows)
+        return [next(byKey[key], None) for key in keys]
+
+    def merge_parameters(self, alllevellist_param):
+        '''
+        merge_parameters(list alllevellist_param):
+
+        Pair the channels of parameters.out ([J, parity, Energy, Width, s, l], see outfiles.read_parameters_out) with
+        the rows they belong to, as channel_rows does. Returns a list of (row, Energy, Width).
+        '''
+        keys = [(float(J), float(parity), float(ell), float(ess)) for J, parity, Energy, width, ess, ell in alllevellist_param]
+        merged = [(row, level[2], level[3]) for row, level in zip(self.channel_rows(keys), alllevellist_param) if row is not None]
+        merged.sort()
+        return merged
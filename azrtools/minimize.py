@@ -0,0 +1,176 @@
+'''
+minimize.py
+
+Derivative-free minimization of chi2 over parameters that AZURE2's own fit keeps fixed.
+
+The objective is "patch the .azr -> run AZURE2 -> read chiSquared.out", so every evaluation is expensive and
+noisy in the last digits. Two methods that only compare function values are provided:
+  nelder_mead    - simplex search over any number of parameters, kept inside the scan box by clipping
+  golden_section - bracketing search for a single parameter
+Both stop on a tolerance in the parameters (relative to the box size) or in chi2, or when the evaluation budget
+is used up. Repeated points (e.g. after clipping to the box) are answered from memory instead of rerunning AZURE2.
+'''
+
+import numpy as np
+
+GOLDEN = (np.sqrt(5.0) - 1.0)/2.0
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class MinimizeResult(object):
+    '''
+    MinimizeResult(array x, float fun, int nevals, bool converged, string message)
+
+    Best point found, its chi2, the number of AZURE2 evaluations spent and why the search stopped.
+    '''
+    def __init__(self, x, fun, nevals, converged, message):
+        self.x = x
+        self.fun = fun
+        self.nevals = nevals
+        self.converged = converged
+        self.message = message
+
+    def __repr__(self):
+        return "MinimizeResult(x="+str(list(self.x))+", fun="+str(self.fun)+", nevals="+str(self.nevals)+", "+self.message+")"
+
+
+class _Objective(object):
+    #Counts evaluations, remembers every point seen and enforces the budget
+    def __init__(self, f, bounds, max_evals):
+        self.f = f
+        self.low = np.array([b[0] for b in bounds], dtype=float)
+        self.high = np.array([b[1] for b in bounds], dtype=float)
+        self.max_evals = max_evals
+        self.memo = {}
+        self.nevals = 0
+        self.best_x = None
+        self.best_f = np.inf
+
+    def clip(self, x):
+        return np.minimum(np.maximum(np.asarray(x, dtype=float), self.low), self.high)
+
+    def __call__(self, x):
+        x = self.clip(x)
+        key = tuple(x)
+        if key in self.memo:
+            return self.memo[key]
+        if self.nevals >= self.max_evals:
+            raise BudgetExhausted()
+        self.nevals = self.nevals + 1
+        fx = float(self.f(x))
+        if not np.isfinite(fx):
+            fx = np.inf #A failed run is never the minimum
+        self.memo[key] = fx
+        if fx < self.best_f:
+            self.best_x, self.best_f = x, fx
+        return fx
+
+
+def nelder_mead(f, x0, bounds, step=0.1, xtol=1e-3, ftol=1e-2, max_evals=100):
+    '''
+    nelder_mead(function f, list x0, list bounds, float step, float xtol, float ftol, int max_evals):
+
+    Minimize f over the box bounds[k] = (low, high), starting from x0. The initial simplex steps 'step' times the
+    box size along each parameter. Converged when all vertices are within xtol (times the box size) of the best one
+    and their chi2 values within ftol of the best.
+    '''
+    obj = _Objective(f, bounds, max_evals)
+    x0 = obj.clip(x0)
+    span = obj.high - obj.low
+    span[span == 0] = 1.0
+    n = len(x0)
+
+    try:
+        simplex = [x0]
+        for k in range(n):
+            x = x0.copy()
+            x[k] = x[k] + step*span[k]
+            if x[k] > obj.high[k]: #Step the other way at the upper edge of the box
+                x[k] = x0[k] - step*span[k]
+            simplex.append(obj.clip(x))
+        fvals = [obj(x) for x in simplex]
+
+        while True:
+            order = np.argsort(fvals)
+            simplex = [simplex[i] for i in order]
+            fvals = [fvals[i] for i in order]
+
+            xspread = max(np.max(np.abs((x - simplex[0])/span)) for x in simplex[1:])
+            fspread = max(abs(fv - fvals[0]) for fv in fvals[1:])
+            if xspread <= xtol and fspread <= ftol:
+                return MinimizeResult(simplex[0], fvals[0], obj.nevals, True, "converged")
+
+            centroid = np.mean(simplex[:-1], axis=0)
+            xr = obj.clip(centroid + (centroid - simplex[-1]))
+            fr = obj(xr)
+            if fr < fvals[0]:
+                xe = obj.clip(centroid + 2.0*(centroid - simplex[-1]))
+                fe = obj(xe)
+                if fe < fr:
+                    simplex[-1], fvals[-1] = xe, fe
+                else:
+                    simplex[-1], fvals[-1] = xr, fr
+            elif fr < fvals[-2]:
+                simplex[-1], fvals[-1] = xr, fr
+            else:
+                if fr < fvals[-1]:
+                    xc = obj.clip(centroid + 0.5*(xr - centroid)) #Outside contraction
+                else:
+                    xc = obj.clip(centroid + 0.5*(simplex[-1] - centroid)) #Inside contraction
+                fc = obj(xc)
+                if fc < min(fr, fvals[-1]):
+                    simplex[-1], fvals[-1] = xc, fc
+                else:
+                    #Shrink towards the best vertex
+                    for i in range(1, len(simplex)):
+                        simplex[i] = obj.clip(simplex[0] + 0.5*(simplex[i] - simplex[0]))
+                        fvals[i] = obj(simplex[i])
+    except BudgetExhausted:
+        return MinimizeResult(obj.best_x, obj.best_f, obj.nevals, False, "evaluation budget used up")
+
+
+def golden_section(f, bounds, xtol=1e-3, max_evals=100):
+    '''
+    golden_section(function f, list bounds, float xtol, int max_evals):
+
+    Minimize a function of one parameter over bounds = [(low, high)] by golden-section search.
+    Converged when the bracket is narrower than xtol times the box size. f takes a one-element array.
+    '''
+    obj = _Objective(f, bounds, max_evals)
+    a, b = obj.low[0], obj.high[0]
+    tol = xtol*(b - a)
+    try:
+        c = b - GOLDEN*(b - a)
+        d = a + GOLDEN*(b - a)
+        fc = obj([c])
+        fd = obj([d])
+        while b - a > tol:
+            if fc < fd:
+                b, d, fd = d, c, fc
+                c = b - GOLDEN*(b - a)
+                fc = obj([c])
+            else:
+                a, c, fc = c, d, fd
+                d = a + GOLDEN*(b - a)
+                fd = obj([d])
+        return MinimizeResult(obj.best_x, obj.best_f, obj.nevals, True, "converged")
+    except BudgetExhausted:
+        return MinimizeResult(obj.best_x, obj.best_f, obj.nevals, False, "evaluation budget used up")
+
+
+def minimize(f, x0, bounds, method="nelder-mead", xtol=1e-3, ftol=1e-2, max_evals=100, step=0.1):
+    '''
+    minimize(function f, list x0, list bounds, string method, ...):
+
+    Dispatch to nelder_mead or golden_section ('golden', one parameter only).
+    '''
+    if method == "golden":
+        if len(bounds) != 1:
+            raise ValueError("Golden-section search works on one parameter, use nelder-mead for more")
+        return golden_section(f, bounds, xtol, max_evals)
+    elif method == "nelder-mead":
+        return nelder_mead(f, x0, bounds, step, xtol, ftol, max_evals)
+    raise ValueError("Unknown minimization method: "+str(method))
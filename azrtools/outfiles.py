@@ -0,0 +1,159 @@
+'''
+outfiles.py
+
+Readers for the text files AZURE2 writes to its output directory.
+  iter_parameters_out     - channels of parameters.out, one at a time, in a single pass over the file
+  read_parameters_out     - the same as the [J, parity, Energy, Width, s, l] lists the scripts always used
+  read_parameters_arrays  - the same as NumPy arrays, with g_int and g_ext
+  read_normalizations_out - fitted segment normalizations of normalizations.out
+  read_chisquared_out     - per-segment Chi-Squared/N and total chi2 of chiSquared.out
+
+All readers take a path or an open text file (e.g. an io.StringIO of a file rebuilt from a snapshot archive).
+'''
+
+import itertools
+import re
+
+import numpy as np
+
+#Unit factors to eV, looked up by the unit token itself
+UNITS_EV = {'meV':1e-3, 'eV':1.0, 'keV':1e3, 'MeV':1e6, 'GeV':1e9}
+
+#  R = 1 l = 3 s = 2.0 G = 0.000000 meV g_int = 0.000000 MeV^(1/2) g_ext = (0.000000,0.000000) MeV^(1/2)
+_channel = re.compile(r'g_int\s*=\s*(\S+)\s+\S+\s+g_ext\s*=\s*\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)')
+
+
+def _lines(source):
+    if hasattr(source, "read"):
+        for line in source:
+            yield line
+    else:
+        with open(source, "r") as f:
+            for line in f:
+                yield line
+
+
+def unit_factor(unitstr):
+    '''
+    unit_factor(string unitstr):
+
+    Factor that converts a value in unit 'unitstr' to eV.
+    '''
+    try:
+        return UNITS_EV[unitstr]
+    except KeyError:
+        #Unit glued to something else: same rule as common.read_proper_units
+        for key in sorted(UNITS_EV.keys(), key=len, reverse=True):
+            if key in unitstr:
+                return UNITS_EV[key]
+    raise ValueError("Unknown energy unit '"+unitstr+"' in parameters.out")
+
+
+def iter_parameters_out(param_out_path_file):
+    '''
+    iter_parameters_out(string param_out_path_file):
+
+    Yields (J, parity, Energy (MeV), Width (eV), s, l, g_int, g_ext) for every channel of parameters.out, in file
+    order. g_int and g_ext (complex) are in the units of the file (MeV^(1/2)), nan where a line does not have them.
+    The file is read line by line and never held in memory.
+    '''
+    inlevel = False
+    for line in itertools.islice(_lines(param_out_path_file), 2, None): #Skip 2-line header in parameters.out
+        if inlevel:
+            if len(line) < 4: #A line with only '\n' separates levels
+                inlevel = False
+            elif 's =' in line:
+                array2 = line.split()
+                #Index:                                         5               8               11          12
+                #array2 dictionary = ['R', '=', '1', 'l', '=', '3', 's', '=', '2.0', 'G', '=', '0.000000', 'meV', 'g_int', '=', '0.000000', 'MeV^(1/2)', 'g_ext', '=', '(0.000000,0.000000)', 'MeV^(1/2)']
+                ell = float(array2[5])
+                ess = float(array2[8])
+                width = float(array2[11])*unit_factor(array2[12]) #Width in eV, as the .azr file wants it
+                match = _channel.search(line)
+                if match is not None:
+                    g_int = float(match.group(1))
+                    g_ext = complex(float(match.group(2)), float(match.group(3)))
+                else:
+                    g_int = np.nan
+                    g_ext = complex(np.nan, np.nan)
+                yield (J, parity, Energy, width, ess, ell, g_int, g_ext)
+        elif 'J' in line:
+            #If the line has J-pi, E values
+            array = line.split()
+            if '-' in array[2]:
+                parity = -1
+                J = float(array[2].replace('-', ''))
+            elif '+' in array[2]:
+                parity = +1
+                J = float(array[2].replace('+', ''))
+            else:
+                raise ValueError("Error reading parity from '"+line.strip()+"' in parameters.out")
+            Energy = float(array[5])*unit_factor(array[6])/1.0e6 #Convert energy to MeV no matter what units it comes in
+            inlevel = len(line) >= 4
+
+
+def read_parameters_out(param_out_path_file):
+    '''
+    read_parameters_out(string param_out_path_file):
+
+    Returns one entry [J, parity, Energy (MeV), Width (eV), s, l] per channel in parameters.out, in file order.
+    '''
+    return [list(channel[:6]) for channel in iter_parameters_out(param_out_path_file)]
+
+
+#Columns of read_parameters_arrays, in the order of iter_parameters_out
+PARAMETER_COLUMNS = ('J', 'parity', 'E', 'width', 's', 'l', 'g_int', 'g_ext')
+
+
+def read_parameters_arrays(param_out_path_file):
+    '''
+    read_parameters_arrays(string param_out_path_file):
+
+    Returns {column: array} for the columns in PARAMETER_COLUMNS, one element per channel. E is in MeV,
+    width in eV, parity is +1/-1 and g_ext is complex.
+    '''
+    columns = [[] for name in PARAMETER_COLUMNS]
+    for channel in iter_parameters_out(param_out_path_file):
+        for column, value in zip(columns, channel):
+            column.append(value)
+    dtypes = (float, int, float, float, float, float, float, complex)
+    return dict((name, np.array(column, dtype=dtype)) for name, column, dtype in zip(PARAMETER_COLUMNS, columns, dtypes))
+
+
+def read_normalizations_out(normalization_out_path_file):
+    '''
+    read_normalizations_out(string normalization_out_path_file):
+
+    Returns [segment number, normalization] (both as strings) for every segment in normalizations.out.
+    '''
+    allnormlist = []
+    for line in _lines(normalization_out_path_file):
+        array = line.split()
+        #Array output would look like 'Segment','Key','#n','1.043'. We store segment# 'n' and the normalization.
+        if len(array) > 0:
+            allnormlist.append([array[2].replace('#', ''), array[3]])
+    return allnormlist
+
+
+def read_chisquared_out(chi2_out_path_file):
+    '''
+    read_chisquared_out(string chi2_out_path_file):
+
+    Returns [segment, value] for every line of chiSquared.out that holds a chi2, in file order:
+    'Segment #2 Chi-Squared/N: 76.383' gives ['2', 76.383] and 'Total Chi-Squared: 6339.79' gives ['Total', 6339.79].
+    Header and blank lines are skipped.
+    '''
+    allchi2list = []
+    for line in _lines(chi2_out_path_file):
+        array = line.split()
+        if len(array) < 2 or 'Chi-Squared' not in line:
+            continue
+        try:
+            value = float(array[-1])
+        except ValueError:
+            continue #Header line
+        if array[0] == 'Segment':
+            allchi2list.append([array[1].replace('#', ''), value])
+        else:
+            allchi2list.append([array[0], value])
+    return allchi2list
@@ -0,0 +1,276 @@
+'''
+prettyprint.py
+
+What pretty_printer does: turn the parameters.out, normalizations.out and chiSquared.out of a fit into tab-separated
+tables of levels (Energy, J, pi, L, S, Width in keV), normalizations and chi2.
+  level_line     - one row of the level table
+  channel_filter - predicate choosing the channels that go to an output (dummy levels, zero widths, lines the .azr
+                   does not include)
+  include_flags  - IncludeLevel? of the .azr line behind every channel of parameters.out
+  pair_chi2      - (segment, Chi-Squared/N, chi2) rows from read_chisquared_out
+  pretty_print   - stream parameters.out once into any number of filtered tables (by default the three
+                   parsed-level-width tables)
+  find_runs      - the fits under a list of output directories and/or scan folders
+  aggregate_runs - one table over many fits, parsed concurrently: a row per fit and channel, with the
+                   normalizations and chi2 of the fit joined on
+  write_table    - write such a table as tab-separated text, CSV or a NumPy .npz (one array per column)
+'''
+
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .azrfile import read_azr
+from .leveltable import LevelTable
+from .outfiles import iter_parameters_out, read_normalizations_out, read_chisquared_out, read_parameters_arrays
+
+TABLE_HEADER = "Energy(MeV)\tJ\tpi\tL\tS\tWidth(keV)\n"
+
+#Levels parked at 20 MeV with zero width are placeholders
+DUMMY_LEVEL_ENERGY = 20
+
+#Output files are written through a buffer this large, not line by line
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def level_line(level):
+    '''
+    level_line(list level):
+
+    Table row of a [J, parity, Energy, Width, s, l] channel (see outfiles.read_parameters_out / iter_parameters_out).
+    '''
+    return str(level[2])+'\t'+str(int(level[0]))+'\t'+str(level[1])+'\t'+str(level[5])+'\t'+str(level[4])+'\t'+str(level[3]/1.0e3)+'\n'
+
+
+def is_dummy_level(level, dummy_energy=DUMMY_LEVEL_ENERGY, at_or_above=False):
+    if at_or_above:
+        return int(level[2]) >= dummy_energy and int(level[3]) == 0
+    return int(level[2]) == dummy_energy and int(level[3]) == 0
+
+
+def channel_filter(keep_dummy=True, keep_zero_width=True, dummy_energy=DUMMY_LEVEL_ENERGY, dummy_at_or_above=False,
+                   keep_excluded=True):
+    '''
+    channel_filter(bool keep_dummy, bool keep_zero_width, float dummy_energy, bool dummy_at_or_above, bool keep_excluded):
+
+    Predicate on a channel of iter_parameters_out, for the outputs of pretty_print. keep_dummy=False drops the
+    zero-width placeholder levels at dummy_energy (MeV, compared as int(E) == dummy_energy as pretty_printer always
+    did; with dummy_at_or_above, every zero-width level at or above it). keep_zero_width=False drops every channel of
+    zero width. keep_excluded=False drops the channels whose .azr line has IncludeLevel? = 0, which needs pretty_print
+    to be given the .azr file.
+    '''
+    def keep(level):
+        if not keep_dummy and is_dummy_level(level, dummy_energy, dummy_at_or_above):
+            return False
+        if not keep_zero_width and not np.abs(level[3]) > 0:
+            return False
+        if not keep_excluded and len(level) > 8 and level[8] == 0:
+            return False
+        return True
+    return keep
+
+
+def include_flags(azr_file, param_out_path_file):
+    '''
+    include_flags(string azr_file, string param_out_path_file):
+
+    IncludeLevel? (1 or 0) of the .azr line behind every channel of parameters.out, in file order, the channels
+    being matched to lines as parameters2azr does (see LevelTable.channel_rows). 1 for a channel without a line.
+    '''
+    levels = read_azr(azr_file).find('levels')
+    table = LevelTable(levels.text if levels is not None and levels.text else "")
+    keys = [(float(J), float(parity), float(ell), float(ess))
+            for J, parity, Energy, width, ess, ell, g_int, g_ext in iter_parameters_out(param_out_path_file)]
+    include = table.columns['IncludeLevel?']
+    return [1 if row is None else int(include[row]) for row in table.channel_rows(keys)]
+
+
+#The three tables pretty_printer always wrote: every level, no dummy levels, only non-zero widths
+DEFAULT_OUTPUTS = (("parsed-level-width.txt", channel_filter()),
+                   ("parsed-level-width2.txt", channel_filter(keep_dummy=False)),
+                   ("parsed-level-width3.txt", channel_filter(keep_dummy=False, keep_zero_width=False)))
+
+
+def pair_chi2(allchi2list):
+    '''
+    pair_chi2(list allchi2list):
+
+    [n, Chi-Squared/N, chi2] for every segment line of read_chisquared_out, n counting the segments from 1 and
+    chi2 being the first 'Total' line after it.
+    '''
+    paired = []
+    waiting = []
+    for label, value in allchi2list:
+        if label == 'Total':
+            for chi2overN in waiting:
+                paired.append([len(paired)+1, chi2overN, value])
+            waiting = []
+        else:
+            waiting.append(value)
+    return paired
+
+
+def pretty_print(param_out_path_file, normalization_out_path_file, chi2_out_path_file, outputs=DEFAULT_OUTPUTS,
+                 azr_file=None):
+    '''
+    pretty_print(string param_out_path_file, string normalization_out_path_file, string chi2_out_path_file, list outputs,
+                 string azr_file):
+
+    Write the level, normalization and chi2 tables of a fit to every (path, predicate) of 'outputs'. A channel goes to
+    the outputs whose predicate (see channel_filter) is true for its (J, parity, E, Width, s, l, g_int, g_ext), with
+    the IncludeLevel? of its line appended when azr_file is given (see include_flags; parameters.out is then read
+    once more up front to match its channels to the lines).
+    parameters.out is streamed: each channel is parsed and formatted once, whatever the number of outputs.
+    Returns (channels written to each output, normalizations, chi2) with the last two as written.
+    '''
+    #Segment# 'n' and the normalization, both as strings
+    allnormlist = read_normalizations_out(normalization_out_path_file)
+    allchi2list = pair_chi2(read_chisquared_out(chi2_out_path_file))
+    footer = "Norm:\n" + ''.join(str(norm[0])+'\t'+str(norm[1])+'\n' for norm in allnormlist)
+    footer += "Chi2:\n" + ''.join(str(chi2[0])+'\t'+str(chi2[1])+'\t'+str(chi2[2])+'\n' for chi2 in allchi2list)
+
+    files = []
+    counts = [0]*len(outputs)
+    try:
+        for path, predicate in outputs:
+            files.append(open(path, "w", buffering=WRITE_BUFFER_BYTES))
+            files[-1].write(TABLE_HEADER)
+        writes = [(k, f.write, predicate) for k, (f, (path, predicate)) in enumerate(zip(files, outputs))]
+        flags = iter(include_flags(azr_file, param_out_path_file)) if azr_file is not None else None
+        #Remember this order - ('J','pi','Energy','Width','s,'l', g_int, g_ext[, IncludeLevel?])
+        for level in iter_parameters_out(param_out_path_file):
+            if flags is not None:
+                level = level + (next(flags),)
+            line = None
+            for k, write, predicate in writes:
+                if predicate(level):
+                    if line is None:
+                        line = level_line(level)
+                    write(line)
+                    counts[k] += 1
+        for f in files:
+            f.write(footer)
+    finally:
+        for f in files:
+            f.close()
+    return counts, allnormlist, allchi2list
+
+
+_point_file = re.compile(r'^parameters-(\d+)\.out$')
+
+
+def find_runs(paths):
+    '''
+    find_runs(list paths):
+
+    (run, parameters file, normalizations file, chiSquared file) for every fit found under 'paths'. A directory
+    holding parameters.out (e.g. ./output/) is one run, named after the directory; parameters-N.out files (e.g. in
+    chi2search_folder) are one run each, named N. Directories are walked, so a folder of scans can be given.
+    Files that are missing are None.
+    '''
+    def existing(folder, names):
+        return tuple(os.path.join(folder, name) if name in files else None for name in names)
+
+    runs = []
+    seen = set()
+    for path in paths:
+        for folder, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            files = set(filenames)
+            if "parameters.out" in files and folder not in seen:
+                seen.add(folder)
+                runs.append((folder,) + existing(folder, ("parameters.out", "normalizations.out", "chiSquared.out")))
+            points = sorted(int(m.group(1)) for m in (_point_file.match(name) for name in filenames) if m)
+            for index in points:
+                run = os.path.join(folder, str(index))
+                if run not in seen:
+                    seen.add(run)
+                    runs.append((run,) + existing(folder, ("parameters-%d.out" % index, "normalizations-%d.out" % index, "chiSquared-%d.out" % index)))
+    return runs
+
+
+def read_run(run):
+    '''
+    read_run(tuple run):
+
+    Parse one entry of find_runs. Returns (run name, parameter arrays, {segment: normalization},
+    {segment: Chi-Squared/N}, total chi2), or None when its parameters file cannot be read.
+    '''
+    name, param_out, norm_out, chi2_out = run
+    try:
+        arrays = read_parameters_arrays(param_out)
+        norms = {}
+        if norm_out is not None:
+            for segment, norm in read_normalizations_out(norm_out):
+                norms[int(segment)] = float(norm)
+        chi2overN = {}
+        total = np.nan
+        if chi2_out is not None:
+            for label, value in read_chisquared_out(chi2_out):
+                if label == 'Total':
+                    total = value
+                else:
+                    chi2overN[int(label)] = value
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return name, arrays, norms, chi2overN, total
+
+
+def aggregate_runs(runs, processes=None):
+    '''
+    aggregate_runs(list runs, int processes):
+
+    Parse every run of find_runs on 'processes' worker processes (all cores by default, 1 to stay in this process)
+    and join them into one table: {column: array}, one row per run and channel, with the columns
+    run, channel, E_MeV, J, pi, L, S, width_keV, g_int, g_ext_re, g_ext_im, norm_1.., chi2_over_n_1.. and chi2_total.
+    Normalization and chi2 columns are nan where a run has no value. Returns (table, runs that could not be read).
+    '''
+    if processes == 1 or len(runs) < 2:
+        parsed = [read_run(run) for run in runs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            chunksize = max(1, len(runs)//(4*(processes or os.cpu_count() or 1)))
+            parsed = list(pool.map(read_run, runs, chunksize=chunksize))
+    failed = [run[0] for run, result in zip(runs, parsed) if result is None]
+    parsed = [result for result in parsed if result is not None]
+
+    segments = sorted(set(k for result in parsed for k in list(result[2].keys()) + list(result[3].keys())))
+    lengths = [len(result[1]['E']) for result in parsed]
+    table = {}
+    table['run'] = np.repeat(np.array([result[0] for result in parsed], dtype=str), lengths)
+    table['channel'] = np.concatenate([np.arange(1, n+1) for n in lengths]) if parsed else np.zeros(0, dtype=int)
+    columns = (('E_MeV', 'E'), ('J', 'J'), ('pi', 'parity'), ('L', 'l'), ('S', 's'), ('width_keV', 'width'), ('g_int', 'g_int'))
+    for column, key in columns:
+        table[column] = np.concatenate([result[1][key] for result in parsed]) if parsed else np.zeros(0)
+    table['width_keV'] = table['width_keV']/1.0e3
+    g_ext = np.concatenate([result[1]['g_ext'] for result in parsed]) if parsed else np.zeros(0, dtype=complex)
+    table['g_ext_re'] = g_ext.real
+    table['g_ext_im'] = g_ext.imag
+    for prefix, part in (('norm_', 2), ('chi2_over_n_', 3)):
+        for k in segments:
+            table[prefix+str(k)] = np.repeat([result[part].get(k, np.nan) for result in parsed], lengths).astype(float)
+    table['chi2_total'] = np.repeat([result[4] for result in parsed], lengths).astype(float)
+    return table, failed
+
+
+def write_table(table, path):
+    '''
+    write_table(dict table, string path):
+
+    Write a table of aggregate_runs (column order kept): .npz holds one array per column, .csv is comma-separated,
+    anything else tab-separated text like the parsed-level-width tables.
+    '''
+    names = list(table.keys())
+    if path.endswith('.npz'):
+        np.savez_compressed(path, **table)
+        return
+    delimiter = ',' if path.endswith('.csv') else '\t'
+    columns = [table[name].tolist() for name in names]
+    with open(path, "w", newline='') as f:
+        writer = csv.writer(f, delimiter=delimiter, lineterminator='\n')
+        writer.writerow(names)
+        for row in zip(*columns):
+            writer.writerow(row)
@@ -0,0 +1,178 @@
+'''
+resultarray.py
+
+Scan results as a NumPy structured array: one record per point, with the point index, one column per scanned
+parameter (p1, p2, ..), the total chi2 and the Chi-Squared/N of every segment as a fixed-width vector
+(NaN where chiSquared.out had no value).
+
+    chisquared-output.npy  - the array, sorted by index, one record per point
+    chisquared-output.json - sidecar: column names, scanned parameters, number of segments, ...
+
+While the scan runs, records are appended to chisquared-output.npy.part (raw records, flushed after every point),
+so an interrupted scan loses nothing; close() turns that into the .npy file. The record layout of the journal is
+kept next to it in chisquared-output.npy.part.json, so that a resumed scan never reads it with another one. load_results() maps the .npy file
+into memory instead of reading it, so campaigns of 10^5 points can be sliced without loading them.
+'''
+
+import json
+import os
+
+import numpy as np
+
+from .scanstate import _jsonable, _sync
+
+#Records are copied from the journal to the .npy file this many at a time
+_CHUNK = 65536
+
+
+def result_dtype(num_params, num_segments):
+    '''
+    result_dtype(int num_params, int num_segments):
+
+    dtype of a scan record: index, p1 .. pN, chi2, segment_chi2_over_n[num_segments].
+    '''
+    fields = [('index', '<i8')]
+    fields.extend(('p'+str(k+1), '<f8') for k in range(num_params))
+    fields.append(('chi2', '<f8'))
+    fields.append(('segment_chi2_over_n', '<f8', (max(1, num_segments),)))
+    return np.dtype(fields)
+
+
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _layout(dtype):
+    #Record layout as saved next to a journal
+    return _jsonable(np.lib.format.dtype_to_descr(dtype))
+
+
+def _read_layout(part):
+    #Layout the journal 'part' was written with, or None for a journal saved without it
+    if not os.path.exists(part + ".json"):
+        return None
+    with open(part + ".json", "r") as f:
+        return json.load(f)['descr']
+
+
+class ResultArray(object):
+    '''
+    ResultArray(string path, int num_params, int num_segments, dict metadata, set keep_indices):
+
+    Writer for the .npy results of a scan. metadata goes into the JSON sidecar. With keep_indices (when resuming),
+    the records of those points are kept from the journal (or from a finished .npy file); without it, the
+    results start afresh. Raises ValueError when the journal or the finished .npy file holds records of another
+    layout (number of parameters or segments), since the points it has could not be kept and would never be run again.
+    '''
+    def __init__(self, path, num_params, num_segments, metadata=None, keep_indices=None):
+        self.path = path
+        self.part = path + ".part"
+        self.dtype = result_dtype(num_params, num_segments)
+        self.num_segments = self.dtype['segment_chi2_over_n'].shape[0]
+        self.metadata = dict(metadata or {})
+        kept = None
+        if keep_indices is not None:
+            if os.path.exists(self.part):
+                layout = _read_layout(self.part)
+                if layout is not None and layout != _layout(self.dtype):
+                    raise ValueError(self.part+" holds records of another scan layout ("+str(layout)+", this scan "
+                                     "writes "+str(_layout(self.dtype))+"); move it away or start the scan afresh")
+                old = np.fromfile(self.part, dtype=self.dtype, count=os.path.getsize(self.part)//self.dtype.itemsize)
+            elif os.path.exists(self.path):
+                old = np.load(self.path)
+                if old.dtype != self.dtype:
+                    raise ValueError(self.path+" holds records of another scan layout ("+str(old.dtype)+", this scan "
+                                     "writes "+str(self.dtype)+"); move it away or start the scan afresh")
+            else:
+                old = np.zeros(0, dtype=self.dtype)
+                if len(keep_indices) > 0:
+                    print('Warning:', self.path, 'not found, the', len(keep_indices), 'points done before will only be in the text results.')
+            kept = old[np.isin(old['index'], list(keep_indices))]
+        tmp = self.part + ".json.tmp"
+        with open(tmp, "w") as f:
+            json.dump({'descr': _layout(self.dtype)}, f)
+            _sync(f)
+        os.replace(tmp, self.part + ".json")
+        self.f = open(self.part, "wb")
+        if kept is not None:
+            self.f.write(kept.tobytes())
+        _sync(self.f)
+
+    def record(self, rows):
+        '''
+        record(list rows):
+
+        Record of one point from its chisquared-output.dat rows (index, p1, .., chi2), one row per value of
+        chiSquared.out: the last one is the total, those before it the segments.
+        '''
+        rec = np.zeros(1, dtype=self.dtype)
+        rec['index'] = int(rows[0][0])
+        for k, value in enumerate(rows[0][1:-1]):
+            rec['p'+str(k+1)] = value
+        rec['chi2'] = rows[-1][-1]
+        segments = np.full(self.num_segments, np.nan)
+        values = [row[-1] for row in rows[:-1]][:self.num_segments]
+        segments[:len(values)] = values
+        rec['segment_chi2_over_n'][0] = segments
+        return rec
+
+    def write_point(self, rows):
+        '''
+        Append the record of one point to the journal and flush it to disk.
+        '''
+        if len(rows) == 0:
+            return
+        self.f.write(self.record(rows).tobytes())
+        _sync(self.f)
+
+    def close(self, sort=True):
+        '''
+        Write the .npy file (sorted by index, keeping the last record of a point written twice) and its sidecar.
+        '''
+        self.f.close()
+        count = os.path.getsize(self.part)//self.dtype.itemsize
+        if count > 0:
+            journal = np.memmap(self.part, dtype=self.dtype, mode="r", shape=(count,))
+            order = np.argsort(journal['index'], kind='stable')
+            indices = journal['index'][order]
+            order = order[np.r_[indices[1:] != indices[:-1], True]] #Last record of each index
+        else:
+            journal = np.zeros(0, dtype=self.dtype)
+            order = np.zeros(0, dtype=int)
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (len(order),)}
+            np.lib.format.write_array_header_1_0(f, header)
+            for start in range(0, len(order), _CHUNK):
+                f.write(np.asarray(journal[order[start:start+_CHUNK]]).tobytes())
+            _sync(f)
+        del journal
+        os.replace(tmp, self.path)
+
+        metadata = dict(self.metadata)
+        metadata['columns'] = list(self.dtype.names)
+        metadata['num_points'] = int(len(order))
+        metadata['num_segments'] = int(self.num_segments)
+        tmp = sidecar_path(self.path) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(_jsonable(metadata), f, indent=1)
+            _sync(f)
+        os.replace(tmp, sidecar_path(self.path))
+        os.remove(self.part)
+        os.remove(self.part + ".json")
+
+
+def load_results(path, mmap=True):
+    '''
+    load_results(string path, bool mmap):
+
+    Returns (array, metadata) for a scan saved by ResultArray. With mmap the array is mapped read-only from the
+    file, so only the records that are used are read from disk.
+    '''
+    array = np.load(path, mmap_mode="r" if mmap else None)
+    metadata = {}
+    if os.path.exists(sidecar_path(path)):
+        with open(sidecar_path(path), "r") as f:
+            metadata = json.load(f)
+    return array, metadata
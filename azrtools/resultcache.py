@@ -0,0 +1,219 @@
+'''
+resultcache.py
+
+Persistent cache of AZURE2 results, shared by every scan on the machine.
+
+An entry is keyed by a SHA-256 of the effective .azr text of a grid point (everything AZURE2 reads from it,
+with the per-worker output/checks directories blanked out), the run mode and a salt for the data files the
+segments point to. It holds the parsed chi2 values and, optionally, copies of the output files.
+
+Layout under the cache folder:
+    entries/ab/abcdef.../result.json   - chi2 values and the list of stored output files
+    entries/ab/abcdef.../<output files>
+    tmp/                                - entries being written or deleted
+    lock                                - flock'ed while evicting
+
+Entries are built in tmp/ and moved into place with one rename, so a reader in another process sees either
+a complete entry or none. Every hit touches result.json, and eviction removes the entries with the oldest
+result.json first (least recently used) until the cache is back under its size limit.
+
+Eviction walks the whole cache under the lock, so it is not done on every store: a cache object keeps a running
+estimate of the cache size (the size found by its last eviction plus what it stored since) and evicts when that
+goes over the limit, or every EVICT_EVERY stores to take in what other processes stored meanwhile.
+'''
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+RESULT_NAME = "result.json"
+
+#Stores between two evictions even when the size estimate stays under the limit
+EVICT_EVERY = 100
+
+#Eviction goes down to this fraction of the limit, so that a full cache is not walked again at the next store
+EVICT_TO = 0.9
+
+
+def segment_data_salt(segments_text, basedir="."):
+    '''
+    segment_data_salt(string segments_text, string basedir):
+
+    Hash of the contents of the data files named in a <segmentsData> block (the last column of each line).
+    Files that cannot be read contribute their name only.
+    '''
+    h = hashlib.sha256()
+    for line in (segments_text or "").split('\n'):
+        array = line.split()
+        if len(array) == 0:
+            continue
+        path = array[-1]
+        h.update(path.encode() + b'\0')
+        full = path if os.path.isabs(path) else os.path.join(basedir, path)
+        try:
+            with open(full, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        except (IOError, OSError):
+            pass
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    '''
+    ResultCache(string folder, float max_megabytes, bool store_outputs):
+
+    Content-addressed AZURE2 result cache in 'folder'. With store_outputs, the output files of a run are cached
+    along with its chi2 values, so a hit can also fill chi2search_folder.
+    '''
+    def __init__(self, folder, max_megabytes=2000.0, store_outputs=True):
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = int(max_megabytes*1024*1024)
+        self.store_outputs = store_outputs
+        self.entries = os.path.join(self.folder, "entries")
+        self.tmp = os.path.join(self.folder, "tmp")
+        for folder in (self.entries, self.tmp):
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+        self.lockfile = os.path.join(self.folder, "lock")
+        #Size estimate in bytes (None until the first eviction) and stores since the last eviction
+        self.estimated_bytes = None
+        self.puts_since_evict = 0
+        self.size_lock = threading.Lock()
+
+    @staticmethod
+    def key(azr_text, run_mode, salt=""):
+        '''
+        key(string azr_text, string run_mode, string salt):
+
+        Cache key of one AZURE2 run. run_mode should hold everything else that changes the result
+        (menu choice and command line options).
+        '''
+        h = hashlib.sha256()
+        for part in (run_mode, salt, azr_text):
+            data = part.encode("utf-8")
+            h.update(str(len(data)).encode() + b':' + data)
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.entries, key[:2], key)
+
+    def get(self, key):
+        '''
+        get(string key):
+
+        Returns the cached entry as a dict {'chi2': [...], 'outputs': [file names]}, or None.
+        '''
+        resultfile = os.path.join(self._entry(key), RESULT_NAME)
+        try:
+            with open(resultfile, "r") as f:
+                entry = json.load(f)
+            os.utime(resultfile) #Mark as recently used
+        except (IOError, OSError, ValueError):
+            return None #Missing, or evicted while we were looking
+        return entry
+
+    def restore_outputs(self, key, entry, dest_dir):
+        '''
+        restore_outputs(string key, dict entry, string dest_dir):
+
+        Copy the output files stored with an entry into dest_dir. Returns False if they are not all there
+        (not stored, or evicted in the meantime).
+        '''
+        if not entry.get('outputs'):
+            return False
+        src = self._entry(key)
+        try:
+            for name in entry['outputs']:
+                shutil.copyfile(os.path.join(src, name), os.path.join(dest_dir, name))
+        except (IOError, OSError):
+            return False
+        return True
+
+    def put(self, key, chi2_values, output_dir=None, output_names=()):
+        '''
+        put(string key, list chi2_values, string output_dir, list output_names):
+
+        Store the result of one run. The files in output_names are copied from output_dir if store_outputs is set.
+        If another process stored the same key first, its entry is kept. Evicts when the cache may have outgrown
+        max_megabytes (see the top of this file).
+        '''
+        final = self._entry(key)
+        if os.path.exists(final):
+            return
+        staging = tempfile.mkdtemp(prefix=key[:12]+"-", dir=self.tmp)
+        added = 0
+        try:
+            stored = []
+            if self.store_outputs and output_dir is not None:
+                for name in output_names:
+                    path = os.path.join(output_dir, name)
+                    if os.path.isfile(path):
+                        shutil.copyfile(path, os.path.join(staging, name))
+                        stored.append(name)
+            with open(os.path.join(staging, RESULT_NAME), "w") as f:
+                json.dump({'chi2': [float(v) for v in chi2_values], 'outputs': stored}, f)
+            size = sum(os.path.getsize(os.path.join(staging, name)) for name in os.listdir(staging))
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            try:
+                os.rename(staging, final)
+                staging = None
+                added = size
+            except OSError:
+                pass #Someone else got there first
+        finally:
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+        with self.size_lock:
+            self.puts_since_evict += 1
+            if self.estimated_bytes is not None:
+                self.estimated_bytes += added
+            due = (self.estimated_bytes is None or self.estimated_bytes > self.max_bytes or
+                   self.puts_since_evict >= EVICT_EVERY)
+        if due:
+            self.evict()
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache fits in max_megabytes, taking it down to EVICT_TO of it
+        once it does not. Returns the size left, in bytes.
+        '''
+        with open(self.lockfile, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = []
+                total = 0
+                for sub in os.listdir(self.entries):
+                    subdir = os.path.join(self.entries, sub)
+                    for key in os.listdir(subdir):
+                        path = os.path.join(subdir, key)
+                        try:
+                            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                            used = os.path.getmtime(os.path.join(path, RESULT_NAME))
+                        except (IOError, OSError):
+                            continue
+                        entries.append((used, size, path))
+                        total = total + size
+                entries.sort()
+                target = self.max_bytes if total <= self.max_bytes else EVICT_TO*self.max_bytes
+                for used, size, path in entries:
+                    if total <= target:
+                        break
+                    #Move out of sight in one step, then delete at leisure
+                    trash = tempfile.mkdtemp(prefix="evicted-", dir=self.tmp)
+                    try:
+                        os.rename(path, os.path.join(trash, "entry"))
+                    except OSError:
+                        pass
+                    shutil.rmtree(trash, ignore_errors=True)
+                    total = total - size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        with self.size_lock:
+            self.estimated_bytes = total
+            self.puts_since_evict = 0
+        return total
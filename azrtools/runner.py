@@ -0,0 +1,215 @@
+'''
+runner.py
+
+Run AZURE2 in text mode without pexpect.
+
+The menu answers (run mode, then an empty line at the "new file" prompt) are written to AZURE2's stdin up front,
+and the run is over when the process exits: by then every output file has been closed. There is no prompt
+matching on the console and no fixed sleep before closing. The console output is kept in a bounded buffer
+(only the tail of a long fit log is held), or streamed to a file if asked.
+
+With a wall-clock or CPU time limit, a watchdog thread follows the run and kills it once it goes over. AZURE2 is
+started in a process group of its own (on POSIX), so that everything it started is killed with it.
+'''
+
+import collections
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+
+FAREWELL = b"Thanks for using AZURE2."
+
+#How much of the console output is kept in memory when it is not written to a file
+CONSOLE_TAIL_BYTES = 64*1024
+
+#How often the watchdog looks at a run with time limits, and how long a killed run gets between SIGTERM and SIGKILL
+WATCHDOG_INTERVAL = 0.5
+KILL_GRACE = 5.0
+
+_POSIX = os.name == 'posix'
+
+
+class AzureRun(object):
+    '''
+    AzureRun(int returncode, float elapsed, bytes console_tail, bool completed, float cpu_time, string killed)
+
+    Outcome of one AZURE2 run. 'elapsed' is the wall time in seconds from launch to exit, 'cpu_time' the CPU seconds
+    it used (None where the platform does not tell). 'completed' tells whether AZURE2 got as far as printing its
+    farewell line. 'killed' is 'wall' or 'cpu' when the run was killed for going over that time limit, else None.
+    '''
+    def __init__(self, returncode, elapsed, console_tail, completed, cpu_time=None, killed=None):
+        self.returncode = returncode
+        self.elapsed = elapsed
+        self.console_tail = console_tail
+        self.completed = completed
+        self.cpu_time = cpu_time
+        self.killed = killed
+
+    def console(self):
+        return self.console_tail.decode("utf-8", "replace")
+
+
+def azure_command(executable, azr_file, azure_options="--no-gui"):
+    '''
+    azure_command(string executable, string azr_file, string azure_options):
+
+    Argument list for one run, split the same way px.spawn split the command string.
+    '''
+    return shlex.split(str(executable)) + [azr_file] + shlex.split(azure_options)
+
+
+def menu_answers(menu_choice):
+    '''
+    Everything AZURE2 asks for in text mode: the run mode (1 - calculate, 2 - fit), then Enter to keep the current file.
+    '''
+    return (str(menu_choice) + "\n" + "\n").encode()
+
+
+def _process_cpu_time(pid):
+    #CPU seconds of a running process and its reaped children, from /proc (Linux); None elsewhere
+    try:
+        with open("/proc/%d/stat" % pid, "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except (IOError, OSError, IndexError):
+        return None
+    #Fields 14-17 of stat (utime, stime, cutime, cstime), counted after the ')' closing the command name
+    return sum(int(x) for x in fields[11:15])/float(os.sysconf("SC_CLK_TCK"))
+
+
+def _signal_group(proc, sig):
+    try:
+        if _POSIX:
+            os.killpg(proc.pid, sig)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class _Watchdog(object):
+    #Kills the process group of 'proc' once it runs longer than wall_timeout, or uses more than cpu_timeout CPU seconds
+    def __init__(self, proc, start, wall_timeout=None, cpu_timeout=None):
+        self.proc = proc
+        self.start = start
+        self.wall_timeout = wall_timeout
+        self.cpu_timeout = cpu_timeout
+        self.killed = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.watch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def watch(self):
+        while not self.done.wait(WATCHDOG_INTERVAL):
+            if self.wall_timeout is not None and time.perf_counter() - self.start > self.wall_timeout:
+                self.kill('wall')
+                return
+            if self.cpu_timeout is not None:
+                cpu_time = _process_cpu_time(self.proc.pid)
+                if cpu_time is not None and cpu_time > self.cpu_timeout:
+                    self.kill('cpu')
+                    return
+
+    def kill(self, reason):
+        self.killed = reason
+        _signal_group(self.proc, signal.SIGTERM)
+        if not self.done.wait(KILL_GRACE):
+            _signal_group(self.proc, signal.SIGKILL)
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+
+def _wait_exit(proc):
+    #Wait for proc to exit without reaping it: until it is reaped its pid, and so its process group, cannot be reused
+    if hasattr(os, "waitid") and hasattr(os, "WNOWAIT"):
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    else:
+        proc.wait()
+
+
+def _finish(proc, watchdog):
+    #Wait for the exit of proc, stop its watchdog while the process group still exists, then reap proc.
+    #Returns (returncode, CPU seconds or None)
+    _wait_exit(proc)
+    if watchdog is not None:
+        watchdog.stop()
+    return _reap(proc)
+
+
+def _reap(proc):
+    #Reap proc, returning (returncode, CPU seconds or None)
+    if proc.returncode is not None or not hasattr(os, "wait4"):
+        return proc.wait(), None
+    pid, status, usage = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return proc.returncode, usage.ru_utime + usage.ru_stime
+
+
+def run_azure(executable, azr_file, menu_choice="2", azure_options="--no-gui", console_file=None,
+              console_tail_bytes=CONSOLE_TAIL_BYTES, cwd=None, wall_timeout=None, cpu_timeout=None):
+    '''
+    run_azure(string executable, string azr_file, string menu_choice, string azure_options, string console_file, ..):
+
+    Run AZURE2 on azr_file and wait for it to exit. Returns an AzureRun.
+    With console_file, the whole console output goes to that file; otherwise only the last console_tail_bytes are kept.
+    A run going over wall_timeout seconds, or cpu_timeout CPU seconds (Linux only), is killed with everything it
+    started: SIGTERM, then SIGKILL after KILL_GRACE seconds.
+    '''
+    args = azure_command(executable, azr_file, azure_options)
+    start = time.perf_counter()
+
+    log = open(console_file, "wb") if console_file is not None else None
+    try:
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=log if log is not None else subprocess.PIPE,
+                                stderr=subprocess.STDOUT, cwd=cwd, start_new_session=_POSIX)
+    except BaseException:
+        if log is not None:
+            log.close()
+        raise
+    watchdog = None
+    if wall_timeout is not None or cpu_timeout is not None:
+        watchdog = _Watchdog(proc, start, wall_timeout, cpu_timeout)
+    try:
+        proc.stdin.write(menu_answers(menu_choice))
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass #AZURE2 quit before reading the menu; the exit code and console tell why
+
+    if log is not None:
+        returncode, cpu_time = _finish(proc, watchdog)
+        elapsed = time.perf_counter() - start
+        log.close()
+        with open(console_file, "rb") as log:
+            log.seek(0, 2)
+            log.seek(max(0, log.tell()-console_tail_bytes))
+            tail = log.read()
+        return AzureRun(returncode, elapsed, tail, FAREWELL in tail, cpu_time, watchdog.killed if watchdog else None)
+
+    chunks = collections.deque()
+    kept = 0
+    seen_farewell = False
+    while True:
+        chunk = proc.stdout.read1(65536)
+        if not chunk:
+            break
+        #The farewell may straddle two chunks, so look at the joint as well
+        if not seen_farewell and FAREWELL in (chunks[-1][-len(FAREWELL):] if chunks else b"") + chunk:
+            seen_farewell = True
+        chunks.append(chunk)
+        kept = kept + len(chunk)
+        while kept - len(chunks[0]) >= console_tail_bytes:
+            kept = kept - len(chunks.popleft())
+    proc.stdout.close()
+    returncode, cpu_time = _finish(proc, watchdog)
+    elapsed = time.perf_counter() - start
+
+    tail = b"".join(chunks)[-console_tail_bytes:]
+    return AzureRun(returncode, elapsed, tail, seen_farewell, cpu_time, watchdog.killed if watchdog else None)
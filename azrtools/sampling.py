@@ -0,0 +1,145 @@
+'''
+sampling.py
+
+Point generators for chi2 scans over any number of parameters.
+
+Every generator yields (index, values) one point at a time, so a plan of a million points never exists as a list.
+  grid_points - full Cartesian product of per-parameter value arrays, last parameter fastest (the old nested loops)
+  serpentine_points - the same grid in boustrophedon order, so consecutive points are always neighbours
+  sobol_points - Sobol low-discrepancy sequence over a box, up to len(_SOBOL_TABLE)+1 parameters
+  lhs_points  - Latin hypercube: each parameter's range cut into n strata, each stratum used exactly once
+The Sobol and Latin hypercube plans are deterministic (the latter through its seed), so --resume regenerates
+the same points under the same indices.
+'''
+
+import itertools
+
+import numpy as np
+
+#Sobol direction numbers from S. Joe and F. Y. Kuo, "Constructing Sobol sequences with better two-dimensional
+#projections" (new-joe-kuo-6.21201), dimensions 2 to 16. Each entry is (s, a, [m_1 .. m_s]).
+_SOBOL_TABLE = [(1, 0, [1]),
+                (2, 1, [1, 3]),
+                (3, 1, [1, 3, 1]),
+                (3, 2, [1, 1, 1]),
+                (4, 1, [1, 1, 3, 3]),
+                (4, 4, [1, 3, 5, 13]),
+                (5, 2, [1, 1, 5, 5, 17]),
+                (5, 4, [1, 1, 5, 5, 5]),
+                (5, 7, [1, 1, 7, 11, 19]),
+                (5, 11, [1, 1, 5, 1, 1]),
+                (5, 13, [1, 1, 1, 3, 11]),
+                (5, 14, [1, 3, 5, 5, 31]),
+                (6, 1, [1, 3, 3, 9, 7, 49]),
+                (6, 13, [1, 1, 1, 15, 21, 21]),
+                (6, 16, [1, 3, 1, 13, 27, 49])]
+
+_SOBOL_BITS = 32
+MAX_SOBOL_DIMENSIONS = len(_SOBOL_TABLE) + 1
+
+
+def _scale(ranges, u):
+    return tuple(low + (high-low)*x for (low, high), x in zip(ranges, u))
+
+
+def grid_points(*paramarrays):
+    '''
+    grid_points(array param1array, array param2array, ...):
+
+    Yields (index, (p1, p2, ..)) in the order of nested loops over p1, p2, ..
+    '''
+    for index, values in enumerate(itertools.product(*paramarrays)):
+        yield index, values
+
+
+def grid_size(*paramarrays):
+    n = 1
+    for array in paramarrays:
+        n = n*len(array)
+    return n
+
+
+def serpentine_points(*paramarrays, start=0, stop=None):
+    '''
+    serpentine_points(array param1array, array param2array, .., int start, int stop):
+
+    Yields (index, (p1, p2, ..)) for steps start .. stop-1 of a walk over the grid in which every parameter
+    turns around at the end of its range instead of jumping back to the start, so each point differs from the one
+    before by a single step of a single parameter. Indices are those of grid_points.
+    '''
+    shape = [len(array) for array in paramarrays]
+    if stop is None:
+        stop = grid_size(*paramarrays)
+    for step in range(start, stop):
+        coord = np.unravel_index(step, shape)
+        prefix = 0 #Number of sweeps the parameters before this one have completed
+        snake = []
+        for c, n in zip(coord, shape):
+            c = int(c)
+            snake.append(n-1-c if prefix % 2 == 1 else c)
+            prefix = prefix*n + c
+        index = int(np.ravel_multi_index(snake, shape))
+        yield index, tuple(array[c] for array, c in zip(paramarrays, snake))
+
+
+def _sobol_directions(dim):
+    directions = []
+    #First dimension: van der Corput sequence in base 2
+    directions.append([1 << (_SOBOL_BITS-1-k) for k in range(_SOBOL_BITS)])
+    for j in range(1, dim):
+        s, a, m = _SOBOL_TABLE[j-1]
+        v = [0]*_SOBOL_BITS
+        for k in range(_SOBOL_BITS):
+            if k < s:
+                v[k] = m[k] << (_SOBOL_BITS-1-k)
+            else:
+                v[k] = v[k-s] ^ (v[k-s] >> s)
+                for l in range(1, s):
+                    if (a >> (s-1-l)) & 1:
+                        v[k] = v[k] ^ v[k-l]
+        directions.append(v)
+    return directions
+
+
+def sobol_points(ranges, n, skip=0):
+    '''
+    sobol_points(list ranges, int n, int skip):
+
+    Yields (index, values) for points skip .. skip+n-1 of the Sobol sequence, scaled to ranges[k] = (low, high).
+    Balance is best when n (and skip) are powers of two.
+    '''
+    dim = len(ranges)
+    if dim > MAX_SOBOL_DIMENSIONS:
+        raise ValueError("Sobol sampling is available for up to "+str(MAX_SOBOL_DIMENSIONS)+" parameters")
+    if skip + n > 2**_SOBOL_BITS:
+        raise ValueError("Too many Sobol points requested")
+    directions = _sobol_directions(dim)
+    scale = 1.0/2**_SOBOL_BITS
+
+    #Gray code construction: point i differs from point i-1 by the direction numbers of the lowest set bit of i
+    x = [0]*dim
+    for i in range(1, skip+1):
+        c = (i & -i).bit_length() - 1
+        for j in range(dim):
+            x[j] = x[j] ^ directions[j][c]
+    for index in range(n):
+        i = skip + index
+        if index > 0:
+            c = (i & -i).bit_length() - 1
+            for j in range(dim):
+                x[j] = x[j] ^ directions[j][c]
+        yield index, _scale(ranges, [xj*scale for xj in x])
+
+
+def lhs_points(ranges, n, seed=0):
+    '''
+    lhs_points(list ranges, int n, int seed):
+
+    Yields (index, values) for an n-point Latin hypercube over ranges[k] = (low, high), with a random position
+    inside each stratum. The same seed gives the same plan.
+    '''
+    rng = np.random.RandomState(seed)
+    strata = [rng.permutation(n) for r in ranges]
+    jitter = [rng.random_sample(n) for r in ranges]
+    for index in range(n):
+        yield index, _scale(ranges, [(strata[k][index] + jitter[k][index])/n for k in range(len(ranges))])
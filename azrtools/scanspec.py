@@ -0,0 +1,303 @@
+'''
+scanspec.py
+
+Scans written down instead of typed in: a scan spec names the .azr, the AZURE2 executable, the parameters to vary
+(by level, not by catalog ID), their ranges and how to run the scan, so that scans can be queued and run unattended.
+  read_scan_specs  - the specs in a JSON or TOML file
+  select_parameter - the catalog entry of a (E, J, pi) or (E, J, pi, L, S) selector
+  spec_definition  - scan definition (see explore.new_scan_definition) and run_scan options of a spec
+  run_scan_spec    - run one spec start to finish, resuming it if it was interrupted
+  run_scan_specs   - run a list of specs back to back; a spec that fails does not stop the others
+  submit_scan_spec - queue the scan of a spec for workers on other hosts (see workqueue.py)
+  scan_spec        - the spec of a scan definition, e.g. one just entered at the chi2explore prompts
+  write_scan_spec  - save a spec as JSON
+
+A spec (JSON shown, TOML takes the same keys):
+
+    {"name": "E1-W1",
+     "input_azr_file": "F17.azr",
+     "executable": "/opt/AZURE2/build/AZURE2",
+     "scan_mode": "grid",
+     "parameters": [{"select": [1.0, 2.5, 1], "range": [0.6, 1.8, 5]},
+                    {"select": [1.0, 2.5, 1, 2, 2], "range": [500, 2500, 5]}],
+     "num_workers": 4}
+
+A selector of three numbers is the energy of level (E, J, pi), of five the width of its (L, S) channel, as
+chi2explore lists them (E in MeV, L and S the orbital angular momentum and channel spin, not doubled). A sixth number (the width) picks one of several channels
+with the same (E, J, pi, L, S). Besides these, a spec takes the options of new_scan_definition (scan_mode,
+adaptive_levels, num_samples, warm_start, ..) and of run_scan (num_workers, cache_folder, minimizer_method, ..).
+
+Paths are relative to 'directory' (default: the folder of the spec file), which is also where AZURE2 runs, since it
+finds the data files from there. The files of a scan (working .azr, checkpoint, results, chi2search_folder) go to
+'output_folder' under it, by default a folder named after the scan, so scans of one .azr do not overwrite each other.
+A relative timings_file goes to that folder as well.
+A file holds one spec, or several as a list (a JSON list, or "scans" in JSON or TOML, i.e. [[scans]] tables).
+'''
+
+import json
+import os
+import traceback
+
+from .explore import parameter_catalog, scan_range, new_scan_definition, load_scan_definition, run_scan
+from .scanstate import _jsonable
+from .workqueue import submit_scan
+
+#Keys of a spec that are passed on to new_scan_definition and run_scan as they are
+DEFINITION_OPTIONS = ('scan_mode', 'adaptive_levels', 'adaptive_delta_chi2', 'num_samples', 'sampling_seed',
+                      'warm_start', 'archive_snapshots', 'archive_curves')
+RUN_OPTIONS = ('num_workers', 'save_out_files', 'save_azr_files', 'cache_folder', 'cache_max_mb',
+               'minimizer_method', 'minimizer_xtol', 'minimizer_ftol', 'minimizer_max_evals', 'menu_choice',
+               'azure_options', 'wall_timeout', 'cpu_timeout', 'retries', 'learn_timeouts', 'timings_file')
+#Run options that are the same for every worker of a queued scan, and those that say where it is collected to
+SUBMIT_OPTIONS = ('menu_choice', 'azure_options', 'wall_timeout', 'cpu_timeout', 'retries', 'learn_timeouts',
+                  'timings_file')
+COLLECT_OPTIONS = ('results_file', 'results_array_file', 'chi2search_folder', 'save_out_files', 'save_azr_files')
+SPEC_KEYS = ('name', 'input_azr_file', 'executable', 'parameters', 'free_only', 'directory', 'output_folder') + \
+            DEFINITION_OPTIONS + RUN_OPTIONS
+
+#Left next to the checkpoint once a scan of run_scan_spec has run to the end
+FINISHED_SUFFIX = ".finished"
+
+#Selector energies are compared to this many MeV
+ENERGY_TOLERANCE = 1e-6
+
+
+def read_scan_specs(path):
+    '''
+    read_scan_specs(string path):
+
+    The specs in a .json or .toml file, each with 'directory' made absolute (the folder of the file by default).
+    TOML needs Python 3.11 (tomllib).
+    '''
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError(path+": reading TOML specs needs Python 3.11 or newer, use JSON instead")
+        with open(path, "rb") as f:
+            content = tomllib.load(f)
+    else:
+        with open(path, "r") as f:
+            content = json.load(f)
+    if isinstance(content, dict) and 'scans' in content:
+        content = content['scans']
+    specs = content if isinstance(content, list) else [content]
+
+    folder = os.path.dirname(os.path.abspath(path))
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise ValueError(path+": a scan spec is a table of keys, got "+repr(spec))
+        spec['directory'] = os.path.join(folder, spec.get('directory', '.'))
+    return specs
+
+
+def select_parameter(Evarylist, Widthvarylist, select):
+    '''
+    select_parameter(list Evarylist, list Widthvarylist, list select):
+
+    The catalog entry (ID, tuple) (see explore.parameter_catalog) of the energy of level (E, J, pi), or of the width
+    of its channel (E, J, pi, L, S[, W]). Raises ValueError unless exactly one entry matches.
+    '''
+    select = [float(x) for x in select]
+    if len(select) == 3:
+        candidates = Evarylist
+    elif len(select) in (5, 6):
+        candidates = Widthvarylist
+    else:
+        raise ValueError("Selector "+str(select)+" is neither (E, J, pi) nor (E, J, pi, L, S[, W])")
+    found = [entry for entry in candidates if abs(entry[1][0] - select[0]) <= ENERGY_TOLERANCE and
+             all(float(value) == wanted for value, wanted in zip(entry[1][1:len(select)], select[1:]))]
+    if len(found) != 1:
+        raise ValueError("Selector "+str(select)+" matches "+str(len(found))+" parameters of the .azr"+
+                         (": "+', '.join(str(entry[1]) for entry in found) if found else ""))
+    return found[0]
+
+
+def _output_paths(spec):
+    out = spec.get('output_folder', spec.get('name', '.'))
+    stem = os.path.splitext(os.path.basename(spec['input_azr_file']))[0]
+    return {'working_azr_file': os.path.join(out, stem+'-chi2test.azr'),
+            'checkpoint_file': os.path.join(out, 'chi2scan-checkpoint.json'),
+            'results_file': os.path.join(out, 'chisquared-output.dat'),
+            'results_array_file': os.path.join(out, 'chisquared-output.npy'),
+            'chi2search_folder': os.path.join(out, 'chi2search_folder'),
+            'scratch_folder': os.path.join(out, 'chi2scan_workers')}
+
+
+def spec_definition(spec):
+    '''
+    spec_definition(dict spec):
+
+    (definition, run_scan options) of a spec, paths relative to its directory. Raises ValueError for a spec that
+    is incomplete, has unknown keys or selects parameters the .azr does not have.
+    '''
+    unknown = [key for key in spec if key not in SPEC_KEYS]
+    if unknown:
+        raise ValueError("Unknown key(s) in scan spec: "+', '.join(unknown))
+    for key in ('input_azr_file', 'parameters'):
+        if key not in spec:
+            raise ValueError("Scan spec without '"+key+"'")
+    if len(spec['parameters']) == 0:
+        raise ValueError("Scan spec without parameters to vary")
+
+    directory = spec.get('directory', '.')
+    Evarylist, Widthvarylist = parameter_catalog(os.path.join(directory, spec['input_azr_file']), spec.get('free_only', False))
+    things = []
+    for parameter in spec['parameters']:
+        if 'select' not in parameter or 'range' not in parameter or len(parameter['range']) != 3:
+            raise ValueError("A parameter of a scan spec needs 'select' and 'range' (low, high, steps), got "+str(parameter))
+        low, high, steps = parameter['range']
+        things.append(scan_range(select_parameter(Evarylist, Widthvarylist, parameter['select']), low, high, steps))
+
+    paths = _output_paths(spec)
+    options = dict((key, spec[key]) for key in DEFINITION_OPTIONS if key in spec)
+    definition = new_scan_definition(spec['input_azr_file'], things, paths['working_azr_file'], **options)
+    run_options = dict((key, spec[key]) for key in RUN_OPTIONS if key in spec)
+    for key in ('checkpoint_file', 'results_file', 'results_array_file', 'chi2search_folder', 'scratch_folder'):
+        run_options[key] = paths[key]
+    if run_options.get('timings_file') is not None:
+        #Timings belong to the scan, like its results
+        run_options['timings_file'] = os.path.join(os.path.dirname(paths['checkpoint_file']), run_options['timings_file'])
+    return definition, run_options
+
+
+def run_scan_spec(spec, executable=None):
+    '''
+    run_scan_spec(dict spec, string executable):
+
+    Run the scan of a spec in its directory, with the spec's executable or else 'executable'. A scan whose checkpoint
+    is there is resumed (it must be the same scan), and one that already ran to the end is not run again.
+    Returns what run_scan returned, or None for a scan that had finished before.
+    '''
+    executable = spec.get('executable', executable)
+    if executable is None:
+        raise ValueError("Scan spec without 'executable'")
+    definition, run_options = spec_definition(spec)
+    checkpoint_file = run_options['checkpoint_file']
+
+    back = os.getcwd()
+    os.chdir(spec.get('directory', '.'))
+    try:
+        if os.path.exists(checkpoint_file + FINISHED_SUFFIX):
+            return None
+        out = os.path.dirname(checkpoint_file)
+        if out:
+            os.makedirs(out, exist_ok=True)
+        done_indices = None
+        if os.path.exists(checkpoint_file):
+            stored, done_indices = load_scan_definition(checkpoint_file)
+            for key in ('input_azr_file', 'thingstovary_withrange', 'scan_mode'):
+                if json.dumps(_jsonable(stored[key])) != json.dumps(_jsonable(definition[key])):
+                    raise ValueError(checkpoint_file+" belongs to a different scan ("+key+" differs), "
+                                     "give this spec its own output_folder or remove the old scan")
+            definition = stored
+            print('Resuming scan', spec.get('name', ''), ':', len(done_indices), 'points already done.')
+        result = run_scan(definition, executable, done_indices, **run_options)
+        with open(checkpoint_file + FINISHED_SUFFIX, "w"):
+            pass
+        return result
+    finally:
+        os.chdir(back)
+
+
+def run_scan_specs(specs, executable=None):
+    '''
+    run_scan_specs(list specs, string executable):
+
+    Run every spec in turn, without prompts. All specs are checked (see spec_definition) before the first runs,
+    and a spec that is invalid or fails is reported and passed over. Returns [(name, status)], status being
+    'finished', 'skipped' (finished earlier), 'invalid' or 'failed'.
+    '''
+    statuses = []
+    runnable = []
+    for k, spec in enumerate(specs):
+        name = spec.get('name', 'scan '+str(k+1))
+        try:
+            if spec.get('executable', executable) is None:
+                raise ValueError("Scan spec without 'executable'")
+            spec_definition(spec)
+            runnable.append((k, name, spec))
+        except (ValueError, IOError, OSError, AttributeError) as error:
+            print('Scan spec', name, 'is not valid:', error)
+            statuses.append((k, name, 'invalid'))
+
+    for n, (k, name, spec) in enumerate(runnable):
+        print('=== Scan', n+1, 'of', len(runnable), ':', name, '===')
+        try:
+            result = run_scan_spec(spec, executable)
+            status = 'skipped' if result is None else 'finished'
+        except Exception:
+            traceback.print_exc()
+            status = 'failed'
+        print('=== Scan', name, status, '===')
+        statuses.append((k, name, status))
+    statuses.sort()
+    return [(name, status) for k, name, status in statuses]
+
+
+def submit_scan_spec(spec, queue_dir):
+    '''
+    submit_scan_spec(dict spec, string queue_dir):
+
+    Queue the scan of a spec in queue_dir (see workqueue.submit_scan) the way run_scan_spec would run it: from the
+    spec's directory, with its run settings, to be collected into its output files. Worker settings (num_workers,
+    cache_folder) are those the workers are started with. Returns the number of tasks.
+    '''
+    definition, run_options = spec_definition(spec)
+    directory = os.path.abspath(spec.get('directory', '.'))
+    settings = dict((key, run_options[key]) for key in SUBMIT_OPTIONS if key in run_options)
+    outputs = dict((key, run_options[key]) for key in COLLECT_OPTIONS if key in run_options)
+    for key in ('results_file', 'results_array_file', 'chi2search_folder'):
+        outputs[key] = os.path.join(directory, outputs[key])
+    return submit_scan(definition, queue_dir, directory=directory, outputs=outputs, **settings)
+
+
+def scan_spec(definition, executable=None, name=None, **run_options):
+    '''
+    scan_spec(dict definition, string executable, string name, **run_options):
+
+    Spec of the scan 'definition' (see explore.new_scan_definition), with its parameters selected by level and
+    any run_scan options given. A width is selected with its value too when another channel of the level has the
+    same L and S. The spec writes to the usual files of the directory it runs in unless 'name' (or run_options
+    output_folder) is given.
+    '''
+    spec = {}
+    if name is not None:
+        spec['name'] = name
+    else:
+        spec['output_folder'] = run_options.pop('output_folder', '.')
+    spec['input_azr_file'] = definition['input_azr_file']
+    if executable is not None:
+        spec['executable'] = executable
+    Evarylist, Widthvarylist = parameter_catalog(definition['input_azr_file'], run_options.get('free_only', False))
+    parameters = []
+    for ID, parameter, (low, high, steps), kind in definition['thingstovary_withrange']:
+        select = list(parameter[:3]) if kind == "Energy" else list(parameter[:5])
+        if kind != "Energy":
+            try:
+                select_parameter(Evarylist, Widthvarylist, select)
+            except ValueError:
+                #Channels alike but for their width: the width tells them apart
+                select.append(parameter[5])
+        #Raises ValueError for a parameter that the spec could not select again
+        select_parameter(Evarylist, Widthvarylist, select)
+        parameters.append({'select': select, 'range': [low, high, steps]})
+    spec['parameters'] = parameters
+    for key in DEFINITION_OPTIONS:
+        spec[key] = definition[key]
+    for key in run_options:
+        if key not in SPEC_KEYS:
+            raise ValueError("Unknown scan spec option '"+key+"'")
+        spec[key] = run_options[key]
+    return _jsonable(spec)
+
+
+def write_scan_spec(spec, path):
+    '''
+    write_scan_spec(dict spec, string path):
+
+    Save a spec (or a list of specs) as JSON, for read_scan_specs.
+    '''
+    with open(path, "w") as f:
+        json.dump(_jsonable(spec), f, indent=1)
+        f.write('\n')
@@ -0,0 +1,193 @@
+'''
+scanstate.py
+
+Crash-safe bookkeeping for chi2 scans.
+
+ResultWriter appends the rows of each grid point to chisquared-output.dat as soon as they are read, and flushes
+them to disk, so nothing is lost when a scan dies halfway. ScanCheckpoint keeps the scan definition (template .azr,
+scanned parameters, grid) in a small JSON file, plus an append-only log of the indices that have been finished.
+A resumed scan reads both back and only runs the points that are missing.
+'''
+
+import json
+import os
+
+RESULT_FMT = "%1.4f"
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _jsonable(value):
+    #numpy scalars/arrays and tuples -> plain JSON types
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _jsonable(v)) for k, v in value.items())
+    return value
+
+
+def _tuples(value):
+    #Inverse of _jsonable for the nested tuples chi2explore uses to describe parameters
+    if isinstance(value, list):
+        return tuple(_tuples(v) for v in value)
+    return value
+
+
+def format_row(row, fmt=RESULT_FMT):
+    '''
+    One line of chisquared-output.dat, as np.savetxt(.., fmt="%1.4f") writes it.
+    '''
+    return ' '.join(fmt % float(v) for v in row) + '\n'
+
+
+def read_point_totals(path):
+    '''
+    read_point_totals(string path):
+
+    {index: chi2} from an existing chisquared-output.dat, taking the last row of each point (the total chi2).
+    '''
+    totals = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                array = line.split()
+                if line.endswith('\n') and len(array) > 1:
+                    totals[int(float(array[0]))] = float(array[-1])
+    return totals
+
+
+class ResultWriter(object):
+    '''
+    ResultWriter(string path, set keep_indices, string fmt):
+
+    Append-only writer for chisquared-output.dat. With keep_indices (when resuming), the existing file is trimmed
+    to the rows of those points first, dropping anything a crashed run left behind for unfinished points.
+    Without it the file is started afresh.
+    '''
+    def __init__(self, path, keep_indices=None, fmt=RESULT_FMT):
+        self.path = path
+        self.fmt = fmt
+        if keep_indices is None:
+            self.f = open(path, "w")
+        else:
+            kept = []
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    for line in f:
+                        array = line.split()
+                        if line.endswith('\n') and len(array) > 0 and int(float(array[0])) in keep_indices:
+                            kept.append(line)
+            self.f = open(path, "w")
+            self.f.writelines(kept)
+        _sync(self.f)
+
+    def write_point(self, rows):
+        '''
+        Append all rows of one grid point in a single write and flush them to disk.
+        '''
+        self.f.write(''.join(format_row(row, self.fmt) for row in rows))
+        _sync(self.f)
+
+    def close(self, sort=True):
+        '''
+        Close the file. With sort, the rows are put back in index order (points can finish out of order).
+        '''
+        self.f.close()
+        if not sort:
+            return
+        with open(self.path, "r") as f:
+            lines = [line for line in f if len(line.split()) > 0]
+        #Stable sort, so the rows of one point keep their chiSquared.out order
+        lines.sort(key=lambda line: int(float(line.split()[0])))
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(lines)
+            _sync(f)
+        os.replace(tmp, self.path)
+
+
+class ResultTee(object):
+    '''
+    ResultTee(writer, writer, ..):
+
+    Passes the rows of every point on to several result writers (e.g. a ResultWriter and a ResultArray).
+    '''
+    def __init__(self, *writers):
+        self.writers = writers
+
+    def write_point(self, rows):
+        for writer in self.writers:
+            writer.write_point(rows)
+
+    def close(self, sort=True):
+        for writer in self.writers:
+            writer.close(sort)
+
+
+class ScanCheckpoint(object):
+    '''
+    ScanCheckpoint(string path):
+
+    Scan definition in 'path' (JSON), finished grid indices in 'path'.done, one per line.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.done_path = path + ".done"
+        self.done_file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def start(self, definition):
+        '''
+        start(dict definition):
+
+        Record the definition of a new scan and forget any finished points of an earlier one.
+        '''
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(_jsonable(definition), f, indent=1)
+            _sync(f)
+        os.replace(tmp, self.path)
+        self.done_file = open(self.done_path, "w")
+        _sync(self.done_file)
+
+    def load(self):
+        '''
+        load():
+
+        Returns (definition, set of finished indices) of the scan being resumed, and keeps logging to it.
+        Lists in the definition come back as tuples.
+        '''
+        with open(self.path, "r") as f:
+            definition = json.load(f)
+        for key in list(definition.keys()):
+            definition[key] = _tuples(definition[key])
+        done = set()
+        if os.path.exists(self.done_path):
+            with open(self.done_path, "r") as f:
+                for line in f:
+                    if line.endswith('\n') and line.strip(): #A line cut short by a crash does not count
+                        done.add(int(line))
+        #Rewrite the log so new entries never get glued to a cut-off line
+        self.done_file = open(self.done_path, "w")
+        self.done_file.write(''.join(str(index) + '\n' for index in sorted(done)))
+        _sync(self.done_file)
+        return definition, done
+
+    def mark_done(self, index):
+        '''
+        Log grid point 'index' as finished. Call this after its rows have been written.
+        '''
+        self.done_file.write(str(index) + '\n')
+        _sync(self.done_file)
+
+    def close(self):
+        if self.done_file is not None:
+            self.done_file.close()
+            self.done_file = None
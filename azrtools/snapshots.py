@@ -0,0 +1,178 @@
+'''
+snapshots.py
+
+Delta-encoded archive of one output file (parameters.out, param.sav) over the points of a scan.
+
+From one grid point to the next these files differ in a handful of numbers only. The first snapshot added is
+kept in full as the baseline; every later one is stored as the list of whitespace-separated tokens that differ
+from the baseline at the same position, compressed on its own with lzma. A snapshot whose layout differs from the
+baseline (a different number of tokens) is stored in full, compressed.
+
+Layout of an archive folder (e.g. chi2search_folder/snapshots/parameters.out/):
+    base.xz    - the baseline, xz compressed
+    deltas.dat - the compressed records, appended one after another
+    index.txt  - one line per record: point index, offset and length in deltas.dat
+Records are written and flushed before their index line, so a crash leaves at most an unreferenced tail.
+Reading a point decompresses the baseline (once) and that point's record only.
+'''
+
+import lzma
+import os
+import re
+import threading
+
+_tokens = re.compile(rb'(\s+)')
+
+#Raw LZMA2 streams: no per-record container headers, which would be bigger than a typical delta
+_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6}]
+
+_DELTA = b'D'
+_FULL = b'F'
+
+
+def _encode_delta(base_tokens, data):
+    #None if the layout does not match the baseline
+    tokens = _tokens.split(data)
+    if len(tokens) != len(base_tokens):
+        return None
+    out = []
+    last = 0
+    for i, (old, new) in enumerate(zip(base_tokens, tokens)):
+        if old != new:
+            out.append(b'%d %d ' % (i - last, len(new)) + new)
+            last = i
+    return b''.join(out)
+
+
+def _apply_delta(base_tokens, delta):
+    tokens = list(base_tokens)
+    pos = 0
+    i = 0
+    while pos < len(delta):
+        gap_end = delta.index(b' ', pos)
+        len_end = delta.index(b' ', gap_end+1)
+        i = i + int(delta[pos:gap_end])
+        n = int(delta[gap_end+1:len_end])
+        tokens[i] = delta[len_end+1:len_end+1+n]
+        pos = len_end + 1 + n
+    return b''.join(tokens)
+
+
+class SnapshotArchive(object):
+    '''
+    SnapshotArchive(string folder):
+
+    Delta archive of one kind of file, kept in 'folder' (created if needed). Reopening an existing folder
+    (e.g. on --resume) appends to it against the same baseline.
+    '''
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.base_path = os.path.join(folder, "base.xz")
+        self.data_path = os.path.join(folder, "deltas.dat")
+        self.index_path = os.path.join(folder, "index.txt")
+        self.lock = threading.Lock()
+        self._base_tokens = None
+        self._records = None
+
+    def _base(self):
+        if self._base_tokens is None and os.path.exists(self.base_path):
+            with lzma.open(self.base_path, "rb") as f:
+                self._base_tokens = _tokens.split(f.read())
+        return self._base_tokens
+
+    def _index(self):
+        if self._records is None:
+            self._records = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r") as f:
+                    for line in f:
+                        array = line.split()
+                        if line.endswith('\n') and len(array) == 3:
+                            self._records[int(array[0])] = (int(array[1]), int(array[2]))
+        return self._records
+
+    def add(self, index, data):
+        '''
+        add(int index, bytes data):
+
+        Archive the contents of the file for grid point 'index'. The first snapshot ever added becomes the baseline.
+        '''
+        with self.lock:
+            base_tokens = self._base()
+            if base_tokens is None:
+                tmp = self.base_path + ".tmp"
+                with lzma.open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self.base_path)
+                base_tokens = self._base()
+            delta = _encode_delta(base_tokens, data)
+            if delta is not None and len(delta) < len(data):
+                record = _DELTA + lzma.compress(delta, format=lzma.FORMAT_RAW, filters=_FILTERS)
+            else:
+                record = _FULL + lzma.compress(data, format=lzma.FORMAT_RAW, filters=_FILTERS)
+
+            records = self._index()
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "a") as f:
+                f.write("%d %d %d\n" % (index, offset, len(record)))
+                f.flush()
+                os.fsync(f.fileno())
+            records[index] = (offset, len(record))
+
+    def add_file(self, index, path):
+        '''
+        add_file(int index, string path):
+
+        Archive the file at 'path' for grid point 'index'.
+        '''
+        with open(path, "rb") as f:
+            self.add(index, f.read())
+
+    def indices(self):
+        '''
+        Sorted indices of the points in the archive.
+        '''
+        with self.lock:
+            return sorted(self._index().keys())
+
+    def read(self, index):
+        '''
+        read(int index):
+
+        Rebuild the file of grid point 'index' (bytes). Raises KeyError if it was never archived.
+        '''
+        with self.lock:
+            offset, length = self._index()[index]
+            base_tokens = self._base()
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            record = f.read(length)
+        payload = lzma.decompress(record[1:], format=lzma.FORMAT_RAW, filters=_FILTERS)
+        if record[:1] == _FULL:
+            return payload
+        return _apply_delta(base_tokens, payload)
+
+    def extract(self, index, outfile):
+        '''
+        extract(int index, string outfile):
+
+        Write the rebuilt file of grid point 'index' to outfile.
+        '''
+        with open(outfile, "wb") as f:
+            f.write(self.read(index))
+
+
+def open_snapshots(chi2search_folder, names=("parameters.out", "param.sav")):
+    '''
+    open_snapshots(string chi2search_folder, list names):
+
+    {file name: SnapshotArchive} for the archives kept under chi2search_folder/snapshots/.
+    '''
+    root = os.path.join(chi2search_folder, "snapshots")
+    return dict((name, SnapshotArchive(os.path.join(root, name))) for name in names)
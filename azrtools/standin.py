@@ -0,0 +1,279 @@
+'''
+standin.py
+
+A stand-in for the AZURE2 executable, for measuring and regression-testing the scripts where there is no AZURE2
+build or no real data. It takes the same command line (file.azr [--no-gui]) and answers the same console menu
+("azure2: " run mode, then Enter for a new file, "Thanks for using AZURE2." at the end), sleeps for a configurable
+delay instead of computing, and writes chiSquared.out, parameters.out, normalizations.out and param.sav to the
+output directory of the .azr.
+  true_energy / true_width - the parameters at which the model chi2 is smallest
+  read_model               - levels, segments and output directory of an .azr, read as plain text
+  model_chi2               - chi2 per segment, a known analytic function of the parameters
+  fit_model                - what a 'fit' does: free parameters move FIT_FRACTION of the way to the truth
+  write_outputs            - the four output files of a model
+  run_model                - one run, in-process: outputs for an .azr and a menu choice
+  standin_command          - the command to give run_scan (or the scripts) in place of the AZURE2 path
+  main                     - the executable: python3 azrtools/standin.py [--delay S] file.azr [--no-gui]
+
+The model: level n (the n-th run of consecutive <levels> lines with the same E, J, pi and FixE?, counted from 0)
+has its chi2 minimum at E = true_energy(n) MeV, and its c-th channel at width true_width(n, c) eV. Segment k of N
+data points has
+
+    Chi-Squared/N = 1 + (1 + k % 3) * (sum ((E - E_true)/ENERGY_SCALE)^2 + sum ((W - W_true)/W_true)^2) + ((norm - 1)/err)^2
+
+the last term only for segments whose normalization is varied, err being its NormError% as a fraction.
+N is the number of lines of the segment's data file, or DEFAULT_SEGMENT_POINTS when it cannot be read.
+'''
+
+import math
+import os
+import shlex
+import sys
+import time
+
+if __package__:
+    from .common import levelDict, segmentDict1, segmentDict2, configDict
+else:
+    #Run as a file (the way AZURE2 is started): the package is one folder up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from azrtools.common import levelDict, segmentDict1, segmentDict2, configDict
+
+FAREWELL = "Thanks for using AZURE2."
+
+#Scale of the energy terms of the model chi2 (MeV), and the points of a segment without a readable data file
+ENERGY_SCALE = 0.05
+DEFAULT_SEGMENT_POINTS = 20
+
+#A fit moves every free energy, width and varied normalization this fraction of the way to its true value
+FIT_FRACTION = 0.5
+
+
+def true_energy(level):
+    '''
+    Energy (MeV) of the model chi2 minimum for level 'level' (counted from 0).
+    '''
+    return 0.5 + 0.5*level
+
+
+def true_width(level, channel):
+    '''
+    Width (eV) of the model chi2 minimum for channel 'channel' of level 'level' (both counted from 0).
+    '''
+    return 1000.0*(1 + level % 4)/(channel + 1)
+
+
+def _section(text, name):
+    start = text.find('<'+name+'>')
+    end = text.find('</'+name+'>')
+    if start < 0 or end < 0:
+        raise ValueError("No <"+name+"> section in the .azr file")
+    return text[start+len(name)+2:end]
+
+
+def read_model(azr_file):
+    '''
+    read_model(string azr_file):
+
+    (levels, segments, output directory) of an .azr. levels holds one dict per included <levels> line
+    (level, channel, J, pi, E, W, l, s, fixE, fixW), segments one dict per included segment (number, points,
+    norm, vary, err). Plain string handling, so the stand-in starts as fast as possible.
+    '''
+    with open(azr_file, "r") as f:
+        text = f.read()
+    configlines = _section(text, 'config').split('\n')
+    offset = 1 if configlines[0].strip() == '' else 0
+    output_dir = configlines[configDict['OutputDirectory'] + offset].strip()
+
+    levels = []
+    level = -1
+    channel = 0
+    previous = None
+    for line in _section(text, 'levels').split('\n'):
+        fields = line.split()
+        if len(fields) <= levelDict['WidthChanneleV']:
+            continue
+        key = tuple(fields[levelDict[name]] for name in ('ExcEnergyChannelMeV', 'J-channel', 'Pi-channel', 'FixE?'))
+        if key != previous:
+            level += 1
+            channel = 0
+            previous = key
+        else:
+            channel += 1
+        if int(fields[levelDict['IncludeLevel?']]) != 1:
+            continue
+        levels.append({'level': level, 'channel': channel,
+                       'J': float(fields[levelDict['J-channel']]), 'pi': int(float(fields[levelDict['Pi-channel']])),
+                       'E': float(fields[levelDict['ExcEnergyChannelMeV']]), 'W': float(fields[levelDict['WidthChanneleV']]),
+                       'l': int(fields[levelDict['2L']])//2, 's': int(fields[levelDict['2S']])/2.0,
+                       'fixE': int(fields[levelDict['FixE?']]) != 0, 'fixW': int(fields[levelDict['FixWidth?']]) != 0})
+
+    segments = []
+    number = 0
+    for line in _section(text, 'segmentsData').split('\n'):
+        fields = line.split()
+        if len(fields) <= segmentDict1['DataFilePath']:
+            continue
+        number += 1
+        layout = segmentDict2 if int(fields[segmentDict1['DataType']]) == 2 else segmentDict1
+        if int(fields[layout['Include?']]) != 1:
+            continue
+        points = DEFAULT_SEGMENT_POINTS
+        try:
+            with open(fields[layout['DataFilePath']], "r") as f:
+                points = max(1, sum(1 for row in f if row.strip()))
+        except (IOError, OSError, IndexError):
+            pass
+        segments.append({'number': number, 'points': points, 'norm': float(fields[layout['Normalization']]),
+                         'vary': int(fields[layout['VaryNorm?']]) != 0, 'err': float(fields[layout['NormError%']])/100.0})
+    return levels, segments, output_dir
+
+
+def model_chi2(levels, segments):
+    '''
+    model_chi2(list levels, list segments):
+
+    [(segment number, Chi-Squared/N, N)] of the model (see the top of this file) for read_model's levels and segments.
+    '''
+    distance = 0.0
+    energies = {}
+    for line in levels:
+        energies[line['level']] = line['E']
+        truth = true_width(line['level'], line['channel'])
+        distance += ((line['W'] - truth)/truth)**2
+    for level, E in energies.items():
+        distance += ((E - true_energy(level))/ENERGY_SCALE)**2
+    chi2 = []
+    for k, segment in enumerate(segments):
+        value = 1.0 + (1 + k % 3)*distance
+        if segment['vary'] and segment['err'] > 0:
+            value += ((segment['norm'] - 1.0)/segment['err'])**2
+        chi2.append((segment['number'], value, segment['points']))
+    return chi2
+
+
+def fit_model(levels, segments):
+    '''
+    fit_model(list levels, list segments):
+
+    Move the free energies and widths and the varied normalizations FIT_FRACTION of the way to their true values,
+    in place, as a fit would.
+    '''
+    for line in levels:
+        if not line['fixE']:
+            line['E'] += FIT_FRACTION*(true_energy(line['level']) - line['E'])
+        if not line['fixW']:
+            line['W'] += FIT_FRACTION*(true_width(line['level'], line['channel']) - line['W'])
+    for segment in segments:
+        if segment['vary']:
+            segment['norm'] += FIT_FRACTION*(1.0 - segment['norm'])
+
+
+def write_outputs(levels, segments, output_dir):
+    '''
+    write_outputs(list levels, list segments, string output_dir):
+
+    chiSquared.out, parameters.out, normalizations.out and param.sav in output_dir, laid out as AZURE2 writes them
+    (as far as outfiles.py reads them). Returns the total chi2.
+    '''
+    chi2 = model_chi2(levels, segments)
+    total = sum(value*points for number, value, points in chi2)
+    with open(os.path.join(output_dir, 'chiSquared.out'), "w") as f:
+        f.write("Chi-Squared Values:\n")
+        for number, value, points in chi2:
+            f.write("Segment #%d Chi-Squared/N: %.6f\n" % (number, value))
+        f.write("Total Chi-Squared: %.6f\n\n" % total)
+
+    with open(os.path.join(output_dir, 'parameters.out'), "w") as f:
+        f.write("Level parameters (AZURE2 stand-in)\n\n")
+        previous = None
+        for R, line in enumerate(levels, 1):
+            if line['level'] != previous:
+                if previous is not None:
+                    f.write("\n")
+                f.write("J = %g%s E_level = %.6f MeV\n" % (line['J'], '+' if line['pi'] > 0 else '-', line['E']))
+                previous = line['level']
+            g_int = math.copysign(math.sqrt(abs(line['W'])/2.0e6), line['W'])
+            f.write("  R = %d l = %d s = %.1f G = %.6f eV g_int = %.6f MeV^(1/2) g_ext = (0.000000,0.000000) MeV^(1/2)\n" %
+                    (R, line['l'], line['s'], line['W'], g_int))
+        f.write("\n")
+
+    with open(os.path.join(output_dir, 'normalizations.out'), "w") as f:
+        for segment in segments:
+            f.write("Segment Key #%d %.6f\n" % (segment['number'], segment['norm']))
+
+    with open(os.path.join(output_dir, 'param.sav'), "w") as f:
+        for line in levels:
+            f.write("%.10e %.10e\n" % (line['E'], line['W']))
+        for segment in segments:
+            f.write("%.10e\n" % segment['norm'])
+    return total
+
+
+def run_model(azr_file, menu_choice="1"):
+    '''
+    run_model(string azr_file, string menu_choice):
+
+    What one stand-in run does, without starting a process: read azr_file, fit it for menu choice 2, and write the
+    outputs to its output directory. Returns the total chi2.
+    '''
+    levels, segments, output_dir = read_model(azr_file)
+    if str(menu_choice).strip() == "2":
+        fit_model(levels, segments)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    return write_outputs(levels, segments, output_dir)
+
+
+def standin_command(delay=0.0):
+    '''
+    standin_command(float delay):
+
+    Command to use as the AZURE2 executable (see runner.azure_command): this file on this Python, each run
+    taking 'delay' seconds more than the writing of its outputs.
+    '''
+    return ' '.join(shlex.quote(part) for part in (sys.executable, os.path.abspath(__file__), '--delay', repr(float(delay))))
+
+
+def main(argv):
+    delay = 0.0
+    arguments = []
+    k = 0
+    while k < len(argv):
+        if argv[k] == '--delay' and k+1 < len(argv):
+            delay = float(argv[k+1])
+            k += 2
+            continue
+        if not argv[k].startswith('--'):
+            arguments.append(argv[k])
+        k += 1
+    if len(arguments) != 1:
+        print("Usage: standin.py [--delay seconds] file.azr [--no-gui]")
+        return 1
+    azr_file = arguments[0]
+
+    print("AZURE2 stand-in, reading", azr_file)
+    print("Please select from the following options:\n\t1. Calculate\n\t2. Fit")
+    print("azure2: ", end='', flush=True)
+    choice = sys.stdin.readline().strip()
+    if choice not in ("1", "2"):
+        print("Unknown option '"+choice+"'.")
+        return 1
+    print("Enter a parameter file name or leave blank for new file: ", end='', flush=True)
+    sys.stdin.readline()
+
+    start = time.time()
+    try:
+        total = run_model(azr_file, choice)
+    except (IOError, OSError, ValueError) as error:
+        print("Error:", error)
+        return 1
+    remaining = delay - (time.time() - start)
+    if remaining > 0:
+        time.sleep(remaining)
+    print("Total Chi-Squared:", total)
+    print(FAREWELL, flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
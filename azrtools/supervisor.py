@@ -0,0 +1,126 @@
+'''
+supervisor.py
+
+Supervised AZURE2 runs for scans: a fit that hangs or an AZURE2 that crashes must cost one point, not the night.
+  RunPolicy      - wall-clock / CPU time limits (given, or learned from the runs seen so far) and a number of retries
+  run_problem    - what went wrong with an AzureRun, or None
+  supervised_run - run AZURE2 under a RunPolicy: clear the old outputs, run with the limits, check that the outputs
+                   were written by this run, and try again on failure
+
+The outputs of the previous run are deleted before every attempt, so a run that dies before writing them can never
+be mistaken for a success through the stale files left in the output directory.
+'''
+
+import collections
+import os
+import threading
+
+import numpy as np
+
+from .runner import run_azure
+
+#Learned limits are taken from at most this many recent runs
+MAX_SAMPLES = 1000
+
+
+class RunPolicy(object):
+    '''
+    RunPolicy(float wall_timeout, float cpu_timeout, int retries, bool learn_timeouts, float timeout_factor, ..)
+
+    How AZURE2 runs are supervised. wall_timeout and cpu_timeout are limits in seconds (None for none). With
+    learn_timeouts, once learn_after runs have succeeded, the limits become timeout_factor times the 'quantile' of
+    their wall and CPU times (but never below min_timeout, nor above a limit given). A failed run is tried 'retries'
+    more times. One policy is shared by all workers of a scan, so they learn from each other.
+    '''
+    def __init__(self, wall_timeout=None, cpu_timeout=None, retries=1, learn_timeouts=False, timeout_factor=5.0,
+                 learn_after=5, min_timeout=60.0, quantile=0.95):
+        self.wall_timeout = wall_timeout
+        self.cpu_timeout = cpu_timeout
+        self.retries = retries
+        self.learn_timeouts = learn_timeouts
+        self.timeout_factor = timeout_factor
+        self.learn_after = learn_after
+        self.min_timeout = min_timeout
+        self.quantile = quantile
+        self.wall_times = collections.deque(maxlen=MAX_SAMPLES)
+        self.cpu_times = collections.deque(maxlen=MAX_SAMPLES)
+        self.lock = threading.Lock()
+
+    def _learned(self, limit, times):
+        if not self.learn_timeouts or len(times) < self.learn_after:
+            return limit
+        learned = max(self.min_timeout, self.timeout_factor*float(np.quantile(list(times), self.quantile)))
+        return learned if limit is None else min(limit, learned)
+
+    def limits(self):
+        '''
+        (wall-clock limit, CPU limit) in seconds for the next run, None where there is none.
+        '''
+        with self.lock:
+            return self._learned(self.wall_timeout, self.wall_times), self._learned(self.cpu_timeout, self.cpu_times)
+
+    def observe(self, run):
+        '''
+        observe(AzureRun run):
+
+        Count the times of a successful run towards the learned limits.
+        '''
+        with self.lock:
+            self.wall_times.append(run.elapsed)
+            if run.cpu_time is not None:
+                self.cpu_times.append(run.cpu_time)
+
+
+def run_problem(run):
+    '''
+    run_problem(AzureRun run):
+
+    Why an AZURE2 run cannot be trusted (killed, crashed, no farewell line), or None.
+    '''
+    if run.killed == 'wall':
+        return "killed after %.1f s wall-clock time" % run.elapsed
+    if run.killed == 'cpu':
+        return "killed after going over its CPU time limit"
+    if run.returncode != 0:
+        if run.returncode < 0:
+            return "died of signal %d" % -run.returncode
+        return "exit code %d" % run.returncode
+    if not run.completed:
+        return "exited without its farewell line"
+    return None
+
+
+def supervised_run(policy, executable, azr_file, menu_choice, azure_options, output_dir, outputs=(),
+                   required=("chiSquared.out",), check=None, label="Run"):
+    '''
+    supervised_run(RunPolicy policy, string executable, string azr_file, string menu_choice, string azure_options,
+                   string output_dir, list outputs, list required, function check, string label):
+
+    Run AZURE2 on azr_file with the limits of 'policy', up to policy.retries + 1 times. Before every attempt the
+    files 'outputs' and 'required' are removed from output_dir; an attempt succeeds when AZURE2 exits cleanly, every
+    file in 'required' was written again, and check(output_dir) (if given) returns None rather than a problem.
+    Returns the AzureRun of the last attempt, with 'problem' (None on success) and 'attempts' set.
+    '''
+    attempts = policy.retries + 1
+    for attempt in range(1, attempts+1):
+        for name in set(outputs) | set(required):
+            path = os.path.join(output_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        wall_timeout, cpu_timeout = policy.limits()
+        run = run_azure(executable, azr_file, menu_choice, azure_options, wall_timeout=wall_timeout, cpu_timeout=cpu_timeout)
+        problem = run_problem(run)
+        if problem is None:
+            missing = [name for name in required if not os.path.isfile(os.path.join(output_dir, name))]
+            if missing:
+                problem = "did not write " + ', '.join(missing)
+        if problem is None and check is not None:
+            problem = check(output_dir)
+        run.problem = problem
+        run.attempts = attempt
+        if problem is None:
+            policy.observe(run)
+            return run
+        print(label, " AZURE2", problem, "(attempt", str(attempt), "of", str(attempts)+"). Last console lines:")
+        print('\n'.join(run.console().splitlines()[-10:]))
+    return run
@@ -0,0 +1,107 @@
+'''
+synthetic.py
+
+Made-up .azr files of any size, for benchmarks and tests that cannot use real data.
+  level_line     - one <levels> line, every field placed by common.levelDict
+  segment_line   - one <segmentsData> line of a differential cross section, placed by common.segmentDict1
+  synthetic_azr  - an .azr with a given number of levels, channels per level and segments, and the data files it names
+
+The levels sit 'offset' (relative) away from where the model chi2 of the AZURE2 stand-in is smallest (see standin.py),
+so scans and fits run on them have a minimum at a known place. Every level has J = 1/2, 3/2 or 5/2 and the parity
+of its lowest l; its channels are spin-1/2 + spin-0 pairs (p + 16O like), one particle pair per channel.
+'''
+
+import os
+
+from .common import levelDict, segmentDict1
+from .standin import true_energy, true_width
+
+#Fields of a <levels> line that are the same on every line of a synthetic .azr
+LEVEL_FIELDS = {'UnknownFlag': 1, 'IncludeLevel?': 1, 'J-light': 0.5, 'Pi-light': 1, 'J-heavy': 0, 'Pi-heavy': 1,
+                'ExcEnergyInputMeV': 0.0, 'A-Light': 1, 'A-Heavy': 16, 'Z-light': 1, 'Z-Heavy': 8,
+                'UnknownSeparationEnergyMeV': 0.0, 'ParticlePair#SeparationEnergyMeV': 0.6, 'ChannelRadiusfm': 5.0}
+LEVEL_LINE_FIELDS = 31
+
+CONFIG_LINES = ('true', '1', None, None, 'none', 'none') #None: the output and checks directories
+
+
+def _fields(line):
+    return '   ' + '   '.join(str(value) for value in line)
+
+
+def level_line(J, pi, E, channel, l2, s2, W, fixE=0, fixW=0):
+    '''
+    level_line(float J, int pi, float E, int channel, int l2, int s2, float W, int fixE, int fixW):
+
+    A <levels> line for channel 'channel' (counted from 1, also its particle pair) of level (E MeV, J, pi), with
+    orbital angular momentum l2/2, channel spin s2/2 and width W (eV).
+    '''
+    line = [0]*LEVEL_LINE_FIELDS
+    for name, value in LEVEL_FIELDS.items():
+        line[levelDict[name]] = value
+    for name, value in (('J-channel', J), ('Pi-channel', pi), ('ExcEnergyChannelMeV', E), ('FixE?', fixE),
+                        ('ParticlePair#', channel), ('2S', s2), ('2L', l2), ('ChannelIndex', channel),
+                        ('FixWidth?', fixW), ('WidthChanneleV', W)):
+        line[levelDict[name]] = value
+    return _fields(line)
+
+
+def segment_line(low, high, angle, data_file, normalization=1.0, vary_norm=1, norm_error=5.0):
+    '''
+    segment_line(float low, float high, float angle, string data_file, float normalization, int vary_norm, float norm_error):
+
+    A <segmentsData> line for elastic scattering (pair 1 to pair 1) measured at 'angle' degrees between lab energies
+    low and high (MeV).
+    '''
+    line = [0]*len(set(segmentDict1.values()))
+    for name, value in (('Include?', 1), ('EntrancePair', 1), ('ExitPair', 1), ('LowLabEnergyMeV', low),
+                        ('HighLabEnergyMeV', high), ('LowLabAngleDeg', angle), ('HighLabAngleDeg', angle),
+                        ('DataType', 1), ('Normalization', normalization), ('VaryNorm?', vary_norm),
+                        ('NormError%', norm_error), ('DataFilePath', data_file)):
+        line[segmentDict1[name]] = value
+    return _fields(line)
+
+
+def synthetic_azr(azr_file, num_levels=4, channels_per_level=2, num_segments=2, points_per_segment=20, offset=0.1,
+                  output_dir='output/', checks_dir='checks/', data_folder='data'):
+    '''
+    synthetic_azr(string azr_file, int num_levels, int channels_per_level, int num_segments, int points_per_segment,
+                  float offset, string output_dir, string checks_dir, string data_folder):
+
+    Write an .azr of num_levels levels with channels_per_level channels each and num_segments segments, and a data
+    file of points_per_segment points for every segment in data_folder (next to azr_file, where AZURE2 runs).
+    Energies, widths and normalizations are their stand-in true values times (1 + offset). Returns azr_file.
+    '''
+    folder = os.path.dirname(os.path.abspath(azr_file))
+    levellines = []
+    for n in range(num_levels):
+        J = 0.5 + n % 3
+        l = int(J - 0.5)
+        pi = 1 if l % 2 == 0 else -1
+        E = true_energy(n)*(1 + offset)
+        for c in range(channels_per_level):
+            levellines.append(level_line(J, pi, round(E, 6), c+1, 2*l, 1, round(true_width(n, c)*(1 + offset), 6)))
+
+    os.makedirs(os.path.join(folder, data_folder), exist_ok=True)
+    segmentlines = []
+    top = true_energy(max(num_levels-1, 0)) + 0.5
+    step = top/num_segments
+    for k in range(num_segments):
+        data_file = os.path.join(data_folder, 'segment-%d.dat' % (k+1))
+        low, high = 0.1 + k*step, 0.1 + (k+1)*step
+        angle = 30.0 + 120.0*k/max(num_segments-1, 1)
+        segmentlines.append(segment_line(round(low, 6), round(high, 6), round(angle, 3), data_file, 1.0 + offset))
+        with open(os.path.join(folder, data_file), "w") as f:
+            for p in range(points_per_segment):
+                E = low + (high - low)*p/max(points_per_segment-1, 1)
+                f.write("%.6f   %.3f   %.6e   %.6e\n" % (E, angle, 1.0 + 0.1*p, 0.05))
+
+    configlines = [output_dir if line is None and k == 2 else checks_dir if line is None else line
+                   for k, line in enumerate(CONFIG_LINES)]
+    with open(azr_file, "w") as f:
+        f.write("<setup>\n17F\n</setup>\n")
+        f.write("<config>\n" + '\n'.join(configlines) + "\n</config>\n")
+        f.write("<levels>\n" + '\n'.join(levellines) + "\n</levels>\n")
+        f.write("<segmentsData>\n" + '\n'.join(segmentlines) + "\n</segmentsData>\n")
+        f.write("<segmentsTest>\n</segmentsTest>\n")
+    return azr_file
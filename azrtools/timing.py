@@ -0,0 +1,171 @@
+'''
+timing.py
+
+Where the time of a scan goes, point by point.
+  ScanTimings  - seconds spent in each phase of every point, with a summary (count, mean, p50, p95, max, share)
+                 and a per-point CSV
+  run_profiled - call a function under cProfile, worker threads included, and dump the stats
+  print_profile - the top entries of such a stats file
+
+The phases of a point (see chi2scan.evaluate_point) are
+    patch   - the point's .azr rendered from the compiled template and written
+    cache   - result cache key, lookup, restore and store
+    azure   - AZURE2 itself, with clearing the old outputs, the supervision checks and any retries
+    parse   - chiSquared.out read
+    save    - outputs and .azr filed in chi2search_folder (artifacts, snapshots, curves)
+    results - rows appended to chisquared-output.dat / .npy and the point checkpointed
+'''
+
+import contextlib
+import cProfile
+import csv
+import pstats
+import sys
+import threading
+import time
+
+import numpy as np
+
+PHASES = ('patch', 'cache', 'azure', 'parse', 'save', 'results')
+
+
+class ScanTimings(object):
+    '''
+    ScanTimings(bool enabled):
+
+    Seconds per phase and point, safe to fill from several worker threads. A disabled ScanTimings records nothing,
+    so the scan code can time its phases unconditionally.
+    '''
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.points = {}
+        self.lock = threading.Lock()
+
+    def add(self, index, phase, seconds):
+        '''
+        add(int index, string phase, float seconds):
+
+        Count 'seconds' towards 'phase' of point 'index'.
+        '''
+        if not self.enabled:
+            return
+        with self.lock:
+            point = self.points.setdefault(index, {})
+            point[phase] = point.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, index, phase):
+        '''
+        phase(int index, string phase):
+
+        Context manager timing its block as 'phase' of point 'index'.
+        '''
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(index, phase, time.perf_counter() - start)
+
+    def phases(self):
+        #PHASES first, then any other phase seen, in order of appearance
+        with self.lock:
+            seen = list(PHASES)
+            for point in self.points.values():
+                for phase in point:
+                    if phase not in seen:
+                        seen.append(phase)
+            return [phase for phase in seen if any(phase in point for point in self.points.values())]
+
+    def summary_rows(self):
+        '''
+        [(phase, points, total s, mean s, p50 s, p95 s, max s, share of all time)] over the points timed, the last
+        row being the total per point.
+        '''
+        phases = self.phases()
+        with self.lock:
+            points = list(self.points.values())
+        columns = [(phase, np.array([point[phase] for point in points if phase in point])) for phase in phases]
+        columns.append(('total', np.array([sum(point.values()) for point in points])))
+        grand = float(columns[-1][1].sum()) if points else 0.0
+        rows = []
+        for phase, seconds in columns:
+            if len(seconds) == 0:
+                continue
+            rows.append((phase, len(seconds), float(seconds.sum()), float(seconds.mean()),
+                         float(np.percentile(seconds, 50)), float(np.percentile(seconds, 95)), float(seconds.max()),
+                         float(seconds.sum())/grand if grand > 0 else 0.0))
+        return rows
+
+    def summary(self):
+        '''
+        The summary table as text.
+        '''
+        lines = ["%-8s %7s %10s %10s %10s %10s %10s %6s" % ("phase", "points", "total(s)", "mean(s)", "p50(s)", "p95(s)", "max(s)", "share")]
+        for phase, count, total, mean, p50, p95, peak, share in self.summary_rows():
+            lines.append("%-8s %7d %10.3f %10.4f %10.4f %10.4f %10.4f %5.1f%%" % (phase, count, total, mean, p50, p95, peak, 100*share))
+        return '\n'.join(lines) + '\n'
+
+    def write_csv(self, path):
+        '''
+        write_csv(string path):
+
+        One line per point: index, seconds in every phase (empty where the point did not go through it), total.
+        '''
+        phases = self.phases()
+        with self.lock:
+            points = sorted(self.points.items())
+        with open(path, "w", newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['index'] + phases + ['total'])
+            for index, point in points:
+                writer.writerow([index] + ['%.6f' % point[phase] if phase in point else '' for phase in phases] +
+                                ['%.6f' % sum(point.values())])
+
+
+def run_profiled(stats_file, function, *args, **kwargs):
+    '''
+    run_profiled(string stats_file, function function, *args, **kwargs):
+
+    Call function(*args, **kwargs) under cProfile, threads started meanwhile (the scan's workers) included, and dump
+    the merged stats to stats_file (read it with pstats or snakeviz). Returns what the function returned.
+    '''
+    profiles = [cProfile.Profile()]
+    lock = threading.Lock()
+    per_thread = sys.version_info < (3, 12) #From 3.12 on, one profiler sees every thread
+
+    def profile_thread(frame, event, arg):
+        #Installed by threading.setprofile in every new thread: swap itself for a profiler of that thread
+        profile = cProfile.Profile()
+        with lock:
+            profiles.append(profile)
+        profile.enable()
+
+    if per_thread:
+        threading.setprofile(profile_thread)
+    profiles[0].enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiles[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                try:
+                    stats.add(profile)
+                except TypeError:
+                    pass #A thread that never ran any Python
+        stats.dump_stats(stats_file)
+
+
+def print_profile(stats_file, limit=25, sort='cumulative'):
+    '''
+    print_profile(string stats_file, int limit, string sort):
+
+    Print the 'limit' top functions of a stats file of run_profiled, by 'sort' (cumulative, tottime, ..).
+    '''
+    pstats.Stats(stats_file).sort_stats(sort).print_stats(limit)
@@ -0,0 +1,163 @@
+'''
+transfer.py
+
+What parameters2azr does: copy the fitted level energies and widths (parameters.out) and segment normalizations
+(normalizations.out) of an AZURE2 fit back into an .azr file, so the next fit can start from them.
+  apply_parameters        - edit a parsed .azr in memory
+  parameters_to_azr       - the same from files to a new .azr file
+  batch_parameters_to_azr - one .azr per parameters-N.out / normalizations-N.out pair (e.g. of a scan's
+                            chi2search_folder), from one template parsed once, across a process pool
+
+The batch goes through the warm-start template (levelpatch.PatchTemplate with warm_fields): the template is
+compiled once, and every output is the template text with the fitted energies, widths and normalizations spliced in.
+'''
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .azrfile import read_azr, write_azr
+from .common import levelDict, segmentDict1, segmentDict2
+from .leveltable import LevelTable
+from .levelpatch import PatchTemplate
+from .outfiles import read_parameters_out, read_normalizations_out
+from .warmstart import warm_start_values
+
+
+def _join_fields(arrays):
+    #Every line starts with a newline and every field with three spaces, as AZURE2 writes them
+    outtext = ''
+    for fields in arrays:
+        outtext += '\n'
+        for string in fields:
+            outtext += '   '
+            outtext += string
+    return outtext + '\n'
+
+
+def apply_parameters(doc, alllevellist_param, allnormlist=()):
+    '''
+    apply_parameters(ElementTree doc, list alllevellist_param, list allnormlist):
+
+    Write the energies and widths of alllevellist_param (see outfiles.read_parameters_out) into the <levels> of doc,
+    pairing every channel with its level line by (J, pi, L, S) (see LevelTable.merge_parameters), and the
+    normalizations of allnormlist (see outfiles.read_normalizations_out) into <segmentsData>. Returns doc.
+    '''
+    memoryElem = doc.find('levels') #Levels
+    table = LevelTable(memoryElem.text)
+    levelarrays = [table.tokens(row) for row in range(len(table))]
+    for row, Energy, width in table.merge_parameters(alllevellist_param):
+        levelarrays[row][levelDict['ExcEnergyChannelMeV']] = str(float(Energy))
+        levelarrays[row][levelDict['WidthChanneleV']] = str(float(width))
+    memoryElem.text = _join_fields(levelarrays)
+
+    SegmentDetails = doc.find('segmentsData') #Segments for Normalization
+    if SegmentDetails is None or len(allnormlist) == 0:
+        return doc
+    segmentarrays = []
+    counter_azr = 1 #counts the line number for the segment in the .azr file
+    counter_norm_out = 0
+    for testsegment in SegmentDetails.text.split('\n')[1:-1]:
+        segmentarray = testsegment.split()
+        datatype = int(segmentarray[segmentDict1['DataType']])
+        if counter_norm_out < len(allnormlist) and counter_azr == int(allnormlist[counter_norm_out][0]):
+            if datatype == 2:
+                segmentarray[segmentDict2['Normalization']] = allnormlist[counter_norm_out][1]
+            elif datatype == 0 or datatype == 1 or datatype == 3:
+                segmentarray[segmentDict1['Normalization']] = allnormlist[counter_norm_out][1]
+            else:
+                print('Error classifying segments.')
+            counter_norm_out += 1
+        counter_azr += 1
+        segmentarrays.append(segmentarray)
+    SegmentDetails.text = _join_fields(segmentarrays)
+    return doc
+
+
+def parameters_to_azr(input_azr_file, param_out_path_file, normalization_out_path_file, output_azr_file):
+    '''
+    parameters_to_azr(string input_azr_file, string param_out_path_file, string normalization_out_path_file, string output_azr_file):
+
+    Write output_azr_file: input_azr_file with the fitted parameters and normalizations of an AZURE2 run.
+    normalization_out_path_file can be None to leave the normalizations alone.
+    '''
+    alllevellist_param = read_parameters_out(param_out_path_file)
+    allnormlist = []
+    if normalization_out_path_file is not None:
+        allnormlist = read_normalizations_out(normalization_out_path_file)
+    doc = apply_parameters(read_azr(input_azr_file), alllevellist_param, allnormlist)
+    write_azr(doc, output_azr_file)
+    return doc
+
+
+def batch_pairs(param_out_pattern, output_folder, output_stem):
+    '''
+    batch_pairs(string param_out_pattern, string output_folder, string output_stem):
+
+    (parameters file, normalizations file or None, output .azr) for every file matching the glob param_out_pattern.
+    The normalizations file is the one next to it with 'parameters' replaced by 'normalizations' in its name;
+    the output is output_stem plus what follows 'parameters' in the name, e.g. parameters-12.out -> <stem>-12.azr.
+    '''
+    pairs = []
+    outputs = set()
+    for param_out in sorted(glob.glob(param_out_pattern)):
+        folder, name = os.path.split(param_out)
+        norm_out = os.path.join(folder, name.replace('parameters', 'normalizations', 1))
+        if norm_out == param_out or not os.path.isfile(norm_out):
+            norm_out = None
+        tag = os.path.splitext(name)[0].split('parameters', 1)[-1]
+        if tag == '':
+            tag = '-' + os.path.basename(os.path.abspath(folder)) #e.g. run-3/output/parameters.out
+        output_azr = os.path.join(output_folder, output_stem + tag + '.azr')
+        if output_azr in outputs:
+            raise ValueError("Two parameters files would both be written to "+output_azr)
+        outputs.add(output_azr)
+        pairs.append((param_out, norm_out, output_azr))
+    return pairs
+
+
+#Compiled template of a batch, set once in every worker process
+_batch_template = None
+
+
+def _set_batch_template(template):
+    global _batch_template
+    _batch_template = template
+
+
+def _transfer_one(pair):
+    param_out, norm_out, output_azr = pair
+    warm = warm_start_values(_batch_template, param_out, norm_out)
+    if warm is None:
+        return output_azr, False
+    _batch_template.write(output_azr, [], warm=warm)
+    return output_azr, True
+
+
+def batch_parameters_to_azr(template_azr_file, param_out_pattern, output_folder='.', output_stem=None, processes=None):
+    '''
+    batch_parameters_to_azr(string template_azr_file, string param_out_pattern, string output_folder, string output_stem, int processes):
+
+    Write one .azr per file matching param_out_pattern (e.g. 'chi2search_folder/parameters-*.out'), each being the
+    template with the fitted parameters and normalizations of that file and its normalizations pair (see batch_pairs).
+    output_stem defaults to the name of the template without .azr. The template is parsed once and the files are
+    written by 'processes' worker processes (all cores by default, 1 to stay in this process).
+    Returns (written, failed): the output files written, and the parameters files that could not be read.
+    '''
+    if output_stem is None:
+        output_stem = os.path.splitext(os.path.basename(template_azr_file))[0]
+    pairs = batch_pairs(param_out_pattern, output_folder, output_stem)
+    os.makedirs(output_folder, exist_ok=True)
+    template = PatchTemplate(read_azr(template_azr_file), [], warm_fields=True)
+
+    if processes == 1 or len(pairs) < 2:
+        _set_batch_template(template)
+        outcome = [_transfer_one(pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_set_batch_template, initargs=(template,)) as pool:
+            chunksize = max(1, len(pairs)//(4*(processes or os.cpu_count() or 1)))
+            outcome = list(pool.map(_transfer_one, pairs, chunksize=chunksize))
+
+    written = [output_azr for output_azr, ok in outcome if ok]
+    failed = [pair[0] for pair, (output_azr, ok) in zip(pairs, outcome) if not ok]
+    return written, failed
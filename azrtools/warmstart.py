@@ -0,0 +1,69 @@
+'''
+warmstart.py
+
+Warm-started fits: each grid point's fit starts from the parameters the fit of the point before it converged to,
+instead of from the values in the template .azr. Neighbouring points have nearby minima, so AZURE2 needs fewer
+iterations per point and the chi2 surface does not jump between different local minima.
+
+The fitted level energies/widths (parameters.out) and segment normalizations (normalizations.out) of the previous
+point are spliced into the template, matched to the level lines the way parameters2azr does; the scanned
+fields are then overwritten with the values of the point itself. A warm start only helps if consecutive points are
+close, so the plan is visited in serpentine order (grid) or nearest-neighbour order (sampled points).
+'''
+
+import numpy as np
+
+from .levelpatch import LEVEL_ENERGY, LEVEL_WIDTH, NORMALIZATION
+from .outfiles import read_parameters_out, read_normalizations_out
+
+
+def warm_start_values(template, param_out_path_file, normalization_out_path_file=None):
+    '''
+    warm_start_values(PatchTemplate template, string param_out_path_file, string normalization_out_path_file):
+
+    Warm-start fill for template.render, from the output files of a finished fit.
+    Levels are matched on J, pi, L and S (see LevelTable.merge_parameters), as parameters2azr does.
+    Returns None when the files are missing or cannot be read, so the caller falls back to a cold start.
+    '''
+    try:
+        alllevellist_param = read_parameters_out(param_out_path_file)
+        allnormlist = []
+        if normalization_out_path_file is not None:
+            allnormlist = read_normalizations_out(normalization_out_path_file)
+    except (IOError, OSError, ValueError, IndexError, TypeError):
+        return None
+    if len(alllevellist_param) == 0:
+        return None
+
+    warm = {}
+    for row, Energy, width in template.table.merge_parameters(alllevellist_param):
+        warm[(LEVEL_ENERGY, row)] = str(float(Energy))
+        warm[(LEVEL_WIDTH, row)] = str(float(width))
+    for segment, norm in allnormlist:
+        warm[(NORMALIZATION, int(segment))] = norm
+    return warm
+
+
+def nearest_neighbour_order(points, ranges):
+    '''
+    nearest_neighbour_order(list points, list ranges):
+
+    Reorder a list of (index, values) so that each point is followed by the closest one not visited yet
+    (distances measured in units of ranges[k] = (low, high)), starting from the first point. Greedy, O(n^2).
+    '''
+    points = list(points)
+    if len(points) < 3:
+        return points
+    span = np.array([float(high) - float(low) for low, high in ranges])
+    span[span == 0] = 1.0
+    x = np.array([values for index, values in points], dtype=float)/span
+    left = np.ones(len(points), dtype=bool)
+    order = [0]
+    left[0] = False
+    for step in range(len(points)-1):
+        d = np.sum((x - x[order[-1]])**2, axis=1)
+        d[~left] = np.inf
+        nearest = int(np.argmin(d))
+        order.append(nearest)
+        left[nearest] = False
+    return [points[i] for i in order]
@@ -0,0 +1,472 @@
+'''
+workqueue.py
+
+A scan spread over many machines through a shared directory (NFS, or any local directory): the scan is cut into
+one task per point, workers on any host claim tasks, run them and publish the results, and a collector merges the
+results into the usual chisquared-output.dat, chisquared-output.npy and chi2search_folder.
+  submit_scan     - write the tasks of a scan definition (grid, sobol or lhs) into a queue directory
+  run_worker      - claim and run tasks until the queue is empty
+  collect_results - merge the published results into the standard outputs, once or until the scan is complete
+  reclaim_leases  - put the tasks of dead workers back in the queue
+  queue_status    - number of tasks pending, claimed and published
+
+Layout of a queue directory:
+    scan.json             - the scan definition and the AZURE2 run settings
+    pending/N.json        - task of point N, waiting for a worker
+    claimed/N.json@WORKER - task claimed by WORKER; its modification time is the worker's lease
+    results/N/            - outputs of point N (result.json, chiSquared.out, .., the point's .azr)
+    clocks/WORKER         - touched to read the file server's clock
+    collected.txt         - points already merged by the collector
+
+A worker claims a task by renaming it from pending/ to claimed/, which only one worker can do. While it runs the
+point it touches its claims every lease_seconds/4. A claim not touched for lease_seconds (by the clock of the file
+server, not of any one host) belongs to a dead worker and is put back in pending/ by whoever notices. A task that
+loses its lease max_leases times is published as failed. Results are written to a temporary directory first and
+renamed into results/, so a point is published whole, once: a slow worker whose point was run again elsewhere
+finds it published and drops its copy.
+
+Workers run in the directory the scan was submitted from (usually the same shared directory), since the .azr and
+the data files are found from there. Every AZURE2 run goes to a scratch directory of the worker.
+Points depend on each other in adaptive, minimize and warm-started scans, so these are not run through a queue.
+'''
+
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .chi2scan import (ScanJob, WorkerSlot, make_worker_slots, evaluate_point, save_point_files, saved_point_azr,
+                       record_failure, POINT_OUTPUT_FILES)
+from .azureout import find_azureout_files
+from .sampling import grid_points, sobol_points, lhs_points
+from .scanstate import ResultWriter, ResultTee, _jsonable, _tuples, _sync
+from .resultarray import ResultArray
+from .resultcache import ResultCache
+from .supervisor import RunPolicy
+from .timing import ScanTimings
+from .explore import write_timings
+
+QUEUE_SCAN_MODES = ('grid', 'sobol', 'lhs')
+
+#A claim not renewed for this many seconds is taken to belong to a dead worker
+LEASE_SECONDS = 600.0
+
+#A task whose lease ran out this many times is given up as failed (it may be what kills the workers)
+MAX_LEASES = 3
+
+#How long an idle worker or a waiting collector sleeps before looking at the queue again
+POLL_SECONDS = 10.0
+
+RESULT_NAME = "result.json"
+
+
+def worker_id():
+    '''
+    Name of this process in the queue: host name and process id.
+    '''
+    return socket.gethostname() + "-" + str(os.getpid())
+
+
+def _write_json(path, content):
+    #Write to a temporary name next to 'path' and rename, so readers only ever see whole files
+    tmp = path + ".tmp-" + worker_id()
+    with open(tmp, "w") as f:
+        json.dump(_jsonable(content), f)
+        _sync(f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _task_index(name):
+    return int(name.split('.', 1)[0])
+
+
+def _server_time(queue_dir, name):
+    #Current time by the clock of the file server holding the queue, which is what lease times are compared to
+    path = os.path.join(queue_dir, "clocks", name)
+    with open(path, "a"):
+        pass
+    os.utime(path, None)
+    return os.path.getmtime(path)
+
+
+def submit_scan(definition, queue_dir, menu_choice="2", azure_options="--no-gui", wall_timeout=None, cpu_timeout=None,
+                retries=1, learn_timeouts=False, lease_seconds=LEASE_SECONDS, max_leases=MAX_LEASES, timings_file=None,
+                directory=None, outputs=None):
+    '''
+    submit_scan(dict definition, string queue_dir, string menu_choice, string azure_options, ...):
+
+    Write the scan 'definition' (see explore.new_scan_definition) into queue_dir as one task per point.
+    The run settings (menu choice, options, time limits and retries, see supervisor.RunPolicy) are those of every
+    worker. With timings_file, every worker times the phases of its points (see timing.py) and writes them to
+    <name>-<worker><ext> next to it when it stops.
+    With a directory, the paths of the definition and timings_file are relative to it, and the workers run there;
+    without, they run in the directory they are started from. 'outputs' gives collect_results the files to merge
+    into (results_file, results_array_file, chi2search_folder, save_out_files, save_azr_files) when it is not
+    given them itself.
+    Raises ValueError for a queue_dir that already holds a scan, or a scan mode that cannot be queued.
+    Returns the number of tasks.
+    '''
+    scan_mode = definition['scan_mode']
+    if scan_mode not in QUEUE_SCAN_MODES:
+        raise ValueError("A "+scan_mode+" scan cannot be run through a queue, use one of "+', '.join(QUEUE_SCAN_MODES))
+    if os.path.exists(os.path.join(queue_dir, "scan.json")):
+        raise ValueError(queue_dir+" already holds a scan")
+    for folder in ("pending", "claimed", "results", "clocks"):
+        os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    paramarrays = definition['paramarrays']
+    ranges = [(paramarray[0], paramarray[-1]) for paramarray in paramarrays]
+    if scan_mode == 'sobol':
+        points = sobol_points(ranges, definition['num_samples'])
+    elif scan_mode == 'lhs':
+        points = lhs_points(ranges, definition['num_samples'], definition['sampling_seed'])
+    else:
+        points = grid_points(*paramarrays)
+    numpoints = 0
+    for index, values in points:
+        _write_json(os.path.join(queue_dir, "pending", "%d.json" % index), {'index': index, 'values': values, 'leases': 0})
+        numpoints += 1
+
+    if definition['warm_start']:
+        print('Warm start is not used by a queued scan, every point starts from the input .azr.')
+    scan = {'definition': definition, 'num_points': numpoints, 'menu_choice': menu_choice,
+            'azure_options': azure_options, 'wall_timeout': wall_timeout, 'cpu_timeout': cpu_timeout,
+            'retries': retries, 'learn_timeouts': learn_timeouts, 'lease_seconds': lease_seconds,
+            'max_leases': max_leases, 'timings_file': timings_file,
+            'directory': os.path.abspath(directory) if directory is not None else None, 'outputs': outputs or {}}
+    #Written last: workers only start on a queue whose tasks are all there
+    _write_json(os.path.join(queue_dir, "scan.json"), scan)
+    return numpoints
+
+
+def load_queue_scan(queue_dir):
+    '''
+    load_queue_scan(string queue_dir):
+
+    The scan.json of a queue, its definition's lists turned back into tuples as in a checkpoint.
+    '''
+    scan = _read_json(os.path.join(queue_dir, "scan.json"))
+    definition = scan['definition']
+    for key in list(definition.keys()):
+        if key != 'paramarrays':
+            definition[key] = _tuples(definition[key])
+    return scan
+
+
+def queue_status(queue_dir):
+    '''
+    queue_status(string queue_dir):
+
+    {'total', 'pending', 'claimed', 'published'} task counts of a queue.
+    '''
+    scan = _read_json(os.path.join(queue_dir, "scan.json"))
+    def count(folder, keep):
+        return len([name for name in os.listdir(os.path.join(queue_dir, folder)) if keep(name)])
+    return {'total': scan['num_points'],
+            'pending': count("pending", lambda name: name.endswith(".json")),
+            'claimed': count("claimed", lambda name: "@" in name and ".expired-" not in name),
+            'published': count("results", lambda name: name.isdigit())}
+
+
+def reclaim_leases(queue_dir, lease_seconds=LEASE_SECONDS, max_leases=MAX_LEASES, reclaimer=None):
+    '''
+    reclaim_leases(string queue_dir, float lease_seconds, int max_leases, string reclaimer):
+
+    Put every task whose claim has not been renewed for lease_seconds back in pending/, counting the lost lease.
+    A task that has lost max_leases leases is published as failed instead. Safe to call from any number of
+    workers at once. Returns the indices reclaimed.
+    '''
+    reclaimer = reclaimer or worker_id()
+    claimed = os.path.join(queue_dir, "claimed")
+    now = _server_time(queue_dir, reclaimer)
+    reclaimed = []
+    for name in os.listdir(claimed):
+        if "@" not in name or ".expired-" in name:
+            continue
+        path = os.path.join(claimed, name)
+        try:
+            if now - os.path.getmtime(path) <= lease_seconds:
+                continue
+            #Whoever renames the claim away owns the reclaim
+            expired = path + ".expired-" + reclaimer
+            os.rename(path, expired)
+        except (FileNotFoundError, OSError):
+            continue
+        task = _read_json(expired)
+        task['leases'] = task.get('leases', 0) + 1
+        if task['leases'] >= max_leases:
+            _publish(queue_dir, task['index'], {'index': task['index'], 'values': task['values'], 'rows': [],
+                     'problem': "lease expired %d times, its workers died" % task['leases'], 'worker': reclaimer})
+        else:
+            _write_json(os.path.join(queue_dir, "pending", "%d.json" % task['index']), task)
+        os.remove(expired)
+        reclaimed.append(task['index'])
+    return reclaimed
+
+
+def _claim(queue_dir, me):
+    #Rename one pending task to a claim of 'me'. Returns (claim path, task) or None when nothing is pending.
+    pending = os.path.join(queue_dir, "pending")
+    names = sorted((name for name in os.listdir(pending) if name.endswith(".json")), key=_task_index)
+    if len(names) == 0:
+        return None
+    #Workers start at different places in the list, so they rarely race for the same task
+    start = random.randrange(len(names))
+    for name in names[start:] + names[:start]:
+        claim = os.path.join(queue_dir, "claimed", name + "@" + me)
+        try:
+            os.rename(os.path.join(pending, name), claim)
+        except (FileNotFoundError, OSError):
+            continue
+        os.utime(claim, None)
+        return claim, _read_json(claim)
+    return None
+
+
+def _publish(queue_dir, index, result, files=()):
+    #Publish the result of a point with its output files, unless it is published already. Returns True if it was.
+    tmp = os.path.join(queue_dir, "results", ".tmp-%d-%s" % (index, worker_id()+"-"+str(threading.get_ident())))
+    os.makedirs(tmp, exist_ok=True)
+    for path in files:
+        if os.path.isfile(path):
+            shutil.copyfile(path, os.path.join(tmp, os.path.basename(path)))
+    _write_json(os.path.join(tmp, RESULT_NAME), result)
+    try:
+        os.rename(tmp, os.path.join(queue_dir, "results", str(index)))
+        return True
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True) #Run elsewhere as well, and published there first
+        return False
+
+
+class _Heartbeat(object):
+    #Renews the claims held by this worker process every 'interval' seconds
+    def __init__(self, interval):
+        self.interval = interval
+        self.claims = set()
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.beat)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def beat(self):
+        while not self.done.wait(self.interval):
+            with self.lock:
+                claims = list(self.claims)
+            for claim in claims:
+                try:
+                    os.utime(claim, None)
+                except OSError:
+                    pass #Reclaimed by someone else; the point is published by whoever finishes first
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+
+def run_worker(queue_dir, executable, num_slots=1, scratch_folder=None, cache_folder=None, cache_max_mb=2000,
+               max_tasks=None):
+    '''
+    run_worker(string queue_dir, string executable, int num_slots, string scratch_folder, string cache_folder, ..):
+
+    Claim, run and publish the tasks of the queue in queue_dir with the AZURE2 at 'executable', num_slots points at
+    a time, until no task is pending or claimed, or max_tasks tasks have been run. While the last tasks are out
+    with other workers it stays, to take over those whose lease runs out. scratch_folder (default
+    queue_dir/workers/<worker>) holds the worker's AZURE2 runs; cache_folder an optional AZURE2 result cache. A scan
+    submitted with a directory (see submit_scan) is run from there.
+    Returns the number of tasks run.
+    '''
+    me = worker_id()
+    scan = load_queue_scan(queue_dir)
+    definition = scan['definition']
+    queue_dir = os.path.abspath(queue_dir)
+    if scratch_folder is None:
+        scratch_folder = os.path.join(queue_dir, "workers", me)
+    scratch_folder = os.path.abspath(scratch_folder)
+    cache = ResultCache(cache_folder, cache_max_mb) if cache_folder is not None else None
+    back = os.getcwd()
+    if scan.get('directory') is not None:
+        #A scan submitted from a spec: its paths are relative to the spec's directory, where AZURE2 finds the data files
+        os.chdir(scan['directory'])
+    try:
+        policy = RunPolicy(scan['wall_timeout'], scan['cpu_timeout'], scan['retries'], scan['learn_timeouts'])
+        #Outputs are published from the slot's output directory, nothing is kept in the worker's own chi2search_folder
+        job = ScanJob(definition['input_azr_file'], definition['thingstovary_withrange'], executable,
+                      menu_choice=scan['menu_choice'], azure_options=scan['azure_options'],
+                      chi2search_folder=os.path.join(scratch_folder, "chi2search_folder"), save_out_files=False,
+                      save_azr_files=False, cache=cache, policy=policy,
+                      timings=ScanTimings(enabled=scan.get('timings_file') is not None),
+                      free_widths_only=definition.get('free_widths_only', False))
+        working_azr_file = os.path.basename(definition['working_azr_file'])
+        slots = make_worker_slots(num_slots, working_azr_file, scratch_folder, isolated=True)
+        lease_seconds = scan['lease_seconds']
+        heartbeat = _Heartbeat(lease_seconds/4.0)
+        count = [0]
+        count_lock = threading.Lock()
+
+        def take():
+            #Next task for a slot, or None when the worker is done
+            while True:
+                with count_lock:
+                    if max_tasks is not None and count[0] >= max_tasks:
+                        return None
+                claimed = _claim(queue_dir, me)
+                if claimed is not None:
+                    with count_lock:
+                        count[0] += 1
+                    return claimed
+                reclaim_leases(queue_dir, lease_seconds, scan['max_leases'], me)
+                status = queue_status(queue_dir)
+                if status['pending'] > 0:
+                    continue
+                if status['claimed'] == 0:
+                    return None
+                time.sleep(min(POLL_SECONDS, lease_seconds/4.0))
+
+        def work(slot):
+            while True:
+                claimed = take()
+                if claimed is None:
+                    return
+                claim, task = claimed
+                with heartbeat.lock:
+                    heartbeat.claims.add(claim)
+                try:
+                    index, values = task['index'], task['values']
+                    started = time.time()
+                    rows, outputs_available = evaluate_point(job, slot, index, values)
+                    outputs = [os.path.join(slot.output_dir, name) for name, saved_name in POINT_OUTPUT_FILES]
+                    outputs += [path for aa, R, path in find_azureout_files(slot.output_dir) if path not in outputs]
+                    result = {'index': index, 'values': values, 'rows': rows, 'worker': me,
+                              'elapsed': time.time() - started, 'problem': job.failures.pop(index, None),
+                              'outputs': outputs_available}
+                    if len(rows) == 0 or not outputs_available:
+                        outputs = []
+                    with job.timings.phase(index, 'results'):
+                        _publish(queue_dir, index, result, outputs + [saved_point_azr(job, slot)])
+                finally:
+                    with heartbeat.lock:
+                        heartbeat.claims.discard(claim)
+                    try:
+                        os.remove(claim)
+                    except OSError:
+                        pass
+
+        print('Worker', me, 'on', queue_dir, 'with', len(slots), 'slot(s)..')
+        try:
+            with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+                for future in [pool.submit(work, slot) for slot in slots]:
+                    future.result()
+        finally:
+            heartbeat.stop()
+            if scan.get('timings_file') is not None and count[0] > 0:
+                stem, ext = os.path.splitext(scan['timings_file'])
+                write_timings(job.timings, stem+'-'+me+ext)
+        print('Worker', me, 'ran', count[0], 'task(s).')
+        return count[0]
+    finally:
+        os.chdir(back)
+
+
+#Where collect_results merges a scan to, unless it is told or the scan was submitted with its own outputs
+COLLECT_OUTPUTS = {'results_file': 'chisquared-output.dat', 'results_array_file': 'chisquared-output.npy',
+                   'chi2search_folder': './chi2search_folder', 'save_out_files': True, 'save_azr_files': True}
+
+
+def collect_results(queue_dir, results_file=None, results_array_file=None, chi2search_folder=None,
+                    save_out_files=None, save_azr_files=None, wait=False, poll_seconds=POLL_SECONDS, no_array=False):
+    '''
+    collect_results(string queue_dir, string results_file, string results_array_file, string chi2search_folder, ..):
+
+    Merge the results published in queue_dir into results_file, results_array_file (no .npy with no_array) and
+    chi2search_folder, as run_scan would have written them. What is not given is taken from the 'outputs' the scan
+    was submitted with (see submit_scan), or else from COLLECT_OUTPUTS. Points merged by an earlier call are kept, so it can
+    be called as often as wanted while the workers run; with wait, it keeps going (and reclaiming stale leases)
+    until every point is in. Failed points go to chi2search_folder/failed-points.txt.
+    Returns queue_status, with 'collected' and 'failed' counts added.
+    '''
+    scan = load_queue_scan(queue_dir)
+    definition = scan['definition']
+    given = {'results_file': results_file, 'results_array_file': results_array_file,
+             'chi2search_folder': chi2search_folder, 'save_out_files': save_out_files, 'save_azr_files': save_azr_files}
+    for key, value in given.items():
+        if value is None:
+            given[key] = scan.get('outputs', {}).get(key, COLLECT_OUTPUTS[key])
+    results_file, results_array_file, chi2search_folder = given['results_file'], given['results_array_file'], given['chi2search_folder']
+    save_out_files, save_azr_files = given['save_out_files'], given['save_azr_files']
+    if no_array:
+        results_array_file = None
+    for folder in (chi2search_folder, os.path.dirname(results_file)):
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    input_azr_file = definition['input_azr_file']
+    if scan.get('directory') is not None:
+        input_azr_file = os.path.join(scan['directory'], input_azr_file)
+    job = ScanJob(input_azr_file, definition['thingstovary_withrange'], None,
+                  chi2search_folder=chi2search_folder, save_out_files=save_out_files, save_azr_files=save_azr_files,
+                  archive_snapshots=definition['archive_snapshots'], archive_curves=definition['archive_curves'])
+    working_azr_name = os.path.basename(definition['working_azr_file'])
+
+    collected_path = os.path.join(queue_dir, "collected.txt")
+    collected = {}
+    if os.path.exists(collected_path):
+        with open(collected_path, "r") as f:
+            for line in f:
+                array = line.split()
+                if line.endswith('\n') and len(array) == 2:
+                    collected[int(array[0])] = array[1]
+    with_rows = set(index for index, state in collected.items() if state == 'ok')
+    writers = [ResultWriter(results_file, keep_indices=with_rows)]
+    if results_array_file is not None:
+        metadata = {'input_azr_file': definition['input_azr_file'], 'scan_mode': definition['scan_mode'],
+                    'thingstovary_withrange': definition['thingstovary_withrange'],
+                    'segment_values': 'Chi-Squared/N from chiSquared.out, in file order'}
+        writers.append(ResultArray(results_array_file, len(definition['thingstovary_withrange']), job.num_segments,
+                                   metadata, with_rows))
+    results = ResultTee(*writers)
+    log = open(collected_path, "a")
+    try:
+        while True:
+            results_dir = os.path.join(queue_dir, "results")
+            new = sorted(int(name) for name in os.listdir(results_dir) if name.isdigit() and int(name) not in collected)
+            for index in new:
+                folder = os.path.join(results_dir, str(index))
+                result = _read_json(os.path.join(folder, RESULT_NAME))
+                rows = [tuple(row) for row in result['rows']]
+                if len(rows) > 0:
+                    results.write_point(rows)
+                    save_point_files(job, WorkerSlot(folder, os.path.join(folder, working_azr_name), folder), index,
+                                     outputs_available=result.get('outputs', True))
+                    state = 'ok'
+                else:
+                    record_failure(job, index, result['values'], result['problem'] or "failed")
+                    if save_azr_files:
+                        save_point_files(job, WorkerSlot(folder, os.path.join(folder, working_azr_name), folder), index,
+                                         outputs_available=False)
+                    state = 'failed'
+                collected[index] = state
+                log.write("%d %s\n" % (index, state))
+                _sync(log)
+            if len(new) > 0:
+                print('Collected', len(new), 'point(s),', len(collected), 'of', scan['num_points'], 'in.')
+            if not wait or len(collected) >= scan['num_points']:
+                break
+            reclaim_leases(queue_dir, scan['lease_seconds'], scan['max_leases'])
+            time.sleep(poll_seconds)
+    finally:
+        log.close()
+        results.close()
+    status = queue_status(queue_dir)
+    status['collected'] = len(collected)
+    status['failed'] = len([state for state in collected.values() if state == 'failed'])
+    return status
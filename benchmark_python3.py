@@ -0,0 +1,57 @@
+'''
+benchmark_python3.py
+
+Throughput benchmarks of the scripts that need neither AZURE2 nor real data: synthetic .azr files of several sizes
+(azrtools.synthetic) are scanned with a stand-in AZURE2 (azrtools.standin), and the outputs of a stand-in fit are
+fed to parameters2azr and pretty_printer. Every run is appended to RESULTS_FILE with the commit, host and versions,
+and compared with the run before it, so that a slowdown shows up as a ratio above 1.
+
+python3 benchmark_python3.py [scan] [parameters2azr] [pretty_printer] [--sizes small,medium,large]
+python3 benchmark_python3.py --compare [run [baseline run]]
+
+With no scenario named, all three run. --compare only prints the comparison of two saved runs (by their 'run'
+time stamp; the last two by default). The stand-in can also stand in for AZURE2 in the other scripts:
+AZURE_EXECUTABLE_FULL_PATH = 'python3 /path/to/azrtools/standin.py --delay 2'
+'''
+
+import sys
+
+from azrtools.benchmark import SCENARIOS, run_benchmarks, save_benchmarks, read_benchmarks, comparison_rows, comparison_table
+
+#Where the benchmarks work (emptied before each one) and where their results are kept
+BENCHMARK_FOLDER = './benchmark_work'
+RESULTS_FILE = './benchmark-results.jsonl'
+
+#Sizes of synthetic .azr to run (see azrtools.benchmark.SIZES), and timing repeats of parameters2azr / pretty_printer
+SIZES = ('small', 'medium', 'large')
+REPEATS = 5
+
+#The scan benchmark: a SCAN_STEPS x SCAN_STEPS grid on SCAN_WORKERS workers, the stand-in sleeping STANDIN_DELAY
+#seconds per run. With no delay the scan measures its own overhead; set it near a real fit time to see the overlap.
+SCAN_STEPS = 4
+SCAN_WORKERS = 2
+STANDIN_DELAY = 0.0
+
+
+def main(argv):
+    if '--compare' in argv:
+        runs = [arg for arg in argv if arg != '--compare']
+        rows = comparison_rows(read_benchmarks(RESULTS_FILE), *runs[:2])
+        print(comparison_table(rows), end='')
+        return
+
+    sizes = SIZES
+    if '--sizes' in argv:
+        k = argv.index('--sizes')
+        sizes = argv[k+1].split(',')
+        argv = argv[:k] + argv[k+2:]
+    scenarios = argv if argv else SCENARIOS
+
+    records = run_benchmarks(BENCHMARK_FOLDER, scenarios, sizes, REPEATS, SCAN_STEPS, SCAN_WORKERS, STANDIN_DELAY)
+    save_benchmarks(records, RESULTS_FILE)
+    print('Results added to', RESULTS_FILE)
+    print(comparison_table(comparison_rows(read_benchmarks(RESULTS_FILE))), end='')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -19,6 +19,46 @@ When this is the case, the updated program changes energies for all the involved
 
 update v0.3
 5. Use pexpect to run Azure in text mode and perform fits at each value. Write progres to a log file, and results to a .dat file
+7. Grid points can be run in parallel (NUM_PARALLEL_WORKERS). Every worker patches its own copy of the input .azr
+in a scratch directory, and the results are gathered back into chisquared-output.dat and chi2search_folder.
+8. AZURE2 no longer runs under pexpect: the menu answers are fed over stdin and a point is done as soon as
+AZURE2 exits, without the fixed 1.5 s sleep. The time each run took is printed.
+9. Results are written to chisquared-output.dat point by point, and the scan is checkpointed.
+An interrupted scan can be picked up again with: python3 chi2explore_v0.3minimizer_python3.py --resume
+10. Optional on-disk cache of AZURE2 results (AZURE_CACHE_FOLDER), so overlapping scans do not rerun points already fitted.
+11. Adaptive mode (SCAN_MODE = 'adaptive'): start from a coarse grid and refine only around the minimum and the
+delta-chi2 contour. Points land in chisquared-output.dat as usual, with irregular spacing.
+12. Any number of parameters can be varied. Besides the full grid, SCAN_MODE = 'sobol' / 'lhs' samples a fixed budget of
+points. Points are generated one at a time as workers free up.
+13. Minimization mode (SCAN_MODE = 'minimize'): Nelder-Mead or golden-section search on the chi2 from AZURE2,
+over the chosen parameters, with tolerances and an evaluation budget.
+14. Warm-started fits (WARM_START = True): each point's fit starts from the parameters the previous point converged to,
+with the scanned parameters set to the point's own values. Points are visited in serpentine/nearest-neighbour order.
+15. chi2search_folder stores every distinct output file once (objects/, by content hash) and lists the files of each
+point in manifest.jsonl. The usual per-point names (chiSquared-12.out, ..) are hard links to the stored copies.
+16. ARCHIVE_SNAPSHOTS = True keeps parameters.out and param.sav of every point as lzma-compressed deltas against the
+first point, under chi2search_folder/snapshots/. Any point can be rebuilt with azrtools.snapshots.
+17. Results are also saved as a NumPy structured array (chisquared-output.npy, one record per point with p1.., the total
+chi2 and the Chi-Squared/N of each segment) with a JSON sidecar. Load it memory-mapped with azrtools.resultarray.load_results.
+18. The scan itself is run by azrtools.explore (parameter_catalog, new_scan_definition, run_scan, ..), which other programs
+can call directly; this script holds the settings and asks for the parameters.
+19. ARCHIVE_CURVES = True keeps every AZUREOut_aa=*_R=*.out of every point (all reactions, not only aa=1 R=1) as
+float64 arrays in one binary file, chi2search_folder/curves/, indexed by point and reaction. See azrtools.azureout.
+20. Scans without prompts: a scan spec (JSON or TOML, see azrtools/scanspec.py) names the .azr, the executable, the
+parameters by level (E, J, pi[, L, S]) and their ranges. Any number of spec files run back to back with
+    python3 chi2explore_v0.3minimizer_python3.py --spec scan1.json scan2.toml ..
+and the scan entered at the prompts can be saved as a spec instead of run with --save-spec scan.json.
+21. Supervised AZURE2 runs: wall-clock and CPU time limits (AZURE_WALL_TIMEOUT, AZURE_CPU_TIMEOUT, or learned from the
+runs so far with LEARN_AZURE_TIMEOUTS), the whole process group is killed, and a run only counts if it wrote a fresh
+chiSquared.out. Failed points are retried AZURE_RETRIES times, then listed in chi2search_folder/failed-points.txt.
+22. Scans across machines through a shared directory (see azrtools/workqueue.py):
+    python3 chi2explore_v0.3minimizer_python3.py --submit QUEUE_DIR [scan.json]   (cut the scan into point tasks)
+    python3 chi2explore_v0.3minimizer_python3.py --worker QUEUE_DIR               (as many as wanted, on any host)
+    python3 chi2explore_v0.3minimizer_python3.py --collect QUEUE_DIR [--wait]     (merge into the usual outputs)
+Run them all in the directory holding the .azr and data files. Workers run NUM_PARALLEL_WORKERS points at a time.
+23. Every phase of every point (.azr patching, cache, AZURE2, parsing, filing the outputs, writing the results) is
+timed: per point in TIMINGS_FILE (CSV), and a summary table with mean, p50, p95 and max at the end of the scan.
+With --profile the whole run goes through cProfile (worker threads included), stats in PROFILE_STATS_FILE.
 
 B.Sudarsan
 6 Feb 2019
@@ -28,20 +68,19 @@ Ported to python3 on 4 July 2019
 '''
 
 #Prologue: Library imports, and function declarations
-import numpy as np
-import lxml.etree as ET
-import os
-import pexpect as px
 import sys
-import time
+
+from azrtools.leveltable import LevelTable
+from azrtools.azrfile import read_azr
+from azrtools.explore import parameter_catalog, ask_parameters, new_scan_definition, load_scan_definition, run_scan
+from azrtools.scanspec import read_scan_specs, run_scan_specs, scan_spec, write_scan_spec, submit_scan_spec
+from azrtools.workqueue import submit_scan, run_worker, collect_results
+from azrtools.timing import run_profiled, print_profile
 
 
 #Filenames used:
 input_azr_file = 'F17-Dec-Pratt-test4-out5.azr'##hu0junk-out.azr'  #Specify the name of 18the input .azr file
 working_azr_file = input_azr_file[:-4]+'-chi2test.azr' #Specify the name of the output .azr file
-param_out_path_file = "./output/parameters.out" #Path to parameters.out
-normalization_out_path_file = './output/normalizations.out' #Path to normalizations.out
-chi2_out_path_file = './output/chiSquared.out' #Path to chiSquared.out
 
 AZURE_EXECUTABLE_FULL_PATH = "/home/sud/Desktop/NuclearPhysics/Azure/AZURE2/build/AZURE2"
 
@@ -50,595 +89,216 @@ AZURE_EXECUTABLE_FULL_PATH = "/home/sud/Desktop/NuclearPhysics/Azure/AZURE2/buil
 save_copy_of_azr_files = True
 save_chiSquared_out_files = True
 
-'''
-Function and Dictionary definitions:
-'''
-def read_proper_units(valuestr, unitstr):
-    '''
-    A dictionary to convert energies in multiple units to eV
-    '''
-    units_dict = {'meV':1e-3,'eV':1,'keV':1e3,'MeV':1e6,'GeV':1e9}
-    for key in list(units_dict.keys()):
-        if key in unitstr:
-            multiplier = np.float(units_dict[key])
-            return np.float(valuestr)*multiplier #value in eV!
-
-def xml_maker(infile,outfile):
-    '''
-    xml_maker(string infile, string outfile):
-
-    Function to convert .azr files to proper readable .xml files by prefixing and suffixing the appropriate XML tag
-    '''
-    f = open(infile,"r")
-    fo = open(outfile,"w")
-
-    lines = f.readlines()
-    head1 = "<firstElement>\n"
-    foot1 = "</firstElement>"
-
-    fo.write(head1)
-
-    for line in lines:
-        fo.write(line)
+#Number of AZURE2 runs kept in flight at once. With 1, the scan runs serially in ./output/ as before.
+#With more, each worker gets its own working .azr, output/ and temp files under scratch_folder.
+NUM_PARALLEL_WORKERS = 1
+scratch_folder = './chi2scan_workers'
+
+#Every finished grid point is appended to chisquared-output.dat right away, and logged in the checkpoint.
+#Run the script with --resume to carry on with an interrupted scan, skipping the points already done.
+results_file = 'chisquared-output.dat'
+results_array_file = 'chisquared-output.npy' #Same results as a structured array, plus the per-segment chi2/N
+
+#SCAN_MODE = 'grid' runs the full (p1,p2,..) grid. SCAN_MODE = 'adaptive' treats the entered # of steps as a coarse grid,
+#and halves the spacing ADAPTIVE_LEVELS times, but only in cells holding the minimum or crossing chi2_min + ADAPTIVE_DELTA_CHI2.
+#SCAN_MODE = 'sobol' or 'lhs' spends a budget of NUM_SAMPLES points on a Sobol sequence or a Latin hypercube over the entered ranges.
+SCAN_MODE = 'grid'
+ADAPTIVE_LEVELS = 3
+ADAPTIVE_DELTA_CHI2 = 2.30 #68.3% contour for two parameters
+NUM_SAMPLES = 256 #Powers of two keep a Sobol sample balanced
+SAMPLING_SEED = 0
+
+#SCAN_MODE = 'minimize' looks for the chi2 minimum inside the entered ranges instead of mapping them, starting from the
+#values in the input .azr. MINIMIZER_METHOD is 'nelder-mead' (any number of parameters) or 'golden' (one parameter).
+#It stops when the parameters agree to MINIMIZER_XTOL (fraction of each range) and chi2 to MINIMIZER_FTOL,
+#or after MINIMIZER_MAX_EVALS AZURE2 runs. Every evaluation is logged to chisquared-output.dat.
+MINIMIZER_METHOD = 'nelder-mead'
+MINIMIZER_XTOL = 1e-3
+MINIMIZER_FTOL = 1e-2
+MINIMIZER_MAX_EVALS = 100
+
+#WARM_START = True starts the fit at each point from the fitted levels and normalizations of the point before it
+#(parameters.out, normalizations.out), instead of from the input .azr. The grid is walked in serpentine order and sampled
+#points in nearest-neighbour order, so consecutive points are close. The walk is cut into NUM_PARALLEL_WORKERS
+#pieces that run side by side, each starting cold. Not used in adaptive mode.
+WARM_START = False
+
+#ARCHIVE_SNAPSHOTS = True stores parameters.out and param.sav as deltas against the first point instead of one full copy
+#per point (chi2search_folder/snapshots/). Rebuild one with e.g.
+#  from azrtools.snapshots import open_snapshots
+#  open_snapshots('./chi2search_folder')['parameters.out'].extract(12, 'parameters-12.out')
+ARCHIVE_SNAPSHOTS = False
+
+#ARCHIVE_CURVES = True parses every AZUREOut_aa=*_R=*.out of a point into chi2search_folder/curves/ (one binary file
+#and an index by point, aa and R) instead of keeping a text copy of AZUREOut_aa=1_R=1.out. Read a curve back with e.g.
+#  from azrtools.azureout import open_curves
+#  open_curves('./chi2search_folder').read(12, aa=1, R=2, columns=[0, 3])
+ARCHIVE_CURVES = False
+
+#Folder of the AZURE2 result cache shared by all scans on this machine, e.g. os.path.expanduser('~/.cache/azrtools').
+#Grid points whose .azr (levels, segments, data files) and run mode were seen before are answered without running AZURE2.
+#None switches the cache off. Least recently used entries are dropped once it grows past AZURE_CACHE_MAX_MB.
+AZURE_CACHE_FOLDER = None
+AZURE_CACHE_MAX_MB = 2000
+checkpoint_file = './chi2scan-checkpoint.json'
+
+#An AZURE2 run taking more than AZURE_WALL_TIMEOUT seconds, or AZURE_CPU_TIMEOUT seconds of CPU (Linux), is killed
+#together with everything it started, and tried again up to AZURE_RETRIES times; a point that keeps failing is
+#listed in chi2search_folder/failed-points.txt and the scan moves on. None means no limit.
+#LEARN_AZURE_TIMEOUTS = True sets the limits, after the first few points, to 5x the 95th percentile of the times seen.
+AZURE_WALL_TIMEOUT = None
+AZURE_CPU_TIMEOUT = None
+AZURE_RETRIES = 1
+LEARN_AZURE_TIMEOUTS = False
+
+#Seconds spent in each phase of every point (CSV), with a summary table in <name>-summary.txt. None to switch it off.
+#--profile runs the script under cProfile and dumps the stats to PROFILE_STATS_FILE (view with pstats or snakeviz).
+TIMINGS_FILE = 'chi2scan-timings.csv'
+PROFILE_STATS_FILE = 'chi2scan-profile.prof'
+
+
+def main():
+    if '--spec' in sys.argv:
+        #Unattended: every spec file after --spec, one scan after the other
+        specs = []
+        for spec_file in sys.argv[sys.argv.index('--spec')+1:]:
+            specs += read_scan_specs(spec_file)
+        for spec in specs:
+            spec.setdefault('timings_file', TIMINGS_FILE)
+        statuses = run_scan_specs(specs, AZURE_EXECUTABLE_FULL_PATH)
+        for name, status in statuses:
+            print(name, ':', status)
+        if any(status in ('invalid', 'failed') for name, status in statuses):
+            sys.exit(1)
+        return
+
+    if '--save-spec' in sys.argv:
+        spec_file = sys.argv[sys.argv.index('--save-spec')+1]
+        write_scan_spec(scan_spec(ask_scan_definition(), AZURE_EXECUTABLE_FULL_PATH, num_workers=NUM_PARALLEL_WORKERS,
+                                  save_out_files=save_chiSquared_out_files, save_azr_files=save_copy_of_azr_files,
+                                  cache_folder=AZURE_CACHE_FOLDER, cache_max_mb=AZURE_CACHE_MAX_MB,
+                                  minimizer_method=MINIMIZER_METHOD, minimizer_xtol=MINIMIZER_XTOL,
+                                  minimizer_ftol=MINIMIZER_FTOL, minimizer_max_evals=MINIMIZER_MAX_EVALS,
+                                  wall_timeout=AZURE_WALL_TIMEOUT, cpu_timeout=AZURE_CPU_TIMEOUT, retries=AZURE_RETRIES,
+                                  learn_timeouts=LEARN_AZURE_TIMEOUTS, timings_file=TIMINGS_FILE), spec_file)
+        print('Scan spec written to', spec_file)
+        return
+
+    if '--submit' in sys.argv:
+        #Cut the scan into tasks in a shared queue directory, from a spec file or from the prompts
+        args = sys.argv[sys.argv.index('--submit')+1:]
+        queue_dir = args[0]
+        if len(args) > 1:
+            #The spec's own directory, run settings and output files, as with --spec
+            spec = read_scan_specs(args[1])[0]
+            spec.setdefault('timings_file', TIMINGS_FILE)
+            numpoints = submit_scan_spec(spec, queue_dir)
+        else:
+            numpoints = submit_scan(ask_scan_definition(), queue_dir, wall_timeout=AZURE_WALL_TIMEOUT,
+                                    cpu_timeout=AZURE_CPU_TIMEOUT, retries=AZURE_RETRIES,
+                                    learn_timeouts=LEARN_AZURE_TIMEOUTS, timings_file=TIMINGS_FILE,
+                                    outputs={'results_file': results_file, 'results_array_file': results_array_file,
+                                             'chi2search_folder': "./chi2search_folder",
+                                             'save_out_files': save_chiSquared_out_files,
+                                             'save_azr_files': save_copy_of_azr_files})
+        print(numpoints, 'tasks queued in', queue_dir)
+        return
+
+    if '--worker' in sys.argv:
+        run_worker(sys.argv[sys.argv.index('--worker')+1], AZURE_EXECUTABLE_FULL_PATH, num_slots=NUM_PARALLEL_WORKERS,
+                   cache_folder=AZURE_CACHE_FOLDER, cache_max_mb=AZURE_CACHE_MAX_MB)
+        return
+
+    if '--collect' in sys.argv:
+        #Collected into the files the scan was submitted with
+        status = collect_results(sys.argv[sys.argv.index('--collect')+1], wait='--wait' in sys.argv)
+        print(status['collected'], 'of', status['total'], 'points collected,', status['failed'], 'failed,',
+              status['pending'], 'pending,', status['claimed'], 'running.')
+        return
+
+    if '--resume' in sys.argv:
+        #Pick up the scan definition of the interrupted run instead of asking for it again
+        definition, done_indices = load_scan_definition(checkpoint_file)
+        print('Resuming',definition['scan_mode'],'scan of',definition['input_azr_file'],':',len(done_indices),'points already done.')
+    else:
+        definition = ask_scan_definition()
+        done_indices = None
 
-    fo.write(foot1)
+    run_scan(definition, AZURE_EXECUTABLE_FULL_PATH, done_indices, checkpoint_file,
+             num_workers=NUM_PARALLEL_WORKERS, scratch_folder=scratch_folder, chi2search_folder="./chi2search_folder",
+             results_file=results_file, results_array_file=results_array_file,
+             save_out_files=save_chiSquared_out_files, save_azr_files=save_copy_of_azr_files,
+             cache_folder=AZURE_CACHE_FOLDER, cache_max_mb=AZURE_CACHE_MAX_MB,
+             minimizer_method=MINIMIZER_METHOD, minimizer_xtol=MINIMIZER_XTOL, minimizer_ftol=MINIMIZER_FTOL,
+             minimizer_max_evals=MINIMIZER_MAX_EVALS, wall_timeout=AZURE_WALL_TIMEOUT, cpu_timeout=AZURE_CPU_TIMEOUT,
+             retries=AZURE_RETRIES, learn_timeouts=LEARN_AZURE_TIMEOUTS, timings_file=TIMINGS_FILE)
 
-    f.close()
-    fo.close()
 
-def azr_maker(infile,outfile):
+def ask_scan_definition():
     '''
-    azr_maker(string infile, string outfile):
-
-    Function to convert .xml files to proper readable .azr files by getting rid of prefix/suffix tag in XML file
+    Act 1: Read through the input azr file, find the energy, non-zero width parameters that have been allowed to vary according to the 'tick' marks.
     '''
-    f = open(infile,"r")
-    fo = open(outfile,"w")
-
-    lines = f.readlines()
-    for line in lines[1:-1]:
-        fo.write(line)
-
-    f.close()
-    fo.close()
-
-
-#Dictionary mapping the contents of one line of 'levels' by category
-levelDict = {'J-channel':0,
-             'Pi-channel':1,
-            'ExcEnergyChannelMeV':2,
-             'FixE?':3,
-             'UnknownFlag':4,
-             'ParticlePair#':5,
-             '2S':6,
-             '2L':7,
-             'ChannelIndex':8,
-             'IncludeLevel?':9,
-             'FixWidth?':10,
-             'WidthChanneleV':11,
-             'J-light':12,
-             'Pi-light':13,
-             'J-heavy':14,
-             'Pi-heavy':15,
-             'ExcEnergyInputMeV':16,
-             'A-Light':17,
-             'A-Heavy':18,
-             'Z-light':19,
-             'Z-Heavy':20,
-             'UnknownSeparationEnergyMeV':21,
-             'ParticlePair#SeparationEnergyMeV':22,
-             'Unknown#1':23,
-             'Unknown#1':24,
-             'Unknown#1':25,
-             'Unknown#1':26,
-             'ChannelRadiusfm':27,
-             'Unknown#1':28,
-             'Unknown#1':29,
-             'Unknown#1':30
-             }
-
-#Two dictionaries to use with segment data
-#Dictionary to use when segments have angle-integrated,differential,or angle-integrated-total-capture data
-segmentDict1 = {'Include?':0,
-                'EntrancePair':1,
-                'ExitPair':2,#Becomes -1 when DataType=3. 
-                'LowLabEnergyMeV':3,
-                'HighLabEnergyMeV':4,
-                'LowLabAngleDeg':5,#Automatically goes to 0 for DataType=0,3
-                'HighLabAngleDeg':6,#Automatically goes to 180 for DataType=0,3
-                'DataType':7,#0 - Angle Integrated, 1 - Differential, 3- Angle Integrated Total Capture
-                'Normalization':8,
-                'VaryNorm?':9,
-                'NormError%':10,
-                'DataFilePath':11
-                }
-
-#Dictionary to use when segments have phase-shift data, 
-segmentDict2 = {'Include?':0,
-                'EntrancePair':1,
-                'ExitPair':2,#Becomes -1 when DataType=3. 
-                'LowLabEnergyMeV':3,
-                'HighLabEnergyMeV':4,
-                'LowLabAngleDeg':5,#Automatically goes to 0 for DataType=0,3
-                'HighLabAngleDeg':6,#Automatically goes to 180 for DataType=0,3
-                'DataType':7,#2 - Phase-shift
-                'J':8,
-                'l':9,
-                'Normalization':10,
-                'VaryNorm?':11,
-                'NormError%':12,
-                'DataFilePath':13
-                }
-
+    print('Parsing input .azr file and level data..', end=' ')
+    #Load the levels once into a table with hashed (E,J,pi) and (E,J,pi,L,S) indexes, see azrtools/leveltable.py
+    table = LevelTable(read_azr(input_azr_file).find('levels').text)
+    print('')
+
+    print('List of all found parameters:')
+    print("FixE?\tE(MeV)\tFixW?\tW(eV)\tJ\tPi\tL\tS")
+    listing = [table.columns[name].tolist() for name in ('FixE?','ExcEnergyChannelMeV','FixWidth?','WidthChanneleV','J-channel','Pi-channel','L','S')]
+    for FixE, Engy, FixW, Widthu, J_azr, Pi_azr, Ell_azr, Ess_azr in zip(*listing):
+        print(int(FixE), '\t', Engy, '\t', int(FixW), '\t', Widthu, '\t', J_azr,'\t', Pi_azr,'\t', Ell_azr,'\t', Ess_azr)
+
+    #Energy groups (E, J, pi, # of sublevels) and channel widths (E, J, pi, L, S, W) of the included levels, numbered from 1.
+    #Zero width states are not going to be touched by azure whether or not they're varied. Still include them in the list for completeness
+    Evarylist, Widthvarylist = parameter_catalog(table)
+    for ID, level in Evarylist:
+        print('Level: ',level)
+    print(len(Evarylist), ' energies varied.')
+    print(len(Widthvarylist), ' widths are varied.')
+
+    print('Energies varied\n(ID,(Energy, J, pi)):')
+    for E1 in Evarylist:
+        print(E1)
+    print('Widths varied\n(ID,(Energy,J,Pi,L,S,Width)):')
+    for W1 in Widthvarylist:
+        print(W1)
+
+    thingstovary_withrange = ask_parameters(Evarylist, Widthvarylist)
+    if len(thingstovary_withrange)==0:
+        print('Enter the right indices and try again, exiting..')
+        sys.exit()
+    print(thingstovary_withrange)
+
+    print('About to vary '+str(len(thingstovary_withrange))+' parameters to study chi2 dependence..')
+    for thing in thingstovary_withrange:
+        if len(thing[1])==4:
+            print('Energy ',thing[1][0],' MeV will be varied in ',thing[2][2],' steps from ',thing[2][0],' to ',thing[2][1],' ..')
+        elif len(thing[1])==6:
+            print('Width ',thing[1][5],' keV will be varied in ',thing[2][2],' steps from ',thing[2][0],' to ',thing[2][1],' ..')
 
-'''
-Act 1: Read through the input azr file, find the energy, non-zero width parameters that have been allowed to vary according to the 'tick' marks. 
-'''
-print('Converting input .azr file to .xml and parsing level data..', end=' ')
-#Make XML file from azure by suffixing and prefixing a category
-xml_maker(input_azr_file,"temp-in.xml")
-
-#Parse the XML file, get root tree, levels, and segmentDetails(for norm)
-doc = ET.parse("temp-in.xml")
-root = doc.getroot()
-memoryElem = doc.find('levels') #Levels
-SegmentDetails = doc.find('segmentsData') #Segments for Normalization
-
-#Copy all levels first, from parameters.out --> alllevellist_param
-levels =  memoryElem.text
-testlevels = levels.split('\n') #Separate each level details into an array of level-details
-outlevels = ''
-print('')
-Evarycount = 0
-Evarylist = []
-
-Widthvarycount = 0
-Widthvarylist = []
-
-NumChannelsAtEvalue = 1
-Engy_prev = np.nan
-J_prev = np.nan
-Pi_prev = np.nan
-FixE_prev = np.nan
-
-i = 0
-
-print('List of all found parameters:')
-print("FixE?\tE(MeV)\tFixW?\tW(eV)\tJ\tPi\tL\tS")
-
-Includelevel_prev=0
-
-paramoutcounter = 0
-for testlevel in testlevels:
-    #Study one level at a time
-    if len(testlevel)>0:
-        #If level details are present
-        levelarray = testlevel.split() #Split level details into an array at each space separator. This ordered array will contain all the 0-30 elements numbered in levelDict
-
-        #From the parameters.out, the level dictionary is ('J','pi','Energy','Width','s,'l'), remember!
-        #Extract j-pi, L, S values from both databases
-        J_azr = np.float(levelarray[levelDict['J-channel']])
-        #J_pout = np.float((alllevellist_param[paramoutcounter])[0])
-        Pi_azr = np.float(levelarray[levelDict['Pi-channel']])
-        #Pi_pout = np.float((alllevellist_param[paramoutcounter])[1])
-        Ell_azr = np.float(levelarray[levelDict['2L']])/2.0
-        #Ell_pout = np.float((alllevellist_param[paramoutcounter])[5])
-        Ess_azr = np.float(levelarray[levelDict['2S']])/2.0
-        #Ess_pout = np.float((alllevellist_param[paramoutcounter])[4])
-
-        Includelevel = np.int(levelarray[levelDict['IncludeLevel?']])
-        FixE = np.int(levelarray[levelDict['FixE?']])
-        FixW = np.int(levelarray[levelDict['FixWidth?']])
-        Engy = np.float(levelarray[levelDict['ExcEnergyChannelMeV']])
-        Widthu = np.float(levelarray[levelDict['WidthChanneleV']])
-
-        #print (Engy_prev,Engy),
-        if Engy_prev == Engy and J_prev == J_azr and Pi_prev == Pi_azr and FixE_prev == FixE:
-            NumChannelsAtEvalue = NumChannelsAtEvalue + 1
-        elif Engy_prev != np.nan:
-            NumE = NumChannelsAtEvalue + 1
-            #print 'Group',NumE,' levels above'
-            NumChannelsAtEvalue = 0
-            if ((Engy_prev,J_prev,Pi_prev,NumE) not in Evarylist) and (Includelevel_prev==1):
-                Evarycount = Evarycount + 1
-                Evarylist.append((Engy_prev,J_prev,Pi_prev,NumE))
-                print('Level: ',(Engy_prev,J_prev,Pi_prev,NumE))
-
-        Includelevel_prev = Includelevel
-        FixE_prev = FixE
-        Engy_prev = Engy
-        J_prev = J_azr
-        Pi_prev = Pi_azr
-            
-        #Zero width states are not going to be touched by azure whether or not they're varied. Still include them in the list for completeness
-        #if (FixW==0) and ((Engy,J_azr,Pi_azr,Ell_azr,Ess_azr,Widthu) not in Widthvarylist) and (Includelevel==1):
-        if ((Engy,J_azr,Pi_azr,Ell_azr,Ess_azr,Widthu) not in Widthvarylist) and (Includelevel==1):
-            Widthvarycount = Widthvarycount + 1
-            Widthvarylist.append((Engy,J_azr,Pi_azr,Ell_azr,Ess_azr,Widthu))
-
-        print(FixE, '\t', Engy, '\t', FixW, '\t', Widthu, '\t', J_azr,'\t', Pi_azr,'\t', Ell_azr,'\t', Ess_azr)
-        
+    '''
+    Act 2 : Values of each varied parameter on the grid. When the energy and a width of the same state are both varied,
+    the width's sublevel follows the energy (see azrtools/levelpatch.py). The working .azr is copied from the input file
+    and the calculations run by run_scan.
+    '''
+    definition = new_scan_definition(input_azr_file, thingstovary_withrange, working_azr_file, SCAN_MODE,
+                                     ADAPTIVE_LEVELS, ADAPTIVE_DELTA_CHI2, NUM_SAMPLES, SAMPLING_SEED,
+                                     WARM_START, ARCHIVE_SNAPSHOTS, ARCHIVE_CURVES)
+    for paramarray in definition['paramarrays']:
+        print(paramarray)
+    if SCAN_MODE in ('sobol','lhs'):
+        print(SCAN_MODE,'sampling of',NUM_SAMPLES,'points over these ranges (the # of steps is not used).')
+    elif SCAN_MODE == 'minimize':
+        print('Minimizing chi2 with',MINIMIZER_METHOD,'inside these ranges (the # of steps is not used).')
+
+    input("press key to continue..")
+    return definition
+
+
+if __name__ == '__main__':
+    if '--profile' in sys.argv:
+        run_profiled(PROFILE_STATS_FILE, main)
+        print_profile(PROFILE_STATS_FILE)
     else:
-        continue
-
-print(Evarycount, ' energies varied.')
-print(Widthvarycount, ' widths are varied.')
-
-ctr = 1
-print('Energies varied\n(ID,(Energy, J, pi)):')
-for E1 in Evarylist:
-    #print ctr,'\t',E1
-    Evarylist[ctr-1] = (ctr,Evarylist[ctr-1])
-    print(Evarylist[ctr-1])
-    ctr = ctr + 1
-
-print('Widths varied\n(ID,(Energy,J,Pi,L,S,Width)):')
-for W1 in Widthvarylist:
-    #print ctr,'\t',W1
-    Widthvarylist[ctr-1-Evarycount] = (ctr,Widthvarylist[ctr-1-Evarycount])
-    print(Widthvarylist[ctr-1-Evarycount])
-    ctr = ctr + 1
-
-#print Evarylist
-#print Widthvarylist
-
-#stringtomyself1 = 'Just identify the ID of the parameter to vary. Leave it to the user what he varies. It could be energy/width, it could be width/width. Just accept two IDs'
-#stringtomyself2 = ' systematically. For energies, make a list of matching segments for each index, all of which will be replaced during each iteration. Widths its just one segment'
-#print stringtomyself1+stringtomyself2
-
-
-idstovary = []
-
-#while 1:
-#print 'How many parameters to vary? (1 or 2):'
-#numparam = raw_input('How many parameters to vary? (1 or 2):')
-#numparam = int(numparam)
-#if numparam not in [1,2]:
-#    numparam = 1
-
-numparam = 2
-print('I can vary upto two parameters at a time..')
-ctr = 0
-while ctr < int(numparam):
-    id1 = input('Enter ID of param number '+str(ctr+1)+' :')
-    idstovary.append(int(id1))
-    ctr = ctr + 1
-
-print(idstovary)
-thingstovary = []
-
-for ID in idstovary:
-    if(ID-1 < len(Evarylist)):
-        a = Evarylist[ID-1][0]
-        if a == ID:
-            thingstovary.append(Evarylist[ID-1])
-            print('Energy found:',Evarylist[ID-1])
-
-    print(ID)
-    print(len(Evarylist))
-    print(ID-Evarycount)
-    print(len(Widthvarylist))
-    if abs(ID-1-Evarycount)<len(Widthvarylist):
-        b = Widthvarylist[ID-Evarycount-1][0]
-        if b== ID:
-            thingstovary.append(Widthvarylist[ID-Evarycount-1])
-            print('Width found:',Widthvarylist[ID-Evarycount-1])
-
-if len(thingstovary)==0:
-    print('Enter the right indices and try again, exiting..')
-    exit()
-
-thingstovary_withrange = []
-
-for thing in thingstovary:
-    if len(thing[1]) == 4:
-        lowE = input('Varying energy at '+str(thing[1])+', enter low value:')
-        lowE = float(lowE)
-        highE = input('Varying energy at '+str(thing[1])+', enter high value:')
-        highE = float(highE)
-        NstepsE = input('Varying energy at '+str(thing[1])+', enter # of steps:')
-        NstepsE = int(NstepsE)
-        if(lowE>highE) or (NstepsE<=0):
-            print('Erroneous range.. choosing default values..', end=' ')
-            lowE = thing[1][1] - 0.1*thing[1][1]
-            highE = thing[1][1] + 0.1*thing[1][1]
-            NstepsE = 10
-            print(' lowE:',lowE,' highE:',highE,' NstepsE:',NstepsE)
-        
-        thing = (thing[0],thing[1],(lowE,highE,NstepsE),"Energy")
-        thingstovary_withrange.append(thing)
-        
-    elif len(thing[1]) == 6:
-        lowW = input('Varying width at '+str(thing[1])+', enter low value:')
-        lowW = float(lowW)
-        highW = float(input('Varying width at '+str(thing[1])+', enter high value:'))
-        highW = float(highW)
-        NstepsW = int(input('Varying width at '+str(thing[1])+', enter # of steps:'))
-        NstepsW = int(NstepsW)
-        if(lowW>highW) or (NstepsW<=0):
-            print('Erroneous range.. choosing default values..', end=' ')
-            lowW = thing[1][5] - 0.1*thing[1][5]
-            highW = thing[1][5] + 0.1*thing[1][5]
-            NstepsW = 10
-            print(' lowW:',lowW,' highW:',highW,' NstepsW:',NstepsW)
-        
-        
-        thing = (thing[0],thing[1],(lowW,highW,NstepsW),"Width")
-        thingstovary_withrange.append(thing)
-
-print(thingstovary_withrange[0],thingstovary_withrange[1])
-
-'''
-#Find out if we're varying energy and width of the same level
-HAVE_COMMON_ENERGIES = False
-if thingstovary_withrange[0][1][0] == thingstovary_withrange[1][1][0] :
-    HAVE_COMMON_ENERGIES = True
-'''
-#exit()
-#print thingstovary
-print(thingstovary_withrange)
-
-del thingstovary
-
-print('About to vary '+str(len(thingstovary_withrange))+' parameters to study chi2 dependence..')
-for thing in thingstovary_withrange:
-    if len(thing[1])==4:
-        print('Energy ',thing[1][0],' MeV will be varied in ',thing[2][2],' steps from ',thing[2][0],' to ',thing[2][1],' ..')
-    elif len(thing[1])==6:
-        print('Width ',thing[1][5],' keV will be varied in ',thing[2][2],' steps from ',thing[2][0],' to ',thing[2][1],' ..')
-#exit()
-
-'''
-Act 2 : Generate the working .azr file by copying input file.
-'''
-print('Preparing working file at ',working_azr_file,' ...')
-os.system("cp "+input_azr_file+" "+working_azr_file)
-print('done.')
-
-os.system("mkdir chi2search_folder")
-
-'''
-Act 3 : Take the workig .azr file and run calculations in a while loop
-'''
-#Hold the tuple and a description like 'Width' or 'Energy'
-working_param1 = list(thingstovary_withrange[0][1])
-working_param2 = list(thingstovary_withrange[1][1])
-
-energies_are_equal = False
-
-if(working_param2[0] == working_param1[0]):
-    energies_are_equal = True
-    print('Same E for level and width.')
-               
-
-#print working_param1
-#print working_param2
-
-#exit()
-
-param1array = np.linspace(thingstovary_withrange[0][2][0],thingstovary_withrange[0][2][1],thingstovary_withrange[0][2][2])
-param2array = np.linspace(thingstovary_withrange[1][2][0],thingstovary_withrange[1][2][1],thingstovary_withrange[1][2][2])
-
-print(param1array, ' ', end=' ')
-print(param2array)
-
-input("press key to continue..")
-
-#Output list holding (p1,p2,chisquared)
-chisqlist = []
-index = 0
-for p1 in param1array:
-    for p2 in param2array:
-
-
-        #Make XML file from working azure file by suffixing and prefixing a category
-        xml_maker(working_azr_file,"temp-in.xml")
-
-        #Parse the XML file, get root tree, levels, and segmentDetails(for norm)
-        doc = ET.parse("temp-in.xml")
-        root = doc.getroot()
-        memoryElem = doc.find('levels') #Levels
-        SegmentDetails = doc.find('segmentsData') #Segments for Normalization
-        #Copy all levels first, from parameters.out --> alllevellist_param
-        levels =  memoryElem.text
-        testlevels = levels.split('\n') #Separate each level details into an array of level-details
-        outlevels = ''
-
-        print('Parameters in present iteration:',p1,' ',p2)
-        Ectr1 = 0
-        Ectr2 = 0
-        #print working_param1,' ',working_param2
-        
-        i = 0
-        paramoutcounter = 0
-        for testlevel in testlevels:
-            #Study one level at a time
-            if len(testlevel)>0:
-                #If level details are present
-                levelarray = testlevel.split() #Split level details into an array at each space separator. This ordered array will contain all the 0-30 elements numbered in levelDict
-
-                #From the parameters.out, the level dictionary is ('J','pi','Energy','Width','s,'l'), remember!
-                #Extract E,W, j-pi, L, S values from both databases
-                E_azr = np.float(levelarray[levelDict['ExcEnergyChannelMeV']])
-                W_azr = np.float(levelarray[levelDict['WidthChanneleV']])
-                
-                J_azr = np.float(levelarray[levelDict['J-channel']])
-                #J_pout = np.float((alllevellist_param[paramoutcounter])[0])
-                Pi_azr = np.float(levelarray[levelDict['Pi-channel']])
-                #Pi_pout = np.float((alllevellist_param[paramoutcounter])[1])
-                Ell_azr = np.float(levelarray[levelDict['2L']])/2.0
-                #Ell_pout = np.float((alllevellist_param[paramoutcounter])[5])
-                Ess_azr = np.float(levelarray[levelDict['2S']])/2.0
-                #Ess_pout = np.float((alllevellist_param[paramoutcounter])[4])
-
-                FixE = np.int(levelarray[levelDict['FixE?']])
-                FixW = np.int(levelarray[levelDict['FixWidth?']])
-                    
-             
-                if(len(working_param2)==4):
-                    if (E_azr == working_param2[0]) and (J_azr == working_param2[1]) and (Pi_azr == working_param2[2]):#(FixE==0) and
-                        levelarray[levelDict['ExcEnergyChannelMeV']]=str(p2)
-                        Ectr2 = Ectr2+1 #Count the number of sublevels edited
-
-                        #print 'Ctr:',Ectr2
-                        #print 'Lim:',working_param2[3]
-
-                        #Replace energy only the right number of times, count just the right number of sublevels needed.
-                        if Ectr2 == working_param2[3]: #working_paramx[3] holds the number of sublevels at the same energy
-                            working_param2[0] = p2
-                            Ectr2 = 0.0                        
-                
-                
-                if(len(working_param1)==4):
-                    if (E_azr == working_param1[0]) and (J_azr == working_param1[1]) and (Pi_azr == working_param1[2]): #(FixE==0) and 
-                        levelarray[levelDict['ExcEnergyChannelMeV']]=str(p1)
-                        Ectr1 = Ectr1+1 #Count the number of sublevels edited
-                        #print 'Ctr:',Ectr1
-                        #print 'Lim:',working_param1[3]
-
-
-                        #Replace energy only the right number of times, count just the right number of sublevels needed. 
-                        if Ectr1 == working_param1[3]: #working_paramx[3] holds the number of sublevels at the same energy
-                            working_param1[0] = p1
-                            Ectr1 = 0.0
-
-                        
-                if(len(working_param1)==6):
-                    #'''
-                    if(E_azr == working_param1[0]) and (J_azr == working_param1[1]) and (Pi_azr == working_param1[2]) and (Ell_azr == working_param1[3]) and (Ess_azr == working_param1[4]) and (W_azr == working_param1[5]):
-                        levelarray[levelDict['WidthChanneleV']]=str(p1)
-                        working_param1[5] = p1
-                    
-                        if energies_are_equal: #Then working_param2 would have the energy we need
-                            levelarray[levelDict['ExcEnergyChannelMeV']]=str(p2)
-                            working_param1[0] = p2
-                    '''#Update version 0.2 below
-                    if(E_azr == working_param1[0]) and (J_azr == working_param1[1]) and (Pi_azr == working_param1[2]):
-                        if energies_are_equal: #Then working_param2 would have the energy we need
-                            levelarray[levelDict['ExcEnergyChannelMeV']]=str(p2)
-                            working_param1[0] = p2
-                        if (FixW==0) and (Ell_azr == working_param1[3]) and (Ess_azr == working_param1[4]) and (W_azr == working_param1[5]):
-                            levelarray[levelDict['WidthChanneleV']]=str(p1)
-                            working_param1[5] = p1
-                    #'''    
-                    
-                if(len(working_param2)==6):
-                    #'''
-                    if(E_azr == working_param2[0]) and (J_azr == working_param2[1]) and (Pi_azr == working_param2[2]) and (Ell_azr == working_param2[3]) and (Ess_azr == working_param2[4]) and (W_azr == working_param2[5]):
-                        levelarray[levelDict['WidthChanneleV']]=str(p2)
-                        working_param2[5] = p2
-
-                        if energies_are_equal: #Then working_param1 would have the energy we need
-                            levelarray[levelDict['ExcEnergyChannelMeV']]=str(p1)
-                            working_param2[0] = p1
-                    '''#Update version 0.2 below
-                    if (E_azr == working_param2[0]) and (J_azr == working_param2[1]) and (Pi_azr == working_param2[2]):
-                        if energies_are_equal: #Then working_param2 would have the energy we need
-                            levelarray[levelDict['ExcEnergyChannelMeV']]=str(p1)
-                            working_param2[0] = p1
-                            #print p2, working_param2[5], W_azr
-                        if(FixW==0) and (Ell_azr == working_param2[3]) and (Ess_azr == working_param2[4]) and (W_azr == working_param2[5]):
-                            levelarray[levelDict['WidthChanneleV']]=str(p2)
-                            working_param2[5] = p2
-                    '''
-                        
-                #print working_param1,' ',working_param2
-                #For energies, match E, J and pi.
-                #For widths, match E, J, pi, L, S, W
-                
-                '''
-                #When the parameters match, copy E, G values from .out file to .azr file
-                if((J_azr == J_pout) and (Pi_azr==Pi_pout) and (Ell_azr == Ell_pout) and (Ess_azr == Ess_pout)):
-                    levelarray[levelDict['ExcEnergyChannelMeV']]=str(np.float((alllevellist_param[paramoutcounter])[2]))
-                    levelarray[levelDict['WidthChanneleV']]=str(np.float((alllevellist_param[paramoutcounter])[3]))
-                    paramoutcounter = paramoutcounter+1
-                '''
-                #Convert levelarray back to string
-                outlevel = '\n'
-                for string in levelarray:
-                    outlevel += '   '
-                    outlevel += string
-
-                #Stich things together to a large string separated by newlines
-                outlevels += outlevel
-                
-            else:
-                continue
-
-
-        outlevels += '\n'
-
-        #Locate the address of the levels string within the root XML file
-        #This would be an array of one element.
-        levelloc = root.xpath("//firstElement/levels")
-        levelloc[0].text = outlevels #Replace the element by the new string we've synthesized
-
-
-        ET.ElementTree(root).write('temp-out.xml') #Write the edited tree to a new XML file.
-
-        '''
-        Act 3 : Read in the new XML file, and generate the updated working .azr file by stripping its ends.
-        '''
-        print('Writing output azr file..', end=' ')
-        azr_maker("temp-out.xml",working_azr_file)
-        print('done.')
-
-        
-        #Act 4: Run Azure with updated parameters, generate chiSquared.out
-        child = px.spawn(str(AZURE_EXECUTABLE_FULL_PATH)+" "+working_azr_file+" --no-gui",timeout=None)
-        #child.logfile = sys.stdout
-        child.expect(".*azure2:")
-        child.sendline("2")
-        child.expect(".*new file")
-        child.sendline("")
-        child.expect("Thanks for using AZURE2.")
-        #child.expect(px.EOF)
-        time.sleep(1.5)
-        child.close()
-        #if child.isalive(): 
-            
-
-
-        #Read-in chiSquared.out and extract the chiSquared value
-        print('Reading chiSquared.out to find chi2 data..')
-        
-        try:
-            f = open(chi2_out_path_file,"r+")
-            lines = f.readlines()
-            #print lines
-            for line in lines[1:-1]:
-                array = line.split()
-                #print array
-                #Array output would look like
-                #['Segment', '#2', 'Chi-Squared/N:', '76.383']
-                #['Total', 'Chi-Squared:', '6339.79']
-                #We need the second element in every second line
-                chisqlist.append((index,p1,p2,float(array[2])))
-                print("p1:",p1,"  p2:",p2,"  chi2:",float(array[2]))
-        finally:
-            f.close()
-        print('done.\n')
-        
-        if save_chiSquared_out_files:
-            os.system("cp ./output/chiSquared.out ./chi2search_folder/chiSquared-"+str(index)+".out")
-            os.system("cp ./output/param.sav ./chi2search_folder/param-"+str(index)+".sav")
-            os.system("cp ./output/param.par ./chi2search_folder/param-"+str(index)+".par")
-            os.system("cp ./output/normalizations.out ./chi2search_folder/normalizations-"+str(index)+".out")
-            os.system("cp ./output/AZUREOut_aa=1_R=1.out ./chi2search_folder/AZUREOut_aa=1_R=1-"+str(index)+".out")
-            os.system("cp ./output/parameters.out ./chi2search_folder/parameters-"+str(index)+".out")
-
-        if save_copy_of_azr_files:
-            os.system("cp "+working_azr_file+" ./chi2search_folder/"+working_azr_file[:-4]+"-"+str(index)+".azr")
-        index = index + 1
-        #exit()
-
-np.savetxt("chisquared-output.dat",chisqlist,fmt="%1.4f")
-
-'''
-Epilogue:
-
-The levels and segments in both .azr files and .out files are sorted. This is what makes the loops doing the
-replacements funny. In case a future update of azure decides to not order the levels, nested loops may be needed.
-
-'''
-
+        main()
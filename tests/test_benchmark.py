@@ -0,0 +1,40 @@
+'''
+The small benchmarks, end to end, on the AZURE2 stand-in: every scenario runs, and the scan finds the chi2 minimum
+the stand-in is built around (see azrtools/standin.py).
+'''
+
+import os
+
+import numpy as np
+
+from azrtools.benchmark import SCENARIOS, run_benchmarks
+from azrtools.resultarray import load_results
+from azrtools.standin import model_chi2, read_model, true_energy, true_width
+from azrtools.synthetic import synthetic_azr
+
+
+def test_standin_minimum(tmp_path):
+    #At the true values every segment has Chi-Squared/N = 1, away from them more
+    azr_file = synthetic_azr(str(tmp_path / 'truth.azr'), offset=0.0)
+    levels, segments, output_dir = read_model(azr_file)
+    assert [value for number, value, points in model_chi2(levels, segments)] == [1.0]*len(segments)
+    for line in levels:
+        if line['level'] == 0:
+            line['E'] += 0.01
+    assert all(value > 1.0 for number, value, points in model_chi2(levels, segments))
+
+
+def test_small_benchmarks(tmp_path):
+    records = run_benchmarks(str(tmp_path), SCENARIOS, ('small',), repeats=1, scan_steps=3, scan_workers=2)
+    assert [(record['scenario'], record['size']) for record in records] == [(name, 'small') for name in SCENARIOS]
+    assert all(record['seconds'] > 0 for record in records)
+    scan = records[0]
+    assert scan['items'] == 9 and scan['azure_mean'] is not None
+
+    #The scan of the first energy and width runs from 0.9 to 1.1 times their synthetic values (1.1 times the
+    #truth), so its lowest chi2 is at the lower end of both, the grid point closest to the truth
+    array, metadata = load_results(os.path.join(str(tmp_path), 'scan-small', 'chisquared-output.npy'))
+    assert len(array) == 9 and np.all(np.isfinite(array['chi2']))
+    best = array[np.argmin(array['chi2'])]
+    assert np.isclose(best['p1'], 0.99*true_energy(0))
+    assert np.isclose(best['p2'], 0.99*true_width(0, 0))